@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+import database as db
+
+class AttachmentCache:
+    """Reusable Messenger attachment ids for image URLs
+
+    The first send of an image uploads it once through the Attachment
+    Upload API (is_reusable) and stores the returned attachment_id in the
+    attachment_cache table; later sends reference the id so Facebook does
+    not re-fetch the URL. Concurrent first sends share one upload.
+    """
+
+    def __init__(self, upload: Callable[[str], Awaitable[str]]):
+        self.upload = upload
+        self._ids: Dict[str, str] = {}
+        self._uploads: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.uploads = 0
+
+    async def attachment_id(self, image_url: str) -> Optional[str]:
+        """Cached (or freshly uploaded) attachment id, None if the upload failed"""
+        attachment_id = self._ids.get(image_url)
+        if attachment_id:
+            self.hits += 1
+            return attachment_id
+
+        pending = self._uploads.get(image_url)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._uploads[image_url] = future
+        try:
+            attachment_id = await self._load_or_upload(image_url)
+            future.set_result(attachment_id)
+            return attachment_id
+        except BaseException:
+            future.set_result(None)
+            raise
+        finally:
+            del self._uploads[image_url]
+
+    async def _load_or_upload(self, image_url: str) -> Optional[str]:
+        cached = await db.find_one("attachment_cache", {"image_url": image_url})
+        if cached:
+            self.hits += 1
+            self._ids[image_url] = cached["attachment_id"]
+            return cached["attachment_id"]
+
+        try:
+            attachment_id = await self.upload(image_url)
+        except Exception as e:
+            logging.warning(f"Attachment upload failed for {image_url}: {e}")
+            return None
+        self.uploads += 1
+        self._ids[image_url] = attachment_id
+        await db.insert_if_absent("attachment_cache", {
+            "image_url": image_url,
+            "attachment_id": attachment_id,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        })
+        return attachment_id
+
+    async def invalidate(self, image_urls: Iterable[str]):
+        """Forget the ids of images that were replaced or whose id stopped working"""
+        for image_url in set(image_urls):
+            self._ids.pop(image_url, None)
+            await db.delete_one("attachment_cache", {"image_url": image_url})
+
+    def stats(self) -> dict:
+        return {"cached": len(self._ids), "hits": self.hits, "uploads": self.uploads}
@@ -0,0 +1,4 @@
+"""Load-test harness: stub upstreams, a webhook traffic generator and reports
+
+Run from backend/: python -m bench.run --help
+"""
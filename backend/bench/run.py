@@ -0,0 +1,327 @@
+"""Replay signed webhook traffic from many concurrent customers against server:app
+
+Starts the Graph and Groq stubs in-process, the backend as a uvicorn
+subprocess pointed at them (with its own throwaway database), then runs
+scripted conversations and reports turn latency percentiles, throughput
+and database growth. Example:
+
+    python -m bench.run --customers 50 --turns 5 --out baseline.json
+    python -m bench.run --customers 50 --turns 5 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import httpx
+import uvicorn
+from bench import stubs
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+APP_SECRET = "bench-app-secret"
+ADMIN_PASSWORD = "bench-admin"
+
+PRODUCTS = [
+    {"name": "Kurta", "price": 1299, "regular_price": 1799, "aliases": ["kurtha", "कुर्ता"]},
+    {"name": "Denim Jacket", "price": 2499, "aliases": ["jacket"]},
+    {"name": "Hoodie", "price": 1599, "aliases": ["hudi"]},
+    {"name": "Cargo Pants", "price": 1899, "aliases": ["cargo"]},
+    {"name": "Kurti", "price": 999, "aliases": ["कुर्ती"]},
+    {"name": "T-Shirt", "price": 699, "aliases": ["tshirt", "t shirt"]},
+]
+
+# Conversation scripts; {product} is replaced per customer
+SCRIPTS = [
+    ["Hello", "{product} kati ho?", "M size chha?", "delivery charge kati?", "ok order garchu"],
+    ["hi dai", "{product} ko photo pathaunu na", "color kun kun chha?", "discount milcha?", "thik chha"],
+    ["namaste", "{product} available chha?", "price?", "pokhara ma delivery kati din lagcha?", "return garna milcha?"],
+    ["{product} chaiyo", "L size", "kati ho last price?", "ktm delivery charge?", "naam Ram, 9800000000, Baneshwor"],
+]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else None,
+        "max": max(values) if values else None,
+    }
+
+class ReplyTracker:
+    """Messages the Graph stub accepted, queued per recipient"""
+
+    def __init__(self):
+        self._queues: Dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self.sends = 0
+
+    def on_message(self, recipient_id: str, body: Dict[str, Any]):
+        self.sends += 1
+        self._queues[recipient_id].put_nowait(body)
+
+    def clear(self, recipient_id: str):
+        queue = self._queues[recipient_id]
+        while not queue.empty():
+            queue.get_nowait()
+
+    async def first_text(self, recipient_id: str):
+        queue = self._queues[recipient_id]
+        while True:
+            body = await queue.get()
+            if "text" in (body.get("message") or {}):
+                return body
+
+class Results:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.acks: List[float] = []
+        self.timeouts = 0
+        self.rejected = 0
+
+async def serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server
+
+def start_backend(port: int, env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env={**os.environ, **env}
+    )
+
+async def wait_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode}")
+        try:
+            if (await client.get("/api/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Backend did not start in time")
+
+def signed_webhook(customer_id: str, text: str, seq: int) -> Dict[str, Any]:
+    now_ms = int(time.time() * 1000)
+    body = json.dumps({
+        "object": "page",
+        "entry": [{
+            "id": "bench-page",
+            "time": now_ms,
+            "messaging": [{
+                "sender": {"id": customer_id},
+                "recipient": {"id": "bench-page"},
+                "timestamp": now_ms,
+                "message": {"mid": f"m_{customer_id}_{seq}_{now_ms}", "text": text}
+            }]
+        }]
+    }).encode("utf-8")
+    signature = hmac.new(APP_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return {"content": body, "headers": {"Content-Type": "application/json", "X-Hub-Signature-256": f"sha256={signature}"}}
+
+async def seed_products(client: httpx.AsyncClient):
+    token = (await client.post("/api/auth/login", json={"password": ADMIN_PASSWORD})).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for i, product in enumerate(PRODUCTS):
+        await client.post("/api/admin/products", headers=headers, json={
+            **product,
+            "colors": ["Red", "Blue", "Black"],
+            "sizes": ["S", "M", "L", "XL"],
+            "stock": 50,
+            "images": [f"https://images.example.com/product-{i}.jpg"],
+        })
+
+async def run_customer(client: httpx.AsyncClient, tracker: ReplyTracker, customer_id: str,
+                       args: argparse.Namespace, results: Results):
+    script = random.choice(SCRIPTS)
+    product = random.choice(PRODUCTS)["name"]
+    for seq in range(args.turns):
+        text = script[seq % len(script)].format(product=product)
+        tracker.clear(customer_id)
+        started = time.perf_counter()
+        response = await client.post("/api/webhook", **signed_webhook(customer_id, text, seq))
+        results.acks.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            results.rejected += 1
+            continue
+        try:
+            await asyncio.wait_for(tracker.first_text(customer_id), timeout=args.reply_timeout)
+            results.latencies.append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            results.timeouts += 1
+        await asyncio.sleep(random.uniform(args.think_min, args.think_max))
+
+def db_size(path: Path) -> int:
+    """Logical database size in bytes (pages in use, including frames still in the WAL)"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+    return (page_count - freelist) * page_size
+
+def stage_means(metrics_text: str) -> Dict[str, float]:
+    """Mean seconds per turn stage from the backend's /metrics"""
+    sums, counts = {}, {}
+    for name, stage, value in re.findall(r'salesbot_turn_stage_seconds_(sum|count)\{stage="(\w+)"\} (\S+)', metrics_text):
+        (sums if name == "sum" else counts)[stage] = float(value)
+    return {stage: sums[stage] / counts[stage] for stage in sums if counts.get(stage)}
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="salesbot-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    db_path = workdir / "bench.db"
+    for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        path.unlink(missing_ok=True)
+
+    tracker = ReplyTracker()
+    graph = await serve(stubs.graph_app(args.graph_latency, args.graph_latency / 3, args.graph_error_rate,
+                                        tracker.on_message), args.graph_port)
+    groq = await serve(stubs.groq_app(args.groq_latency, args.groq_latency / 3, args.groq_token_delay,
+                                      args.groq_error_rate), args.groq_port)
+
+    env = {
+        "DATABASE_PATH": str(db_path),
+        "GRAPH_API_BASE_URL": f"http://127.0.0.1:{args.graph_port}",
+        "GROQ_API_BASE_URL": f"http://127.0.0.1:{args.groq_port}",
+        "FACEBOOK_PAGE_ACCESS_TOKEN": "bench-page-token",
+        "FACEBOOK_APP_SECRET": APP_SECRET,
+        "GROQ_API_KEY": "bench-groq-key",
+        "ADMIN_PASSWORD": ADMIN_PASSWORD,
+        "IMAGE_STORAGE": "local",
+        "IMAGE_DIR": str(workdir / "uploads"),
+        "OUTBOX_BASE_DELAY": "0.2",
+    }
+    env.update(dict(item.split("=", 1) for item in args.env))
+    process = start_backend(args.port, env)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=30,
+                                     limits=httpx.Limits(max_connections=args.customers)) as client:
+            await wait_ready(client, process)
+            await seed_products(client)
+            start_bytes = db_size(db_path)
+
+            results = Results()
+            started = time.perf_counter()
+            tasks = []
+            for i in range(args.customers):
+                customer_id = f"bench-{i}"
+                tasks.append(asyncio.create_task(run_customer(client, tracker, customer_id, args, results)))
+                await asyncio.sleep(args.ramp / args.customers)
+            await asyncio.gather(*tasks)
+            duration = time.perf_counter() - started
+
+            metrics_text = (await client.get("/metrics")).text
+            end_bytes = db_size(db_path)
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        graph.should_exit = True
+        groq.should_exit = True
+        await asyncio.sleep(0.2)
+
+    turns = len(results.latencies)
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("out", "baseline", "workdir")},
+        "turns": turns,
+        "timeouts": results.timeouts,
+        "rejected": results.rejected,
+        "duration_seconds": duration,
+        "messages_per_second": (turns + results.timeouts) / duration if duration else 0,
+        "turn_latency_seconds": summarize(results.latencies),
+        "webhook_ack_seconds": summarize(results.acks),
+        "graph_sends": tracker.sends,
+        "stage_mean_seconds": stage_means(metrics_text),
+        "db": {
+            "start_bytes": start_bytes,
+            "end_bytes": end_bytes,
+            "growth_bytes": end_bytes - start_bytes,
+            "bytes_per_turn": (end_bytes - start_bytes) / turns if turns else None,
+        },
+    }
+
+def _fmt(value: Optional[float], unit: str = "s") -> str:
+    if value is None:
+        return "-"
+    return f"{value * 1000:.1f} ms" if unit == "s" else f"{value:,.1f}"
+
+def _delta(current: Optional[float], baseline: Optional[float]) -> str:
+    if current is None or not baseline:
+        return ""
+    return f"  ({(current - baseline) / baseline * 100:+.1f}% vs baseline)"
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    base_latency = (baseline or {}).get("turn_latency_seconds", {})
+    latency = report["turn_latency_seconds"]
+    print(f"turns: {report['turns']}  timeouts: {report['timeouts']}  rejected: {report['rejected']}  "
+          f"duration: {report['duration_seconds']:.1f}s")
+    for key in ("p50", "p95", "p99", "mean", "max"):
+        print(f"turn latency {key:>4}: {_fmt(latency[key]):>10}{_delta(latency[key], base_latency.get(key))}")
+    print(f"webhook ack p99:   {_fmt(report['webhook_ack_seconds']['p99']):>10}")
+    print(f"messages/s:        {report['messages_per_second']:>10.2f}"
+          f"{_delta(report['messages_per_second'], (baseline or {}).get('messages_per_second'))}")
+    for stage, mean in report["stage_mean_seconds"].items():
+        print(f"stage {stage:<12} {_fmt(mean):>10} mean")
+    db = report["db"]
+    print(f"db growth:         {db['growth_bytes'] / 1024:>10.1f} KiB ({_fmt(db['bytes_per_turn'], 'b')} bytes/turn)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=20, help="concurrent customers")
+    parser.add_argument("--turns", type=int, default=5, help="messages per customer")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which customers start")
+    parser.add_argument("--think-min", type=float, default=0.5, help="min pause between a reply and the next message")
+    parser.add_argument("--think-max", type=float, default=2.0, help="max pause between a reply and the next message")
+    parser.add_argument("--reply-timeout", type=float, default=30.0, help="seconds to wait for a reply")
+    parser.add_argument("--graph-latency", type=float, default=0.08, help="mean Graph API latency (s)")
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument("--groq-latency", type=float, default=0.35, help="mean time to first token (s)")
+    parser.add_argument("--groq-token-delay", type=float, default=0.01, help="delay between streamed words (s)")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8801, help="backend port")
+    parser.add_argument("--graph-port", type=int, default=8802)
+    parser.add_argument("--groq-port", type=int, default=8803)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra backend environment, e.g. --env COALESCE_WINDOW_SECONDS=0.5")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for scripts and stub behaviour")
+    parser.add_argument("--workdir", help="directory for the bench database (default: a temp dir)")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_report(report, baseline)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Local stand-ins for graph.facebook.com and the Groq chat completions API"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Any, Callable, Dict, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLIES = [
+    "Namaste hajur! Hamro sabai product ekdum quality ko chha. Hajur lai kun design man paryo?",
+    "Hajur, yo Kurta ekdum popular chha, aile offer ma Rs. 1299 matra! Kun size chaahiyo hajur?",
+    "Hajur, M ra L size available chha. Color ma Red, Blue ra Black chha. Kun color man parcha?",
+    "Hajur, Kathmandu Valley bhitra delivery charge Rs. 100 matra ho, bahira Rs. 200 lagchha.",
+    "Dhanyabad hajur! Order confirm garna hajur ko naam, phone number ra address pathaunu hola.",
+]
+
+def _delay(latency: float, jitter: float) -> float:
+    return max(0.0, random.gauss(latency, jitter))
+
+def graph_app(latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0,
+              on_message: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> FastAPI:
+    """Send API and Attachment Upload API stub
+
+    A share of requests (error_rate) fails, half with the throttling code
+    613 and half with a 500, so the outbox retry path is exercised.
+    on_message(recipient_id, body) is called for every accepted send.
+    """
+    app = FastAPI()
+    ids = itertools.count(1)
+
+    def _error() -> Optional[JSONResponse]:
+        if random.random() >= error_rate:
+            return None
+        if random.random() < 0.5:
+            return JSONResponse({"error": {"message": "Calls to this api have exceeded the rate limit.",
+                                           "type": "OAuthException", "code": 613}}, status_code=400)
+        return JSONResponse({"error": {"message": "An unexpected error has occurred.", "code": 2}}, status_code=500)
+
+    @app.post("/me/messages")
+    async def send_message(request: Request):
+        body = await request.json()
+        await asyncio.sleep(_delay(latency, jitter))
+        error = _error()
+        if error is not None:
+            return error
+        recipient_id = body["recipient"]["id"]
+        if on_message is not None:
+            on_message(recipient_id, body)
+        return {"recipient_id": recipient_id, "message_id": f"m_{next(ids)}"}
+
+    @app.post("/me/message_attachments")
+    async def upload_attachment(request: Request):
+        await request.body()
+        await asyncio.sleep(_delay(latency * 4, jitter))
+        error = _error()
+        if error is not None:
+            return error
+        return {"attachment_id": str(next(ids))}
+
+    return app
+
+def groq_app(latency: float = 0.3, jitter: float = 0.1, token_delay: float = 0.01,
+             error_rate: float = 0.0, drop_after_words: int = 0) -> FastAPI:
+    """Chat completions stub, streaming (SSE) or not
+
+    latency is the time to the first token; streamed replies then arrive
+    one word every token_delay. Failures are 429s (with Retry-After) and 503s.
+    With drop_after_words set, streams end with an error event after that
+    many words.
+    """
+    app = FastAPI()
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await asyncio.sleep(_delay(latency, jitter))
+        if random.random() < error_rate:
+            status = random.choice([429, 503])
+            headers = {"retry-after": "1"} if status == 429 else None
+            return JSONResponse({"error": {"message": "stub failure", "type": "server_error"}}, status_code=status,
+                                headers=headers)
+
+        reply = random.choice(REPLIES)
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(reply) // 4}
+        if not body.get("stream"):
+            await asyncio.sleep(token_delay * len(reply.split()))
+            return {
+                "id": f"chatcmpl-{time.time_ns()}",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events():
+            for i, word in enumerate(reply.split(" ")):
+                if drop_after_words and i == drop_after_words:
+                    yield f"data: {json.dumps({'error': {'message': 'stub stream failure', 'type': 'server_error'}})}\n\n"
+                    return
+                chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_delay)
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, NamedTuple
+
+class CatalogSnapshot(NamedTuple):
+    version: int
+    products: List[Any]
+    active: List[Any]
+    fingerprint: int
+    loaded_at: float
+
+class CatalogCache:
+    """Process-wide product catalog kept in memory
+
+    Admin writes call refresh(), which reloads the catalog and bumps the
+    version; readers always see one consistent snapshot. Snapshots older
+    than ttl_seconds are reloaded as a safety net for out-of-band edits, and
+    the version only moves when the catalog actually changed.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[List[Any]]], ttl_seconds: float = 300):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: CatalogSnapshot = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version if self._snapshot else 0
+
+    async def snapshot(self) -> CatalogSnapshot:
+        """Current snapshot, loading it on first use or when it is stale"""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl_seconds:
+            snapshot = await self._reload(force_bump=False, stale=snapshot)
+        return snapshot
+
+    async def products(self) -> List[Any]:
+        return (await self.snapshot()).products
+
+    async def active_products(self) -> List[Any]:
+        return (await self.snapshot()).active
+
+    async def refresh(self) -> CatalogSnapshot:
+        """Reload after an admin write and bump the version"""
+        return await self._reload(force_bump=True)
+
+    async def _reload(self, force_bump: bool, stale: CatalogSnapshot = None) -> CatalogSnapshot:
+        async with self._lock:
+            current = self._snapshot
+            # Another reader already reloaded while we waited for the lock
+            if not force_bump and current is not stale:
+                return current
+
+            products = await self.loader()
+            fingerprint = hash(tuple(p.model_dump_json() for p in products))
+            if current is None:
+                version = 1
+            elif force_bump or fingerprint != current.fingerprint:
+                version = current.version + 1
+            else:
+                version = current.version
+
+            self._snapshot = CatalogSnapshot(
+                version=version,
+                products=products,
+                active=[p for p in products if p.active],
+                fingerprint=fingerprint,
+                loaded_at=time.monotonic()
+            )
+            if current is not None and version != current.version:
+                logging.info(f"Product catalog reloaded (version {version}, {len(products)} products)")
+            return self._snapshot
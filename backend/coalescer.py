@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+class _CustomerActor:
+    def __init__(self):
+        self.pending: List[Tuple[float, str]] = []
+        self.arrived = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+class MessageCoalescer:
+    """Per-customer actors that serialize and debounce conversation turns
+
+    Messages for one customer are buffered until no new message arrives for
+    window_seconds (or max_wait_seconds passes) and then handed to the turn
+    handler as a single batch. Turns for the same customer never overlap;
+    different customers run in parallel up to max_concurrent_turns.
+    """
+
+    def __init__(self, handler: Callable[[str, List[str]], Awaitable[None]],
+                 window_seconds: float = 1.5, max_wait_seconds: float = 5.0,
+                 max_concurrent_turns: int = 8):
+        self.handler = handler
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._turn_slots = asyncio.Semaphore(max(1, max_concurrent_turns))
+        self._actors: Dict[str, _CustomerActor] = {}
+        self.messages_in = 0
+        self.turns = 0
+
+    @property
+    def active_customers(self) -> int:
+        return len(self._actors)
+
+    def submit(self, customer_id: str, text: str, timestamp: float = 0):
+        """Buffer a message for a customer, starting its actor if idle
+
+        Webhook workers may hand messages over out of order, so each batch is
+        sorted by the Messenger event timestamp before the turn runs.
+        """
+        actor = self._actors.get(customer_id)
+        if actor is None:
+            actor = self._actors[customer_id] = _CustomerActor()
+            actor.task = asyncio.create_task(self._run(customer_id, actor), name=f"customer-{customer_id}")
+        actor.pending.append((timestamp, text))
+        actor.arrived.set()
+        self.messages_in += 1
+
+    async def _debounce(self, actor: _CustomerActor):
+        deadline = time.monotonic() + self.max_wait_seconds
+        while True:
+            actor.arrived.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(actor.arrived.wait(), timeout=min(self.window_seconds, remaining))
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self, customer_id: str, actor: _CustomerActor):
+        try:
+            while actor.pending:
+                if self.window_seconds > 0:
+                    await self._debounce(actor)
+                batch = [text for _, text in sorted(actor.pending, key=lambda item: item[0])]
+                actor.pending = []
+                async with self._turn_slots:
+                    self.turns += 1
+                    try:
+                        await self.handler(customer_id, batch)
+                    except Exception as e:
+                        logging.exception(f"Turn for customer {customer_id} failed: {e}")
+        finally:
+            # Messages that arrived during the last turn were picked up by the loop
+            if self._actors.get(customer_id) is actor:
+                del self._actors[customer_id]
+
+    async def drain(self, timeout: float = 10.0):
+        """Wait for buffered turns to finish on shutdown"""
+        tasks = [actor.task for actor in self._actors.values() if actor.task]
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logging.warning(f"Cancelled {len(pending)} customer turns still running at shutdown")
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set
+import database as db
+from prompts import estimate_tokens
+from text_patterns import DEVANAGARI, DEVANAGARI_DIGITS, EDGE_AFTER, EDGE_BEFORE, words
+
+# Rule-based fact extraction plus LLM rolling summaries, so a long negotiation
+# keeps its important details while the prompt history stays bounded.
+
+DEFAULT_SIZES = ["XS", "S", "M", "L", "XL", "XXL", "XXXL"]
+_SIZE_WORD = r'(?:size|saiz|साइज)'
+
+_NUMBER_WORDS = {
+    "ek": 1, "euta": 1, "auta": 1, "एक": 1, "एउटा": 1,
+    "dui": 2, "duita": 2, "दुई": 2, "दुईवटा": 2,
+    "tin": 3, "tinta": 3, "तीन": 3, "तीनवटा": 3,
+    "char": 4, "charta": 4, "चार": 4, "चारवटा": 4,
+    "panch": 5, "paanch": 5, "पाँच": 5,
+}
+# Words that already carry the counter ("duita" = two pieces)
+_COUNTED_WORDS = {"euta", "auta", "एउटा", "duita", "दुईवटा", "tinta", "तीनवटा", "charta", "चारवटा"}
+_QUANTITY = re.compile(
+    EDGE_BEFORE + r'(\d{1,2}|' + '|'.join(sorted(_NUMBER_WORDS, key=len, reverse=True)) + r')\s*'
+    r'(ota|wota|wata|vata|ta|pcs|pc|pieces?|वटा|ओटा)?' + EDGE_AFTER, re.IGNORECASE)
+
+_AMOUNT = re.compile(r'(?:Rs\.?|रु\.?|NPR)\s*(\d[\d,]*)', re.IGNORECASE)
+_SENTENCE_END = re.compile(r'(?<![Rr]s)[.!?।\n]+')
+_DELIVERY_WORDS = words(r'delivery', r'shipping', r'डेलिभरी')
+_DEAL_WORDS = words(r'discount', r'each', r'per\s*piece', r'ek\s*ota\s*ko', r'final', r'last\s*price',
+                    r'ma\s*din(?:chhu|chu|chhau|chau)', r'छुट')
+
+# A word or initials ("R.K."); a dot after a whole word ends the sentence, not the name
+_NAME_WORD = r'(?:(?:[A-Za-z]\.){1,3}|[A-Za-z' + DEVANAGARI + r']+)'
+_NAME = re.compile(
+    r'(?:mero\s+naam|my\s+name\s+is|name\s*[:\-]|naam\s*[:\-]|full\s+name\s*[:\-]|मेरो\s+नाम|नाम\s*[:\-])\s*'
+    r'(' + _NAME_WORD + r'(?:[ \t]+(?!ho\b|हो)' + _NAME_WORD + r'){0,2})',
+    re.IGNORECASE)
+
+# "District: Kaski" style lines, the format the system prompt asks for
+_ADDRESS_FIELDS = {
+    "district": re.compile(r'(?:district|jilla|जिल्ला)\s*[:\-]\s*([^\n,]+)', re.IGNORECASE),
+    "municipality": re.compile(r'(?:municipality(?:\s*/\s*vdc)?|vdc|nagarpalika|gaunpalika|नगरपालिका|गाउँपालिका)\s*[:\-]\s*([^\n,]+)',
+                               re.IGNORECASE),
+    "ward_number": re.compile(r'(?:ward(?:\s*(?:no\.?|number))?|वडा(?:\s*नं\.?)?)\s*[:\-]?\s*(\d{1,2})', re.IGNORECASE),
+    "tole_area": re.compile(r'(?:tole(?:\s*/\s*area)?|area|टोल)\s*[:\-]\s*([^\n,]+)', re.IGNORECASE),
+}
+
+FACT_LABELS = {
+    "customer_name": "Name",
+    "product": "Product",
+    "color": "Color",
+    "size": "Size",
+    "quantity": "Quantity",
+    "negotiated_price": "Agreed price (Rs)",
+    "delivery_charge": "Delivery charge (Rs)",
+    "district": "District",
+    "municipality": "Municipality/VDC",
+    "ward_number": "Ward",
+    "tole_area": "Tole/Area",
+}
+
+def _one_of(options: Sequence[str], text: str) -> Optional[str]:
+    """The option mentioned last in text (as a whole word), in its catalog spelling"""
+    if not options:
+        return None
+    pattern = words(*(re.escape(option) for option in sorted(options, key=len, reverse=True)))
+    matches = pattern.findall(text)
+    if not matches:
+        return None
+    lowered = {option.lower(): option for option in options}
+    return lowered.get(matches[-1].lower(), matches[-1])
+
+def _size(sizes: Sequence[str], text: str) -> Optional[str]:
+    sizes = list(sizes) or DEFAULT_SIZES
+    alternatives = '|'.join(re.escape(size) for size in sorted(sizes, key=len, reverse=True))
+    stripped = text.strip(" .!?")
+    lowered = {size.lower(): size for size in sizes}
+    if stripped.lower() in lowered:
+        return lowered[stripped.lower()]
+    # Single letters like "M" only count next to a size word
+    match = re.search(_SIZE_WORD + r'\s*[:\-]?\s*(' + alternatives + ')' + EDGE_AFTER, text, re.IGNORECASE) or \
+        re.search(EDGE_BEFORE + '(' + alternatives + r')\s*(?:' + _SIZE_WORD + r'|wala|waala)', text, re.IGNORECASE)
+    return lowered.get(match.group(1).lower()) if match else None
+
+def _quantity(text: str) -> Optional[int]:
+    for match in _QUANTITY.finditer(text):
+        word, unit = match.group(1).lower(), match.group(2)
+        # Bare numbers are sizes, prices or phone digits more often than counts
+        if not unit and word not in _COUNTED_WORDS:
+            continue
+        quantity = int(word) if word.isdigit() else _NUMBER_WORDS[word]
+        if 0 < quantity <= 20:
+            return quantity
+    return None
+
+def _single_amount(text: str, words: re.Pattern, exclude: Optional[re.Pattern] = None) -> Optional[int]:
+    """The amount in sentences matching words, if they quote exactly one"""
+    amounts = set()
+    for sentence in _SENTENCE_END.split(text):
+        if words.search(sentence) and not (exclude and exclude.search(sentence)):
+            amounts.update(int(amount.replace(",", "")) for amount in _AMOUNT.findall(sentence))
+    return amounts.pop() if len(amounts) == 1 else None
+
+def extract_facts(facts: Dict[str, Any], text: str, sender: str, products_by_id: Dict[str, Any],
+                  product_ids: Sequence[str] = ()) -> Dict[str, Any]:
+    """Facts updated with what one message states (returns a new dict)
+
+    Customer messages give the product, color, size, quantity, name and
+    address; agent replies give the agreed price and delivery charge.
+    product_ids are the catalog products the message mentions.
+    """
+    facts = dict(facts)
+    text = text.translate(DEVANAGARI_DIGITS)
+    mentioned = [products_by_id[pid] for pid in product_ids if pid in products_by_id]
+
+    if sender == "agent":
+        if not facts.get("product") and len(mentioned) == 1:
+            facts["product"] = mentioned[0].name
+            facts["product_id"] = mentioned[0].product_id
+        delivery = _single_amount(text, _DELIVERY_WORDS)
+        if delivery is not None:
+            facts["delivery_charge"] = delivery
+        deal = _single_amount(text, _DEAL_WORDS, exclude=_DELIVERY_WORDS)
+        if deal is not None:
+            facts["negotiated_price"] = deal
+        return facts
+
+    if mentioned:
+        facts["product"] = mentioned[0].name
+        facts["product_id"] = mentioned[0].product_id
+    product = products_by_id.get(facts.get("product_id"))
+    colors = product.colors if product else sorted({c for p in products_by_id.values() for c in p.colors})
+    sizes = product.sizes if product else []
+
+    found = {
+        "color": _one_of(colors, text),
+        "size": _size(sizes, text),
+        "quantity": _quantity(text),
+    }
+    name = _NAME.search(text)
+    if name:
+        found["customer_name"] = name.group(1).strip(" .").title()
+    for field, pattern in _ADDRESS_FIELDS.items():
+        match = pattern.search(text)
+        if match:
+            found[field] = match.group(1).strip(" .")
+    facts.update({key: value for key, value in found.items() if value})
+    return facts
+
+def render_context(summary: str, facts: Dict[str, Any]) -> str:
+    """Summary and known details as a system message ("" when there are none)"""
+    parts = []
+    if summary:
+        parts.append(f"CONVERSATION SUMMARY (earlier messages):\n{summary}")
+    known = [f"- {label}: {facts[key]}" for key, label in FACT_LABELS.items() if facts.get(key) not in (None, "")]
+    if known:
+        parts.append("KNOWN DETAILS (already given, don't ask again):\n" + "\n".join(known))
+    return "\n\n".join(parts)
+
+class ConversationCompactor:
+    """Folds older messages into a rolling summary in the background
+
+    Once a conversation has more than message_threshold unsummarized
+    messages, or the ones in the prompt window pass token_threshold, every
+    message except the last keep_recent is summarized together with the
+    previous summary. The result goes to conversations.context as "summary"
+    and "summarized_through" (the last folded message seq); prompts then
+    carry the summary and only the messages after it.
+    """
+
+    def __init__(self, summarize: Callable[[str, List[Dict[str, Any]]], Awaitable[str]],
+                 message_threshold: int = 20, token_threshold: int = 1500, keep_recent: int = 6,
+                 max_messages: int = 200):
+        self.summarize = summarize
+        self.message_threshold = message_threshold
+        self.token_threshold = token_threshold
+        self.keep_recent = keep_recent
+        self.max_messages = max_messages
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.compactions = 0
+        self.failures = 0
+
+    def needs_compaction(self, context: Dict[str, Any], last_seq: int, window: Sequence[Any]) -> bool:
+        """Whether a conversation ending at last_seq should be compacted
+
+        window is the unsummarized history that goes into the prompt.
+        """
+        unsummarized = last_seq - context.get("summarized_through", 0)
+        if unsummarized <= self.keep_recent:
+            return False
+        window_tokens = sum(estimate_tokens(msg.text) for msg in window)
+        return unsummarized >= self.message_threshold or window_tokens > self.token_threshold
+
+    def schedule(self, conversation_id: str, context: Dict[str, Any], last_seq: int):
+        """Start a compaction unless one is already running for the conversation"""
+        if conversation_id in self._running:
+            return
+        self._running.add(conversation_id)
+        task = asyncio.create_task(self._compact(
+            conversation_id, context.get("summarized_through", 0), last_seq - self.keep_recent,
+            context.get("summary", "")
+        ))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _compact(self, conversation_id: str, after_seq: int, through_seq: int, summary: str):
+        try:
+            # Very long backlogs are folded max_messages at a time, oldest first
+            through_seq = min(through_seq, after_seq + self.max_messages)
+            messages = await db.messages_between(conversation_id, after_seq, through_seq)
+            if not messages:
+                return
+            new_summary = (await self.summarize(summary, messages)).strip()
+            if not new_summary:
+                raise ValueError("empty summary")
+            await db.merge_context(conversation_id, {
+                "summary": new_summary,
+                "summarized_through": messages[-1]["seq"]
+            })
+            self.compactions += 1
+        except Exception as e:
+            # The messages stay unsummarized and are retried after a later turn
+            self.failures += 1
+            logging.error(f"Compaction of conversation {conversation_id} failed: {e}")
+        finally:
+            self._running.discard(conversation_id)
+
+    async def drain(self, timeout: float = 10.0):
+        """Wait for running compactions on shutdown"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"running": len(self._running), "compactions": self.compactions, "failures": self.failures}
@@ -1,92 +1,481 @@
 import aiosqlite
+import asyncio
 import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
-DB_PATH = Path(__file__).parent / "urban_fashion.db"
+DB_PATH = Path(os.environ.get('DATABASE_PATH', Path(__file__).parent / "urban_fashion.db"))
+
+# Connection pool settings
+DEFAULT_POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-20000",  # ~20 MB page cache per connection
+    "PRAGMA mmap_size=268435456",  # 256 MB memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+]
+
+_pool: Optional[asyncio.Queue] = None
+_connections: List[aiosqlite.Connection] = []
+_pool_lock = asyncio.Lock()
+
+async def _connect() -> aiosqlite.Connection:
+    """Open one tuned connection for the pool"""
+    # sqlite3 keeps an LRU of compiled statements per connection, so reusing
+    # the same SQL text (see the query builders below) skips re-preparing it
+    conn = await aiosqlite.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = aiosqlite.Row
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
+    return conn
+
+async def open_pool(size: int = DEFAULT_POOL_SIZE):
+    """Open the long-lived connection pool (called on app startup)"""
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            return
+        pool = asyncio.Queue()
+        for _ in range(max(1, size)):
+            conn = await _connect()
+            _connections.append(conn)
+            pool.put_nowait(conn)
+        _pool = pool
+
+async def close_pool():
+    """Close every pooled connection (called on app shutdown)"""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            return
+        for conn in _connections:
+            await conn.close()
+        _connections.clear()
+        _pool = None
+
+def idle_connections() -> int:
+    """Pooled connections not currently borrowed"""
+    return _pool.qsize() if _pool is not None else 0
+
+@asynccontextmanager
+async def connection():
+    """Borrow a pooled connection, opening the pool on first use"""
+    if _pool is None:
+        await open_pool()
+    pool = _pool
+    conn = await pool.get()
+    try:
+        yield conn
+    except BaseException:
+        # Never hand a connection with a half-finished transaction back
+        if conn.in_transaction:
+            await conn.rollback()
+        raise
+    finally:
+        pool.put_nowait(conn)
+
+# Schema migrations. Each step runs once, in order, inside its own
+# transaction; applied versions are recorded in schema_version. Steps 1-4
+# are idempotent so databases created before the runner existed upgrade
+# cleanly.
+async def _create_base_tables(db: aiosqlite.Connection):
+    # Products table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            product_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            regular_price REAL,
+            description TEXT,
+            colors TEXT,
+            sizes TEXT,
+            stock INTEGER DEFAULT 0,
+            images TEXT,
+            active INTEGER DEFAULT 1,
+            created_at TEXT
+        )
+    """)
+    
+    # Conversations table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            conversation_id TEXT PRIMARY KEY,
+            customer_id TEXT NOT NULL,
+            messages TEXT,
+            stage TEXT DEFAULT 'greeting',
+            context TEXT,
+            last_updated TEXT,
+            has_media_pending INTEGER DEFAULT 0
+        )
+    """)
+    
+    # Orders table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id TEXT PRIMARY KEY,
+            customer_id TEXT,
+            customer_name TEXT,
+            phone_primary TEXT,
+            phone_alternative TEXT,
+            district TEXT,
+            municipality TEXT,
+            ward_number TEXT,
+            tole_area TEXT,
+            items TEXT,
+            subtotal REAL,
+            delivery_charge REAL,
+            total_amount REAL,
+            payment_method TEXT,
+            payment_screenshot TEXT,
+            status TEXT DEFAULT 'pending',
+            has_media_pending INTEGER DEFAULT 0,
+            created_at TEXT
+        )
+    """)
+    
+    # Payment QR table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS payment_qr (
+            qr_id TEXT PRIMARY KEY,
+            payment_method TEXT,
+            qr_image_url TEXT,
+            account_name TEXT,
+            active INTEGER DEFAULT 1
+        )
+    """)
+    
+    # Media notifications table
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS media_notifications (
+            notification_id TEXT PRIMARY KEY,
+            customer_id TEXT,
+            media_type TEXT,
+            media_url TEXT,
+            status TEXT DEFAULT 'pending',
+            admin_response TEXT,
+            created_at TEXT
+        )
+    """)
+
+async def _create_processed_messages(db: aiosqlite.Connection):
+    # Processed webhook message ids (delivery de-duplication)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS processed_messages (
+            mid TEXT PRIMARY KEY,
+            created_at REAL NOT NULL
+        )
+    """)
+
+async def _create_messages(db: aiosqlite.Connection):
+    # Conversation messages, one row per message (append-only)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            conversation_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            sender TEXT NOT NULL,
+            text TEXT,
+            timestamp TEXT,
+            product_ids TEXT,
+            PRIMARY KEY (conversation_id, seq)
+        ) WITHOUT ROWID
+    """)
+    await migrate_message_blobs(db)
+
+async def _add_product_aliases(db: aiosqlite.Connection):
+    await _ensure_column(db, "products", "aliases", "TEXT")
+
+async def _merge_duplicate_conversations(db: aiosqlite.Connection):
+    """Fold conversations sharing a customer_id into the most recently updated one
+
+    Messages are renumbered into the survivor in timestamp order, contexts
+    are merged (newer values win, one level deep for dicts such as facts)
+    and only the emptied duplicate rows are deleted, so no history is lost.
+    """
+    async with db.execute("""
+        SELECT conversation_id, customer_id, context, has_media_pending FROM conversations
+        WHERE customer_id IN (SELECT customer_id FROM conversations GROUP BY customer_id HAVING COUNT(*) > 1)
+        ORDER BY customer_id, COALESCE(last_updated, ''), conversation_id
+    """) as cursor:
+        rows = [dict(row) for row in await cursor.fetchall()]
+    by_customer: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_customer.setdefault(row["customer_id"], []).append(row)
+
+    for conversations in by_customer.values():
+        survivor = conversations[-1]["conversation_id"]
+        ids = [conversation["conversation_id"] for conversation in conversations]
+        placeholders = ','.join(['?' for _ in ids])
+        async with db.execute(
+            f"SELECT conversation_id, seq, sender, text, timestamp, product_ids FROM messages WHERE conversation_id IN ({placeholders})",
+            ids
+        ) as cursor:
+            messages = [dict(row) for row in await cursor.fetchall()]
+        messages.sort(key=lambda msg: (msg["timestamp"] or "", ids.index(msg["conversation_id"]), msg["seq"]))
+
+        context: Dict[str, Any] = {}
+        for conversation in conversations:
+            for key, value in deserialize_dict(conversation["context"]).items():
+                if isinstance(value, dict) and isinstance(context.get(key), dict):
+                    context[key] = {**context[key], **value}
+                else:
+                    context[key] = value
+
+        await db.execute(f"DELETE FROM messages WHERE conversation_id IN ({placeholders})", ids)
+        await db.executemany(
+            "INSERT INTO messages (conversation_id, seq, sender, text, timestamp, product_ids) VALUES (?, ?, ?, ?, ?, ?)",
+            [(survivor, seq, msg["sender"], msg["text"], msg["timestamp"], msg["product_ids"])
+             for seq, msg in enumerate(messages, start=1)]
+        )
+        await db.execute(
+            "UPDATE conversations SET context=?, has_media_pending=? WHERE conversation_id=?",
+            [serialize_dict(context), int(any(c["has_media_pending"] for c in conversations)), survivor]
+        )
+        duplicates = ids[:-1]
+        await db.execute(
+            f"DELETE FROM conversations WHERE conversation_id IN ({','.join(['?' for _ in duplicates])})", duplicates
+        )
+
+async def _create_hot_lookup_indexes(db: aiosqlite.Connection):
+    # Conversations are looked up by customer on every webhook turn. Merge
+    # duplicate rows left by concurrent first messages before making
+    # customer_id unique.
+    await _merge_duplicate_conversations(db)
+    await db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_conversations_customer_id ON conversations(customer_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_created_at ON orders(status, created_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer_id ON orders(customer_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_media_notifications_status ON media_notifications(status, created_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_processed_messages_created_at ON processed_messages(created_at)")
+
+# Daily order rollup, kept current by triggers on orders. Days are the UTC
+# date prefix of the ISO created_at timestamp.
+_ADD_ORDER_STATS = """
+    INSERT INTO daily_order_stats (day, status, orders, revenue)
+    SELECT substr(NEW.created_at, 1, 10), COALESCE(NEW.status, 'pending'), 1, COALESCE(NEW.total_amount, 0)
+    WHERE NEW.created_at IS NOT NULL
+    ON CONFLICT (day, status) DO UPDATE SET
+        orders = orders + 1,
+        revenue = revenue + excluded.revenue;
+"""
+
+_REMOVE_ORDER_STATS = """
+    UPDATE daily_order_stats SET
+        orders = orders - 1,
+        revenue = revenue - COALESCE(OLD.total_amount, 0)
+    WHERE day = substr(OLD.created_at, 1, 10) AND status = COALESCE(OLD.status, 'pending');
+"""
+
+async def _create_daily_order_stats(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS daily_order_stats (
+            day TEXT NOT NULL,
+            status TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status)
+        ) WITHOUT ROWID
+    """)
+    await _create_order_stats_triggers(db)
+    await _rebuild_daily_order_stats(db)
+
+async def _create_order_stats_triggers(db: aiosqlite.Connection):
+    # Orders without a created_at are left out of the rollup (as in the
+    # rebuild below) rather than failing the NOT NULL day and the order write
+    for trigger in ("insert", "delete", "update"):
+        await db.execute(f"DROP TRIGGER IF EXISTS trg_orders_stats_{trigger}")
+    await db.execute(f"""
+        CREATE TRIGGER trg_orders_stats_insert AFTER INSERT ON orders
+        WHEN NEW.created_at IS NOT NULL
+        BEGIN {_ADD_ORDER_STATS} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER trg_orders_stats_delete AFTER DELETE ON orders
+        BEGIN {_REMOVE_ORDER_STATS} END
+    """)
+    await db.execute(f"""
+        CREATE TRIGGER trg_orders_stats_update
+        AFTER UPDATE OF status, total_amount, created_at ON orders
+        BEGIN {_REMOVE_ORDER_STATS} {_ADD_ORDER_STATS} END
+    """)
+
+async def _rebuild_daily_order_stats(db: aiosqlite.Connection, missing_days_only: bool = False):
+    if not missing_days_only:
+        await db.execute("DELETE FROM daily_order_stats")
+    await db.execute(f"""
+        INSERT INTO daily_order_stats (day, status, orders, revenue)
+        SELECT substr(created_at, 1, 10) AS day, COALESCE(status, 'pending'), COUNT(*), COALESCE(SUM(total_amount), 0)
+        FROM orders
+        WHERE created_at IS NOT NULL
+          {"AND substr(created_at, 1, 10) NOT IN (SELECT DISTINCT day FROM daily_order_stats)" if missing_days_only else ""}
+        GROUP BY 1, 2
+    """)
+
+async def _create_orders_keyset_indexes(db: aiosqlite.Connection):
+    # The orders API pages on (created_at, order_id) with optional status or
+    # district filters; these indexes return each page in order without a sort
+    await db.execute("DROP INDEX IF EXISTS idx_orders_created_at")
+    await db.execute("DROP INDEX IF EXISTS idx_orders_status_created_at")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at_id ON orders(created_at, order_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_status_created_at_id ON orders(status, created_at, order_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_orders_district_created_at_id ON orders(district, created_at, order_id)")
+
+async def _create_outbox(db: aiosqlite.Connection):
+    # Outbound Messenger sends. Rows stay 'pending' until delivered, then
+    # become 'sent' (purged later) or 'dead' after the last failed attempt.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending_due ON outbox(next_attempt_at) WHERE status = 'pending'")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_recipient_pending ON outbox(recipient_id, outbox_id) WHERE status = 'pending'")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status_created_at ON outbox(status, created_at)")
+
+async def _add_outbox_batches(db: aiosqlite.Connection):
+    # Messages sharing a batch_id may be delivered in parallel with each other
+    await _ensure_column(db, "outbox", "batch_id", "TEXT")
+
+async def _create_attachment_cache(db: aiosqlite.Connection):
+    # Reusable Messenger attachment ids, one per uploaded image URL
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS attachment_cache (
+            image_url TEXT PRIMARY KEY,
+            attachment_id TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+async def _create_image_uploads(db: aiosqlite.Connection):
+    # Stored uploads by content hash, so re-uploading a file reuses its URLs
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS image_uploads (
+            sha256 TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            thumbnail_url TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_image_uploads_url ON image_uploads(url)")
+
+async def _create_stage_transitions(db: aiosqlite.Connection):
+    # Every stage change of a conversation; funnel metrics read these instead
+    # of rescanning messages. Existing conversations start at their current stage.
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS stage_transitions (
+            transition_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            customer_id TEXT,
+            from_stage TEXT,
+            to_stage TEXT NOT NULL,
+            at TEXT NOT NULL
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_stage_transitions_at ON stage_transitions(at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_stage_transitions_conversation ON stage_transitions(conversation_id, at)")
+    await db.execute("""
+        INSERT INTO stage_transitions (conversation_id, customer_id, from_stage, to_stage, at)
+        SELECT conversation_id, customer_id, NULL, COALESCE(stage, 'greeting'), COALESCE(last_updated, '')
+        FROM conversations
+    """)
+
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "processed webhook message ids", _create_processed_messages),
+    (3, "append-only messages table", _create_messages),
+    (4, "product aliases", _add_product_aliases),
+    (5, "indexes for hot lookups", _create_hot_lookup_indexes),
+    (6, "daily order stats rollup", _create_daily_order_stats),
+    (7, "orders keyset pagination indexes", _create_orders_keyset_indexes),
+    (8, "outbound message outbox", _create_outbox),
+    (9, "outbox parallel batches", _add_outbox_batches),
+    (10, "messenger attachment id cache", _create_attachment_cache),
+    (11, "image uploads by content hash", _create_image_uploads),
+    (12, "conversation stage transitions", _create_stage_transitions),
+    (13, "order stats triggers skip undated orders", _create_order_stats_triggers),
+]
+
+async def schema_version(db: aiosqlite.Connection) -> int:
+    """Highest applied migration version"""
+    async with db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version") as cursor:
+        return (await cursor.fetchone())[0]
 
 async def init_db():
-    """Initialize SQLite database with tables"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Products table
+    """Initialize SQLite database by applying pending schema migrations"""
+    async with connection() as db:
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                product_id TEXT PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
                 name TEXT NOT NULL,
-                price REAL NOT NULL,
-                regular_price REAL,
-                description TEXT,
-                colors TEXT,
-                sizes TEXT,
-                stock INTEGER DEFAULT 0,
-                images TEXT,
-                active INTEGER DEFAULT 1,
-                created_at TEXT
-            )
-        """)
-        
-        # Conversations table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS conversations (
-                conversation_id TEXT PRIMARY KEY,
-                customer_id TEXT NOT NULL,
-                messages TEXT,
-                stage TEXT DEFAULT 'greeting',
-                context TEXT,
-                last_updated TEXT,
-                has_media_pending INTEGER DEFAULT 0
+                applied_at TEXT NOT NULL
             )
         """)
+        await db.commit()
         
-        # Orders table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS orders (
-                order_id TEXT PRIMARY KEY,
-                customer_id TEXT,
-                customer_name TEXT,
-                phone_primary TEXT,
-                phone_alternative TEXT,
-                district TEXT,
-                municipality TEXT,
-                ward_number TEXT,
-                tole_area TEXT,
-                items TEXT,
-                subtotal REAL,
-                delivery_charge REAL,
-                total_amount REAL,
-                payment_method TEXT,
-                payment_screenshot TEXT,
-                status TEXT DEFAULT 'pending',
-                has_media_pending INTEGER DEFAULT 0,
-                created_at TEXT
-            )
-        """)
+        current = await schema_version(db)
+        for version, name, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            await db.execute("BEGIN")
+            try:
+                await migrate(db)
+                await db.execute(
+                    "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                    [version, name, datetime.now(timezone.utc).isoformat()]
+                )
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+            logging.info(f"Applied schema migration {version}: {name}")
         
-        # Payment QR table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS payment_qr (
-                qr_id TEXT PRIMARY KEY,
-                payment_method TEXT,
-                qr_image_url TEXT,
-                account_name TEXT,
-                active INTEGER DEFAULT 1
-            )
-        """)
-        
-        # Media notifications table
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS media_notifications (
-                notification_id TEXT PRIMARY KEY,
-                customer_id TEXT,
-                media_type TEXT,
-                media_url TEXT,
-                status TEXT DEFAULT 'pending',
-                admin_response TEXT,
-                created_at TEXT
+        await db.execute("PRAGMA optimize")
+
+async def _ensure_column(db: aiosqlite.Connection, table: str, column: str, declaration: str):
+    """Add a column to a table created by an older version of the schema"""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = [row["name"] for row in await cursor.fetchall()]
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+async def migrate_message_blobs(db: aiosqlite.Connection):
+    """Move legacy conversations.messages JSON blobs into the messages table"""
+    async with db.execute(
+        "SELECT conversation_id, messages FROM conversations WHERE messages IS NOT NULL AND messages NOT IN ('', '[]')"
+    ) as cursor:
+        rows = await cursor.fetchall()
+    
+    for row in rows:
+        conversation_id = row["conversation_id"]
+        async with db.execute("SELECT COUNT(*) FROM messages WHERE conversation_id=?", [conversation_id]) as cursor:
+            already_migrated = (await cursor.fetchone())[0] > 0
+        if not already_migrated:
+            await db.executemany(
+                "INSERT INTO messages (conversation_id, seq, sender, text, timestamp, product_ids) VALUES (?,?,?,?,?,?)",
+                [
+                    (conversation_id, seq, msg.get("sender", ""), msg.get("text", ""),
+                     msg.get("timestamp"), serialize_list(msg.get("product_ids", [])))
+                    for seq, msg in enumerate(deserialize_list(row["messages"]), start=1)
+                ]
             )
-        """)
-        
-        await db.commit()
+        await db.execute("UPDATE conversations SET messages='[]' WHERE conversation_id=?", [conversation_id])
 
 # Helper functions
 def serialize_list(data: List) -> str:
@@ -101,76 +490,153 @@ def serialize_dict(data: Dict) -> str:
 def deserialize_dict(data: str) -> Dict:
     return json.loads(data) if data else {}
 
+def merge_patch(old: Dict, new: Dict) -> Dict:
+    """JSON merge patch (RFC 7396) turning old into new, for merge_context"""
+    patch: Dict[str, Any] = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(old.get(key), dict):
+            nested = merge_patch(old[key], value)
+            if nested:
+                patch[key] = nested
+        elif old.get(key) != value or key not in old:
+            patch[key] = value
+    return patch
+
+@lru_cache(maxsize=512)
+def _where(keys: tuple) -> str:
+    return ' AND '.join([f"{k}=?" for k in keys])
+
+@lru_cache(maxsize=512)
+def _insert_sql(table: str, columns: tuple) -> str:
+    placeholders = ','.join(['?' for _ in columns])
+    return f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})"
+
+@lru_cache(maxsize=512)
+def _update_sql(table: str, set_keys: tuple, where_keys: tuple) -> str:
+    set_clause = ','.join([f"{k}=?" for k in set_keys])
+    return f"UPDATE {table} SET {set_clause} WHERE {_where(where_keys)}"
+
 async def insert_one(table: str, data: Dict[str, Any]):
     """Insert a document into a table"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        columns = list(data.keys())
-        placeholders = ','.join(['?' for _ in columns])
+    async with connection() as db:
+        columns = tuple(data.keys())
         values = [data[col] for col in columns]
         
-        query = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({placeholders})"
-        await db.execute(query, values)
+        await db.execute(_insert_sql(table, columns), values)
         await db.commit()
 
+async def insert_if_absent(table: str, data: Dict[str, Any]) -> bool:
+    """Insert a document unless its primary key exists, returns True if inserted"""
+    async with connection() as db:
+        columns = tuple(data.keys())
+        values = [data[col] for col in columns]
+        
+        query = _insert_sql(table, columns).replace("INSERT", "INSERT OR IGNORE", 1)
+        cursor = await db.execute(query, values)
+        await db.commit()
+        return cursor.rowcount == 1
+
 async def find_one(table: str, filter_dict: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Find one document"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        where_clause = ' AND '.join([f"{k}=?" for k in filter_dict.keys()])
+    async with connection() as db:
         values = list(filter_dict.values())
         
-        query = f"SELECT * FROM {table} WHERE {where_clause} LIMIT 1"
+        query = f"SELECT * FROM {table} WHERE {_where(tuple(filter_dict.keys()))} LIMIT 1"
         async with db.execute(query, values) as cursor:
             row = await cursor.fetchone()
             return dict(row) if row else None
 
-async def find_many(table: str, filter_dict: Dict[str, Any] = None, limit: int = 1000) -> List[Dict[str, Any]]:
-    """Find multiple documents"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        
-        if filter_dict:
-            where_clause = ' AND '.join([f"{k}=?" for k in filter_dict.keys()])
-            values = list(filter_dict.values())
-            query = f"SELECT * FROM {table} WHERE {where_clause} LIMIT {limit}"
-            async with db.execute(query, values) as cursor:
-                rows = await cursor.fetchall()
-        else:
-            query = f"SELECT * FROM {table} LIMIT {limit}"
-            async with db.execute(query) as cursor:
-                rows = await cursor.fetchall()
+# Mongo-style comparison operators accepted as filter values, e.g.
+# {"created_at": {"$gte": start, "$lt": end}, "status": {"$in": [...]}}
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+def _filter(filter_dict: Optional[Dict[str, Any]]) -> Tuple[List[str], List[Any]]:
+    """SQL conditions and values for a filter dict (plain values mean equality)"""
+    conditions: List[str] = []
+    values: List[Any] = []
+    for field, value in (filter_dict or {}).items():
+        if not isinstance(value, dict):
+            conditions.append(f"{field}=?")
+            values.append(value)
+            continue
+        for op, operand in value.items():
+            if op == "$in":
+                operand = list(operand)
+                if not operand:
+                    conditions.append("0")
+                    continue
+                conditions.append(f"{field} IN ({','.join(['?' for _ in operand])})")
+                values.extend(operand)
+            elif op in _OPERATORS:
+                conditions.append(f"{field}{_OPERATORS[op]}?")
+                values.append(operand)
+            else:
+                raise ValueError(f"Unsupported filter operator {op}")
+    return conditions, values
+
+def _keyset(sort: List[Tuple[str, int]], after: Tuple[Any, ...]) -> Tuple[str, List[Any]]:
+    """Condition selecting rows strictly after a cursor in sort order"""
+    if len(after) != len(sort):
+        raise ValueError("Cursor does not match the sort fields")
+    directions = {direction < 0 for _, direction in sort}
+    if len(directions) != 1:
+        raise ValueError("Keyset pagination needs every sort field in the same direction")
+    fields = ', '.join([field for field, _ in sort])
+    placeholders = ', '.join(['?' for _ in sort])
+    op = '<' if directions.pop() else '>'
+    return f"({fields}) {op} ({placeholders})", list(after)
+
+def _order_by(sort: Optional[List[Tuple[str, int]]]) -> str:
+    if not sort:
+        return ""
+    return " ORDER BY " + ", ".join([f"{field} {'DESC' if direction < 0 else 'ASC'}" for field, direction in sort])
+
+async def find_many(table: str, filter_dict: Dict[str, Any] = None, limit: int = 1000,
+                    sort: Optional[List[Tuple[str, int]]] = None,
+                    after: Optional[Tuple[Any, ...]] = None) -> List[Dict[str, Any]]:
+    """Find multiple documents
+
+    sort is [(field, 1 | -1), ...]; after is the sort-key tuple of the last
+    row of the previous page (keyset pagination), e.g. (created_at, order_id).
+    """
+    async with connection() as db:
+        conditions, values = _filter(filter_dict)
+        if after is not None:
+            keyset_condition, keyset_values = _keyset(sort or [], after)
+            conditions.append(keyset_condition)
+            values.extend(keyset_values)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT * FROM {table}{where}{_order_by(sort)} LIMIT ?"
+        async with db.execute(query, values + [limit]) as cursor:
+            rows = await cursor.fetchall()
         
         return [dict(row) for row in rows]
 
 async def update_one(table: str, filter_dict: Dict[str, Any], update_dict: Dict[str, Any]):
     """Update one document"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        set_clause = ','.join([f"{k}=?" for k in update_dict.keys()])
-        where_clause = ' AND '.join([f"{k}=?" for k in filter_dict.keys()])
+    async with connection() as db:
         values = list(update_dict.values()) + list(filter_dict.values())
         
-        query = f"UPDATE {table} SET {set_clause} WHERE {where_clause}"
+        query = _update_sql(table, tuple(update_dict.keys()), tuple(filter_dict.keys()))
         await db.execute(query, values)
         await db.commit()
 
 async def delete_one(table: str, filter_dict: Dict[str, Any]) -> int:
     """Delete one document, returns number of deleted rows"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        where_clause = ' AND '.join([f"{k}=?" for k in filter_dict.keys()])
+    async with connection() as db:
         values = list(filter_dict.values())
         
-        query = f"DELETE FROM {table} WHERE {where_clause}"
+        query = f"DELETE FROM {table} WHERE {_where(tuple(filter_dict.keys()))}"
         cursor = await db.execute(query, values)
         await db.commit()
         return cursor.rowcount
 
 async def count_documents(table: str, filter_dict: Dict[str, Any] = None) -> int:
     """Count documents"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connection() as db:
         if filter_dict:
-            where_clause = ' AND '.join([f"{k}=?" for k in filter_dict.keys()])
-            values = list(filter_dict.values())
-            query = f"SELECT COUNT(*) FROM {table} WHERE {where_clause}"
+            conditions, values = _filter(filter_dict)
+            query = f"SELECT COUNT(*) FROM {table} WHERE {' AND '.join(conditions)}"
             async with db.execute(query, values) as cursor:
                 result = await cursor.fetchone()
         else:
@@ -179,3 +645,164 @@ async def count_documents(table: str, filter_dict: Dict[str, Any] = None) -> int
                 result = await cursor.fetchone()
         
         return result[0] if result else 0
+
+async def delete_older_than(table: str, column: str, cutoff: Any, filter_dict: Dict[str, Any] = None) -> int:
+    """Delete documents whose column is below cutoff, returns number of deleted rows"""
+    async with connection() as db:
+        conditions, values = _filter(filter_dict)
+        conditions.append(f"{column} < ?")
+        cursor = await db.execute(f"DELETE FROM {table} WHERE {' AND '.join(conditions)}", values + [cutoff])
+        await db.commit()
+        return cursor.rowcount
+
+async def append_messages(conversation_id: str, messages: List[Dict[str, Any]]):
+    """Append messages to a conversation, numbering them after the last stored seq"""
+    async with connection() as db:
+        await db.executemany(
+            """INSERT INTO messages (conversation_id, seq, sender, text, timestamp, product_ids)
+               VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE conversation_id=?), ?, ?, ?, ?)""",
+            [
+                (conversation_id, conversation_id, msg["sender"], msg["text"],
+                 msg.get("timestamp"), serialize_list(msg.get("product_ids", [])))
+                for msg in messages
+            ]
+        )
+        await db.commit()
+
+async def recent_messages(conversation_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """Last N messages of a conversation, oldest first"""
+    async with connection() as db:
+        async with db.execute(
+            "SELECT seq, sender, text, timestamp, product_ids FROM messages WHERE conversation_id=? ORDER BY seq DESC LIMIT ?",
+            [conversation_id, limit]
+        ) as cursor:
+            rows = await cursor.fetchall()
+    
+    messages = []
+    for row in reversed(rows):
+        msg = dict(row)
+        msg["product_ids"] = deserialize_list(msg["product_ids"])
+        messages.append(msg)
+    return messages
+
+async def messages_between(conversation_id: str, after_seq: int, through_seq: int) -> List[Dict[str, Any]]:
+    """Messages with after_seq < seq <= through_seq, oldest first"""
+    async with connection() as db:
+        async with db.execute(
+            "SELECT seq, sender, text, timestamp FROM messages WHERE conversation_id=? AND seq > ? AND seq <= ? ORDER BY seq",
+            [conversation_id, after_seq, through_seq]
+        ) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+async def merge_context(conversation_id: str, patch: Dict[str, Any]):
+    """Merge keys into a conversation's context JSON in one statement
+
+    Writers that own different keys (the turn, background compaction) can't
+    overwrite each other's updates. A None value removes the key.
+    """
+    async with connection() as db:
+        await db.execute(
+            "UPDATE conversations SET context = json_patch(COALESCE(NULLIF(context, ''), '{}'), ?) WHERE conversation_id=?",
+            [serialize_dict(patch), conversation_id]
+        )
+        await db.commit()
+
+async def rebuild_daily_order_stats(missing_days_only: bool = False):
+    """Recompute the daily order rollup from orders (or only days it lacks)"""
+    async with connection() as db:
+        await db.execute("BEGIN")
+        await _rebuild_daily_order_stats(db, missing_days_only)
+        await db.commit()
+
+async def order_stats_since(day: str) -> Dict[str, Any]:
+    """Order count and revenue for all days >= day (YYYY-MM-DD)"""
+    async with connection() as db:
+        async with db.execute(
+            "SELECT COALESCE(SUM(orders), 0), COALESCE(SUM(revenue), 0) FROM daily_order_stats WHERE day >= ?",
+            [day]
+        ) as cursor:
+            orders, revenue = await cursor.fetchone()
+    return {"orders": orders, "revenue": revenue}
+
+async def stage_funnel(stages: List[str], since: str, until: str) -> Dict[str, int]:
+    """Conversations that reached each stage (or a later one) with a transition in [since, until)"""
+    rank = " ".join(f"WHEN ? THEN {i}" for i in range(len(stages)))
+    async with connection() as db:
+        async with db.execute(
+            f"""SELECT max_rank, COUNT(*) FROM (
+                    SELECT conversation_id, MAX(CASE to_stage {rank} ELSE 0 END) AS max_rank
+                    FROM stage_transitions WHERE at >= ? AND at < ? GROUP BY conversation_id
+                ) GROUP BY max_rank""",
+            [*stages, since, until]
+        ) as cursor:
+            by_rank = dict(await cursor.fetchall())
+    return {stage: sum(count for r, count in by_rank.items() if r >= i) for i, stage in enumerate(stages)}
+
+async def stage_durations(from_stage: str, to_stage: str, since: str, until: str) -> List[float]:
+    """Seconds from entering from_stage to first entering to_stage afterwards, per conversation"""
+    async with connection() as db:
+        async with db.execute(
+            """SELECT (julianday(MIN(b.at)) - julianday(a.at)) * 86400
+               FROM stage_transitions a JOIN stage_transitions b
+                 ON b.conversation_id = a.conversation_id AND b.to_stage = ? AND b.at >= a.at
+               WHERE a.to_stage = ? AND a.at >= ? AND a.at < ?
+               GROUP BY a.transition_id""",
+            [to_stage, from_stage, since, until]
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall() if row[0] is not None]
+
+# A pending message is eligible once every earlier pending message for the
+# same recipient is gone, except earlier messages of its own batch
+_OUTBOX_ELIGIBLE = """
+    status = 'pending'
+    AND NOT EXISTS (SELECT 1 FROM outbox earlier
+                    WHERE earlier.recipient_id = o.recipient_id AND earlier.status = 'pending'
+                      AND earlier.outbox_id < o.outbox_id
+                      AND (o.batch_id IS NULL OR earlier.batch_id IS NOT o.batch_id))
+"""
+
+async def enqueue_outbox(recipient_id: str, payloads: List[Dict[str, Any]], now: float,
+                         batch_id: Optional[str] = None) -> List[int]:
+    """Queue outbound messages for a recipient in order, returns their outbox ids"""
+    async with connection() as db:
+        ids = []
+        for payload in payloads:
+            cursor = await db.execute(
+                "INSERT INTO outbox (recipient_id, payload, batch_id, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                [recipient_id, json.dumps(payload), batch_id, now, now]
+            )
+            ids.append(cursor.lastrowid)
+        await db.commit()
+        return ids
+
+async def due_outbox_messages(now: float, limit: int = 50) -> List[Dict[str, Any]]:
+    """Pending messages that are due and first in line for their recipient"""
+    async with connection() as db:
+        async with db.execute(
+            f"""SELECT * FROM outbox o
+                WHERE next_attempt_at <= ? AND {_OUTBOX_ELIGIBLE}
+                ORDER BY next_attempt_at, outbox_id LIMIT ?""",
+            [now, limit]
+        ) as cursor:
+            rows = await cursor.fetchall()
+    
+    messages = []
+    for row in rows:
+        msg = dict(row)
+        msg["payload"] = json.loads(msg["payload"])
+        messages.append(msg)
+    return messages
+
+async def next_outbox_attempt_at() -> Optional[float]:
+    """Earliest scheduled attempt among messages first in line for their recipient"""
+    async with connection() as db:
+        async with db.execute(
+            f"SELECT MIN(next_attempt_at) FROM outbox o WHERE {_OUTBOX_ELIGIBLE}"
+        ) as cursor:
+            return (await cursor.fetchone())[0]
+
+async def outbox_counts() -> Dict[str, int]:
+    """Number of outbox rows per status"""
+    async with connection() as db:
+        async with db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status") as cursor:
+            return {status: count for status, count in await cursor.fetchall()}
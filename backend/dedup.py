@@ -0,0 +1,53 @@
+import logging
+import time
+from collections import OrderedDict
+import database as db
+
+class MessageDeduplicator:
+    """Drops redelivered webhook messages by their Facebook message id (mid)
+
+    Recently seen ids are kept in a bounded in-memory LRU; the
+    processed_messages table makes the check survive restarts and is
+    purged after ttl_seconds.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 86400,
+                 purge_interval: float = 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.purge_interval = purge_interval
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._last_purge = 0.0
+        self.duplicates = 0
+
+    def _remember(self, mid: str, seen_at: float):
+        self._seen[mid] = seen_at
+        self._seen.move_to_end(mid)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    async def claim(self, mid: str) -> bool:
+        """Return True the first time a mid is seen, False for duplicates"""
+        now = time.time()
+        seen_at = self._seen.get(mid)
+        if seen_at is not None and now - seen_at < self.ttl_seconds:
+            self._seen.move_to_end(mid)
+            self.duplicates += 1
+            return False
+
+        if now - self._last_purge > self.purge_interval:
+            await self.purge_expired()
+
+        inserted = await db.insert_if_absent("processed_messages", {"mid": mid, "created_at": now})
+        self._remember(mid, now)
+        if not inserted:
+            self.duplicates += 1
+        return inserted
+
+    async def purge_expired(self) -> int:
+        """Delete persisted ids older than the TTL"""
+        self._last_purge = time.time()
+        deleted = await db.delete_older_than("processed_messages", "created_at", self._last_purge - self.ttl_seconds)
+        if deleted:
+            logging.info(f"Purged {deleted} expired processed message ids")
+        return deleted
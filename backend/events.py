@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+# In-process pub/sub for the admin dashboard. Writes publish small deltas;
+# each connected admin page gets them over server-sent events.
+
+class Event(NamedTuple):
+    id: str
+    type: str
+    data: Dict[str, Any]
+
+    def encode(self) -> str:
+        """The event in the text/event-stream wire format"""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n"
+
+# Sent instead of a replay when the client's last event id can't be resumed
+# from (the server restarted or the event fell out of the history); the page
+# should re-fetch its data once
+RESET = "reset"
+
+class EventBus:
+    """Publish/subscribe bus with a bounded replay history
+
+    Event ids are "<epoch>-<sequence>", the epoch being the process start
+    time, so ids from before a restart are recognised rather than compared
+    against a sequence that started over. A subscriber that falls more than
+    queue_size events behind is disconnected; the browser reconnects with
+    its last event id and catches up from the history.
+    """
+
+    def __init__(self, history_size: int = 1000, queue_size: int = 256):
+        self.epoch = str(int(time.time()))
+        self.queue_size = queue_size
+        self._sequence = 0
+        self._history: deque = deque(maxlen=history_size)
+        self._subscribers: List[asyncio.Queue] = []
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Event:
+        """Record an event and hand it to every subscriber (never blocks)"""
+        self._sequence += 1
+        event = Event(f"{self.epoch}-{self._sequence}", event_type, data)
+        self._history.append((self._sequence, event))
+        self.published += 1
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Drop the slow consumer. Its backlog is discarded so it never
+                # sees a later event without the earlier ones; it resumes from
+                # the history on reconnect. None tells its stream to end.
+                self._subscribers.remove(queue)
+                self.dropped_subscribers += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                logging.warning("Admin event subscriber fell behind, disconnecting it")
+        return event
+
+    def _replay(self, last_event_id: str) -> Optional[List[Event]]:
+        """Events after last_event_id, or None if they are no longer available"""
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if sequence > self._sequence:
+            return None
+        if self._history and sequence < self._history[0][0] - 1:
+            return None
+        return [event for seq, event in self._history if seq > sequence]
+
+    async def subscribe(self, last_event_id: Optional[str] = None,
+                        heartbeat: Optional[float] = None) -> AsyncIterator[Optional[Event]]:
+        """Missed events since last_event_id (or a reset event), then live ones
+
+        With a heartbeat interval, None is yielded whenever that long passes
+        without an event, so the caller can keep an idle connection alive.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        # The replay snapshot and the registration happen without an await in
+        # between, so every event is either replayed or queued, exactly once
+        missed = self._replay(last_event_id) if last_event_id else []
+        self._subscribers.append(queue)
+        try:
+            if missed is None:
+                yield Event(f"{self.epoch}-{self._sequence}", RESET, {})
+            else:
+                for event in missed:
+                    yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            if queue in self._subscribers:
+                self._subscribers.remove(queue)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "history": len(self._history),
+            "dropped_subscribers": self.dropped_subscribers
+        }
@@ -0,0 +1,155 @@
+import re
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+from prompts import DELIVERY_CHARGE_VALLEY, DELIVERY_CHARGE_OUTSIDE, RETURN_POLICY_REPLY
+from text_patterns import words
+
+_NOT_DURATION = r'(?!\s*(?:din|time|samaya|bela|दिन))'
+
+# Intent keywords (English, Romanized Nepali and Devanagari)
+INTENT_PATTERNS = {
+    "price": words(r'price', r'prices', r'rate', r'cost', r'kat+i' + _NOT_DURATION, r'mulya', r'daam', r'dam',
+                   r'कति' + _NOT_DURATION, r'मूल्य', r'दाम'),
+    "delivery_charge": words(r'delivery\s*(?:charge|fee|cost|kati' + _NOT_DURATION + ')', r'shipping',
+                             r'delivery\s*ko\s*(?:paisa|charge)', r'डेलिभरी\s*चार्ज'),
+    "delivery_time": words(r'kati\s*din', r'kahile', r'kaile', r'how\s*long', r'kati\s*(?:time|samaya)',
+                           r'when\s+(?:will|does|do|can|is)\s+(?:\w+\s+){0,3}(?:arrive|deliver\w*|reach|come)',
+                           r'delivery\s*time', r'aaipug\w*', r'aaucha', r'कहिले', r'कति\s*दिन'),
+    "return_policy": words(r'return', r'exchange', r'firta', r'fereko', r'फिर्ता'),
+    "sizes": words(r'size', r'sizes', r'saiz', r'साइज'),
+    "colors": words(r'colou?rs?', r'rang', r'रंग', r'रङ'),
+}
+
+# Anything that smells like negotiation, ordering, several items or a total to pay goes to the LLM
+BLOCKERS = words(r'discount', r'kam\s*gar\w*', r'ghata\w*', r'mehe?nga', r'sasto', r'last\s*price', r'ota',
+                 r'order', r'cancel', r'kinchu', r'linchu', r'total', r'sahit', r'advance', r'tir(?:nu|ne|na)\w*',
+                 r'jam+a', r'छुट', r'महँगो', r'जम्मा', r'सहित', r'तिर्नु\w*')
+
+VALLEY = words(r'ktm', r'kathmandu', r'lalitpur', r'patan', r'bhaktapur', r'valley\s*(?:bhitra|vitra|inside)',
+               r'inside\s*(?:the\s*)?valley', r'काठमाडौं', r'ललितपुर', r'भक्तपुर')
+OUTSIDE = words(r'bahira', r'outside', r'pokhara', r'chitwan', r'butwal', r'biratnagar', r'dharan', r'birgunj',
+                r'nepalgunj', r'dhangadhi', r'hetauda', r'बाहिर')
+
+class FastReply(NamedTuple):
+    intent: str
+    text: str
+    confidence: float
+
+def _rs(amount: float) -> str:
+    return f"{amount:g}"
+
+class FastPathResponder:
+    """Template answers for high-frequency questions, tried before the LLM
+
+    Each message is scored against the intent keyword sets; only a single,
+    unambiguous intent on a short message (and a resolvable product, for
+    product-specific intents) reaches min_confidence. Everything else falls
+    back to the LLM. hits/fallbacks count how often each path is taken.
+
+    Conversations already negotiating or ordering, or with an agreed price
+    or quantity in their facts, always go to the LLM: the templates would
+    quote list prices and ask for color and size again.
+    """
+
+    PRODUCT_INTENTS = {"price", "sizes", "colors"}
+    SKIP_STAGES = {"negotiation", "ordering"}
+    SKIP_FACTS = ("negotiated_price", "quantity")
+
+    def __init__(self, min_confidence: float = 0.8, max_words: int = 8):
+        self.min_confidence = min_confidence
+        self.max_words = max_words
+        self.hits: Counter = Counter()
+        self.fallbacks: Counter = Counter()
+        self.skipped = 0
+
+    def stats(self) -> dict:
+        return {"hits": dict(self.hits), "fallbacks": dict(self.fallbacks), "skipped": self.skipped}
+
+    def _resolve_product(self, text: str, products: Sequence[Any], recent_product_ids: Sequence[str],
+                         named_product_ids: Optional[Sequence[str]]) -> Optional[Any]:
+        by_id = {p.product_id: p for p in products}
+        if named_product_ids is None:
+            text_lower = text.lower()
+            named_product_ids = [p.product_id for p in products if p.name.lower() in text_lower]
+        if len(named_product_ids) == 1:
+            return by_id.get(named_product_ids[0])
+        if named_product_ids:
+            return None
+        for product_id in reversed(recent_product_ids):
+            if product_id in by_id:
+                return by_id[product_id]
+        if len(products) == 1:
+            return products[0]
+        return None
+
+    def respond(self, text: str, products: Sequence[Any], recent_product_ids: Sequence[str] = (),
+                named_product_ids: Optional[Sequence[str]] = None, stage: str = "",
+                facts: Optional[Dict[str, Any]] = None) -> Optional[FastReply]:
+        """Template reply for the message, or None to fall back to the LLM
+
+        named_product_ids are the products mentioned in the message (from the
+        product matcher); without them a plain name substring scan is used.
+        stage is the conversation's stage before this message (its own price
+        words would otherwise always read as negotiation), facts are after it.
+        """
+        facts = facts or {}
+        if stage in self.SKIP_STAGES or any(facts.get(key) for key in self.SKIP_FACTS):
+            self.skipped += 1
+            return None
+        matched: List[str] = [intent for intent, pattern in INTENT_PATTERNS.items() if pattern.search(text)]
+        if not matched:
+            return None
+        # "delivery charge kati?" also trips the generic price words
+        if "delivery_charge" in matched and "price" in matched:
+            matched.remove("price")
+
+        confidence = 1.0
+        if len(matched) > 1:
+            confidence -= 0.5
+        if BLOCKERS.search(text):
+            confidence -= 0.5
+        if len(text.split()) > self.max_words:
+            confidence -= 0.3
+
+        intent = matched[0]
+        product = None
+        if intent in self.PRODUCT_INTENTS:
+            product = self._resolve_product(text, products, recent_product_ids, named_product_ids)
+            if product is None:
+                confidence -= 0.5
+
+        reply = self._render(intent, text, product) if confidence >= self.min_confidence else None
+        if reply is None:
+            self.fallbacks[intent] += 1
+            return None
+        self.hits[intent] += 1
+        return FastReply(intent=intent, text=reply, confidence=confidence)
+
+    def _render(self, intent: str, text: str, product: Optional[Any]) -> Optional[str]:
+        if intent == "price":
+            regular = product.regular_price or product.price
+            if regular > product.price:
+                return (f"Hajur, {product.name} ko regular price Rs. {_rs(regular)} ho, tara aile offer ma "
+                        f"Rs. {_rs(product.price)} matra chha! Hajur lai kun color ra size chaahiyo?")
+            return f"Hajur, {product.name} Rs. {_rs(product.price)} matra ho. Hajur lai kun color ra size chaahiyo?"
+        if intent == "sizes":
+            if not product.sizes:
+                return None
+            return f"Hajur, {product.name} ma {', '.join(product.sizes)} size available chha. Hajur lai kun size chaahiyo?"
+        if intent == "colors":
+            if not product.colors:
+                return None
+            return f"Hajur, {product.name} ma {', '.join(product.colors)} color available chha. Kun color man parcha hajur?"
+        if intent == "delivery_charge":
+            inside, outside = bool(VALLEY.search(text)), bool(OUTSIDE.search(text))
+            if inside and not outside:
+                return f"Hajur, Kathmandu Valley bhitra delivery charge Rs. {DELIVERY_CHARGE_VALLEY} matra ho."
+            if outside and not inside:
+                return f"Hajur, valley bahira delivery charge Rs. {DELIVERY_CHARGE_OUTSIDE} ho. Delivery ekdum fast ra safe chha!"
+            return (f"Hajur, Kathmandu Valley bhitra delivery charge Rs. {DELIVERY_CHARGE_VALLEY} ra valley bahira "
+                    f"Rs. {DELIVERY_CHARGE_OUTSIDE} ho. Hajur kun thau ma hununcha?")
+        if intent == "delivery_time":
+            return "Hajur, Kathmandu Valley bhitra same day wa bholi nai delivery huncha, valley bahira 2-3 din lagchha."
+        if intent == "return_policy":
+            return f"{RETURN_POLICY_REPLY}. Tara product ekdum quality ko chha, hajur lai pakka man parchha!"
+        return None
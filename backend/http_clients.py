@@ -0,0 +1,51 @@
+import os
+import httpx
+from typing import Dict
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def _new_client(base_url: str, timeout: float) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(timeout, connect=float(os.environ.get('HTTP_CONNECT_TIMEOUT', '5'))),
+        limits=httpx.Limits(
+            max_connections=int(os.environ.get('HTTP_MAX_CONNECTIONS', '20')),
+            max_keepalive_connections=int(os.environ.get('HTTP_MAX_KEEPALIVE', '10')),
+            keepalive_expiry=float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '60')),
+        ),
+    )
+
+def open_clients():
+    """Create one keep-alive client per upstream host (called on app startup)"""
+    if _clients:
+        return
+    # Read at open time so values from backend/.env are picked up; the base
+    # URLs can point at local stub servers
+    timeout = float(os.environ.get('HTTP_TIMEOUT', '15'))
+    _clients["graph"] = _new_client(os.environ.get('GRAPH_API_BASE_URL', 'https://graph.facebook.com/v18.0'), timeout)
+    _clients["groq"] = _new_client(os.environ.get('GROQ_API_BASE_URL', 'https://api.groq.com/openai/v1'),
+                                   float(os.environ.get('GROQ_TIMEOUT', '30')))
+    _clients["imgbb"] = _new_client(os.environ.get('IMGBB_API_BASE_URL', 'https://api.imgbb.com/1'), timeout)
+
+async def close_clients():
+    """Close every pooled client (called on app shutdown)"""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+def _client(name: str) -> httpx.AsyncClient:
+    if not _clients:
+        open_clients()
+    return _clients[name]
+
+def graph() -> httpx.AsyncClient:
+    """Client for graph.facebook.com"""
+    return _client("graph")
+
+def groq() -> httpx.AsyncClient:
+    """Client for the Groq chat completions API"""
+    return _client("groq")
+
+def imgbb() -> httpx.AsyncClient:
+    """Client for the imgbb upload API"""
+    return _client("imgbb")
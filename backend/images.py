@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import io
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+from fastapi import UploadFile
+import database as db
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it originals are stored as uploaded
+    Image = None
+
+READ_CHUNK_SIZE = 64 * 1024
+
+class ImageVariant(NamedTuple):
+    max_side: int
+    quality: int
+
+# Large is what products and Messenger use; thumbnails are for the admin UI
+VARIANTS = {
+    "large": ImageVariant(max_side=1280, quality=80),
+    "thumb": ImageVariant(max_side=320, quality=70),
+}
+
+class UploadTooLarge(Exception):
+    """The upload exceeded the configured size limit"""
+
+class InvalidImage(Exception):
+    """The upload is not a readable image"""
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytes:
+    """Read an upload in chunks, giving up as soon as it passes max_bytes"""
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def make_variants(data: bytes, lossless: bool = False) -> Dict[str, bytes]:
+    """Resized WebP variants of an image (CPU-bound, run it in a thread)"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    except Exception as e:
+        # Also covers Pillow's decompression bomb check
+        raise InvalidImage(f"Not a readable image: {e}")
+
+    variants = {}
+    for name, variant in VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((variant.max_side, variant.max_side), Image.LANCZOS)
+        out = io.BytesIO()
+        resized.save(out, "WEBP", quality=variant.quality, lossless=lossless, method=4)
+        variants[name] = out.getvalue()
+    return variants
+
+def local_storage(directory: Path, base_url: str) -> Callable[[str, bytes], Awaitable[str]]:
+    """Storage callback writing files under directory, served at base_url"""
+    directory.mkdir(parents=True, exist_ok=True)
+
+    async def save(name: str, data: bytes) -> str:
+        await asyncio.to_thread((directory / name).write_bytes, data)
+        return f"{base_url.rstrip('/')}/{name}"
+    return save
+
+class ImagePipeline:
+    """Upload path for product images and payment QR codes
+
+    Uploads are read with a size limit and hashed; an image whose content
+    was already uploaded returns the stored URLs without another upload.
+    New images are stored as resized WebP variants (large and thumbnail)
+    when Pillow is installed, otherwise as the original file.
+    """
+
+    def __init__(self, store: Callable[[str, bytes], Awaitable[str]], max_bytes: int = 10 * 1024 * 1024):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.deduplicated = 0
+
+    async def ingest(self, file: UploadFile, lossless: bool = False) -> Dict[str, Optional[str]]:
+        """Store an uploaded image, returns {"url", "thumbnail_url", "sha256", "deduplicated"}"""
+        data = await read_upload(file, self.max_bytes)
+        if not data:
+            raise InvalidImage("Empty upload")
+        digest = hashlib.sha256(data).hexdigest()
+        # QR codes are stored losslessly, so the same file is a different image
+        key = f"{digest}-lossless" if lossless else digest
+
+        existing = await db.find_one("image_uploads", {"sha256": key})
+        if existing:
+            self.deduplicated += 1
+            return {"url": existing["url"], "thumbnail_url": existing["thumbnail_url"],
+                    "sha256": digest, "deduplicated": True}
+
+        if Image is not None:
+            variants = await asyncio.to_thread(make_variants, data, lossless)
+            url = await self.store(f"{key}.webp", variants["large"])
+            thumbnail_url = await self.store(f"{key}-thumb.webp", variants["thumb"])
+        else:
+            suffix = Path(file.filename or "").suffix.lower() or ".jpg"
+            url = await self.store(f"{key}{suffix}", data)
+            thumbnail_url = url
+
+        await db.insert_if_absent("image_uploads", {
+            "sha256": key,
+            "url": url,
+            "thumbnail_url": thumbnail_url,
+            "bytes": len(data),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        })
+        logging.info(f"Stored image {key[:12]} ({len(data)} bytes) at {url}")
+        return {"url": url, "thumbnail_url": thumbnail_url, "sha256": digest, "deduplicated": False}
+
+async def thumbnails_for(urls) -> Dict[str, str]:
+    """Thumbnail URL for each of the given image URLs that came through the pipeline"""
+    urls = list(set(urls))
+    if not urls:
+        return {}
+    rows = await db.find_many("image_uploads", {"url": {"$in": urls}}, limit=len(urls))
+    return {row["url"]: row["thumbnail_url"] for row in rows}
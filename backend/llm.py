@@ -0,0 +1,145 @@
+import asyncio
+import json
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+import http_clients
+import metrics
+
+class LLMError(Exception):
+    """Non-200 response, error event or unreadable body from the chat completions API"""
+
+    def __init__(self, message: str, status_code: int = 0, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def _retry_after(headers) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)"""
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _request(api_key: str, model: str, messages: List[Dict[str, str]], stream: bool, **params) -> Dict[str, Any]:
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    data = {"model": model, "messages": messages, "stream": stream, **params}
+    return {"headers": headers, "json": data}
+
+def _record_usage(model: str, usage: Optional[Dict[str, Any]]):
+    if usage:
+        metrics.LLM_TOKENS.inc(usage.get("prompt_tokens", 0), model=model, kind="prompt")
+        metrics.LLM_TOKENS.inc(usage.get("completion_tokens", 0), model=model, kind="completion")
+
+async def chat_completion(api_key: str, model: str, messages: List[Dict[str, str]], **params) -> str:
+    """Non-streaming completion, returns the reply text"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await http_clients.groq().post("/chat/completions", **_request(api_key, model, messages, False, **params))
+        if response.status_code != 200:
+            raise LLMError(f"Groq API error {response.status_code}: {response.text}", response.status_code,
+                           _retry_after(response.headers))
+        result = response.json()
+        _record_usage(model, result.get("usage"))
+        outcome = "ok"
+        return result["choices"][0]["message"]["content"]
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        metrics.LLM_SECONDS.observe(time.perf_counter() - start, model=model, mode="complete", outcome=outcome)
+
+async def stream_chat_completion(api_key: str, model: str, messages: List[Dict[str, str]], **params) -> AsyncIterator[str]:
+    """Streaming completion over server-sent events, yields content deltas"""
+    request = _request(api_key, model, messages, True, **params)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        async with http_clients.groq().stream("POST", "/chat/completions", **request) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise LLMError(f"Groq API error {response.status_code}: {body.decode('utf-8', 'replace')}", response.status_code,
+                               _retry_after(response.headers))
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                if chunk.get("error"):
+                    # Failures after the 200 arrive as an error event mid-stream
+                    raise LLMError(f"Groq stream error: {chunk['error'].get('message', chunk['error'])}", 500)
+                # Groq reports usage on the last chunk (under x_groq, or top level)
+                _record_usage(model, chunk.get("usage") or chunk.get("x_groq", {}).get("usage"))
+                choices = chunk.get("choices") or []
+                if choices:
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        outcome = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        # Closed early, e.g. the losing side of a hedged request
+        outcome = "cancelled"
+        raise
+    finally:
+        metrics.LLM_SECONDS.observe(time.perf_counter() - start, model=model, mode="stream", outcome=outcome)
+
+# Sentence ends: latin punctuation or the Devanagari danda, followed by whitespace
+# (but not abbreviations such as "Rs. 999")
+_SENTENCE_END = re.compile(r'(?<!\bRs)(?<!\bNo)(?<!\bMr)(?<!\bDr)(?<!\bMs)[.!?।]+["\')\]]*\s+', re.IGNORECASE)
+
+class SentenceChunker:
+    """Splits a streamed reply so the first complete sentences can be sent early
+
+    The first segment is released as soon as at least min_chars of complete
+    sentences are buffered; everything after it is sent as one final segment
+    so the customer gets at most two messages per reply.
+    """
+
+    def __init__(self, min_chars: int = 40):
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._released_first = False
+
+    def feed(self, delta: str) -> Optional[str]:
+        """Add streamed text, returns the early segment once it is ready"""
+        self._buffer += delta
+        if self._released_first:
+            return None
+        cut = None
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if match.end() >= self.min_chars:
+                cut = match.end()
+                break
+        if cut is None:
+            return None
+        segment, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:]
+        self._released_first = True
+        return segment
+
+    def flush(self) -> Optional[str]:
+        """Whatever is left once the stream ends"""
+        segment, self._buffer = self._buffer.strip(), ""
+        return segment or None
+
+    def flush_sentences(self) -> Optional[str]:
+        """The complete sentences left after a failed stream; the cut-off tail is dropped"""
+        cut = 0
+        for match in _SENTENCE_END.finditer(self._buffer + " "):
+            cut = match.end()
+        segment, self._buffer = self._buffer[:cut].strip(), ""
+        return segment or None
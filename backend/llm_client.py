@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+import llm
+import metrics
+
+# Keeps reply latency bounded while Groq is slow or rate-limited: a circuit
+# breaker per model, a hedged request to a smaller fallback model when the
+# primary is slow to answer, and a deadline (the latency SLO) after which the
+# caller sends its busy reply instead of waiting out the HTTP timeout.
+
+PATHS = ("primary", "hedge", "fallback", "none")
+
+class LLMUnavailable(Exception):
+    """No model answered within the SLO, or every circuit is open"""
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Errors that count against a model's circuit (4xx other than 429 are the request's fault)"""
+    if isinstance(error, llm.LLMError) and 400 <= error.status_code < 500:
+        return error.status_code == 429
+    return True
+
+class CircuitBreaker:
+    """Stops sending requests to a model that keeps failing
+
+    failure_threshold consecutive failures (errors, 429s or SLO timeouts)
+    open the circuit for cooldown seconds, or longer if the provider's
+    Retry-After says so. A single 429 with Retry-After opens it for just that
+    long. Once the time is up one probe request is let through: success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, model: str, failure_threshold: int = 5, cooldown: float = 30.0,
+                 max_cooldown: float = 300.0):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.opens = 0
+        self._open = False
+        self._open_until = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if not self._open:
+            return "closed"
+        return "half_open" if time.monotonic() >= self._open_until else "open"
+
+    def allow(self) -> bool:
+        """Whether a request may go to the model now (takes the probe slot when half open)"""
+        if not self._open:
+            return True
+        if self._probing or time.monotonic() < self._open_until:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self._open:
+            self._open = False
+            metrics.LLM_CIRCUIT_OPEN.set(0, model=self.model)
+            logging.info(f"LLM circuit for {self.model} closed")
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        self.failures += 1
+        probe_failed, self._probing = self._probing, False
+        if probe_failed or self.failures >= self.failure_threshold:
+            seconds = max(self.cooldown, retry_after or 0)
+        elif retry_after:
+            seconds = retry_after
+        else:
+            return
+        self._open_until = time.monotonic() + min(seconds, self.max_cooldown)
+        if not self._open:
+            self._open = True
+            self.opens += 1
+            metrics.LLM_CIRCUIT_OPEN.set(1, model=self.model)
+            logging.error(f"LLM circuit for {self.model} open for {min(seconds, self.max_cooldown):.1f}s "
+                          f"after {self.failures} failures")
+
+    def release(self):
+        """Free the probe slot without a verdict (the request was cancelled or rejected)"""
+        self._probing = False
+
+class LLMReply(NamedTuple):
+    text: str
+    model: str
+    path: str  # primary | hedge | fallback
+
+class LLMStream:
+    """Deltas of a streamed reply; model and path are set once the first token arrives"""
+
+    def __init__(self, client: "ResilientLLM", messages: List[Dict[str, str]], params: Dict[str, Any]):
+        self._client = client
+        self._messages = messages
+        self._params = params
+        self.model = ""
+        self.path = "none"
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        (first, stream), self.model, self.path = await self._client._race(
+            "stream", lambda model: self._client._first_delta(model, self._messages, self._params),
+            discard=lambda result: result[1].aclose()
+        )
+        try:
+            yield first
+            async for delta in stream:
+                yield delta
+        except Exception as e:
+            if is_provider_failure(e):
+                self._client.breakers[self.model].record_failure(getattr(e, "retry_after", None))
+            raise
+        finally:
+            await stream.aclose()
+
+class ResilientLLM:
+    """Chat completions with a circuit breaker, a hedged fallback model and a deadline
+
+    A request goes to the primary model. If it hasn't answered after
+    hedge_delay seconds (or fails sooner) the same prompt goes to
+    fallback_model and whichever answers first is used; the other request
+    is cancelled. While the primary's circuit is open requests go straight
+    to the fallback. Anything not answered within slo_seconds raises
+    LLMUnavailable. For streams the delay and SLO apply to the first token.
+    """
+
+    def __init__(self, api_key: str, model: str, fallback_model: str = "", hedge_delay: float = 2.0,
+                 slo_seconds: float = 10.0, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.api_key = api_key
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model != model else ""
+        self.hedge_delay = hedge_delay
+        self.slo_seconds = slo_seconds
+        self.breakers = {name: CircuitBreaker(name, failure_threshold, cooldown)
+                         for name in (model, self.fallback_model) if name}
+        self.served = {path: 0 for path in PATHS}
+
+    async def complete(self, messages: List[Dict[str, str]], **params) -> LLMReply:
+        """Non-streaming completion from whichever model answers first"""
+        text, model, path = await self._race(
+            "complete", lambda model: llm.chat_completion(self.api_key, model, messages, **params))
+        return LLMReply(text, model, path)
+
+    def stream(self, messages: List[Dict[str, str]], **params) -> LLMStream:
+        """Streaming completion; iterate it for the deltas"""
+        return LLMStream(self, messages, params)
+
+    async def _first_delta(self, model: str, messages: List[Dict[str, str]],
+                           params: Dict[str, Any]) -> Tuple[str, AsyncIterator[str]]:
+        stream = llm.stream_chat_completion(self.api_key, model, messages, **params)
+        try:
+            first = await anext(stream, None)
+        except BaseException:
+            await stream.aclose()
+            raise
+        if first is None:
+            raise llm.LLMError(f"Empty reply from {model}")
+        return first, stream
+
+    async def _race(self, mode: str, start: Callable[[str], Awaitable[Any]],
+                    discard: Optional[Callable[[Any], Awaitable[None]]] = None) -> Tuple[Any, str, str]:
+        started = time.monotonic()
+        deadline = started + self.slo_seconds
+        hedge_at = started + self.hedge_delay
+        attempts: Dict[asyncio.Task, Tuple[str, str]] = {}
+        last_error: Optional[BaseException] = None
+        timed_out = False
+
+        def launch(model: str, path: str):
+            attempts[asyncio.create_task(start(model))] = (model, path)
+
+        if self.breakers[self.model].allow():
+            launch(self.model, "primary")
+        # Only one fallback request per call, as a hedge or in place of the primary
+        fallback_tried = not self.fallback_model
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if not fallback_tried and (not attempts or now >= hedge_at):
+                    fallback_tried = True
+                    if self.breakers[self.fallback_model].allow():
+                        launch(self.fallback_model, "hedge" if attempts else "fallback")
+                if not attempts:
+                    break
+                wait_until = deadline if fallback_tried else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(attempts, timeout=wait_until - now,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model, path = attempts.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.breakers[model].record_success()
+                        # The slower request is dropped without counting against its circuit
+                        await self._cancel(attempts, discard)
+                        self.served[path] += 1
+                        metrics.LLM_REPLIES.inc(mode=mode, path=path)
+                        if path != "primary":
+                            logging.info(f"LLM {mode} reply served by {model} ({path}) "
+                                         f"after {time.monotonic() - started:.1f}s")
+                        return task.result(), model, path
+                    last_error = error
+                    logging.error(f"LLM {mode} request to {model} failed: {error}")
+                    if is_provider_failure(error):
+                        self.breakers[model].record_failure(getattr(error, "retry_after", None))
+                    else:
+                        self.breakers[model].release()
+            # Out of time: whatever is still running counts as a failure
+            timed_out = bool(attempts)
+            await self._cancel(attempts, discard, timed_out=True)
+        finally:
+            await self._cancel(attempts, discard)
+        self.served["none"] += 1
+        metrics.LLM_REPLIES.inc(mode=mode, path="none")
+        if timed_out:
+            raise LLMUnavailable(f"No LLM reply within {self.slo_seconds:g}s")
+        if last_error is None:
+            raise LLMUnavailable("Every LLM circuit is open")
+        raise LLMUnavailable(f"No LLM reply: {last_error}") from last_error
+
+    async def _cancel(self, attempts: Dict[asyncio.Task, Tuple[str, str]],
+                      discard: Optional[Callable[[Any], Awaitable[None]]], timed_out: bool = False):
+        """Cancel the outstanding requests; timed out ones count against their circuit"""
+        pending = list(attempts.items())
+        attempts.clear()
+        for task, _ in pending:
+            task.cancel()
+        try:
+            # The attempts' own cancellations come back as results; a
+            # cancellation of the caller still raises here
+            outcomes = await asyncio.gather(*(task for task, _ in pending), return_exceptions=True)
+        except asyncio.CancelledError:
+            for _, (model, _) in pending:
+                self.breakers[model].release()
+            raise
+        for (_, (model, _)), outcome in zip(pending, outcomes):
+            if not isinstance(outcome, BaseException):
+                # Finished while being cancelled
+                if discard:
+                    await discard(outcome)
+                self.breakers[model].release()
+            elif timed_out:
+                self.breakers[model].record_failure()
+            else:
+                self.breakers[model].release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "fallback_model": self.fallback_model,
+            "hedge_delay": self.hedge_delay,
+            "slo_seconds": self.slo_seconds,
+            "served": dict(self.served),
+            "circuits": {model: {"state": breaker.state, "failures": breaker.failures, "opens": breaker.opens}
+                         for model, breaker in self.breakers.items()}
+        }
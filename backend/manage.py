@@ -0,0 +1,27 @@
+import argparse
+import asyncio
+import database as db
+
+async def _run(command: str):
+    await db.open_pool(1)
+    try:
+        await db.init_db()
+        if command == "backfill-stats":
+            await db.rebuild_daily_order_stats(missing_days_only=True)
+            print("Backfilled daily_order_stats for days without rollup rows")
+        elif command == "rebuild-stats":
+            await db.rebuild_daily_order_stats()
+            print("Rebuilt daily_order_stats from orders")
+    finally:
+        await db.close_pool()
+
+def main():
+    parser = argparse.ArgumentParser(description="Urban Fashion backend maintenance commands")
+    parser.add_argument("command", choices=["backfill-stats", "rebuild-stats"],
+                        help="backfill-stats: add rollup rows for days that have none; "
+                             "rebuild-stats: recompute the whole daily order rollup")
+    args = parser.parse_args()
+    asyncio.run(_run(args.command))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import difflib
+import json
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from prompts import DELIVERY_CHARGE_VALLEY, DELIVERY_CHARGE_OUTSIDE
+from text_patterns import DEVANAGARI, DEVANAGARI_DIGITS, EDGE_AFTER, words
+
+# Builds an order from the chat as it happens: phone numbers and addresses are
+# parsed from each customer message, districts and municipalities are matched
+# against a bundled gazetteer, and the order is placed once the draft is
+# complete and the customer confirms. No model calls are involved.
+
+GAZETTEER_PATH = Path(__file__).parent / "data" / "nepal_gazetteer.json"
+VALLEY_DISTRICTS = {"Kathmandu", "Lalitpur", "Bhaktapur"}
+
+# Mobile numbers: 10 digits starting 96/97/98, optionally with +977 and separators
+_PHONE = re.compile(r'(?<!\d)(?:\+?977[\s-]?)?(9[678](?:[\s-]?\d){8})(?!\d)')
+_WARD = re.compile(r'(?:ward|wada|वडा)\s*(?:no\.?|number|नं\.?)?\s*[:\-]?\s*(\d{1,2})(?!\d)', re.IGNORECASE)
+# "Pokhara-8": only a ward when the word is a municipality or district
+_PLACE_WARD = re.compile(r'([A-Za-z' + DEVANAGARI + r']{3,})\s*-\s*(\d{1,2})(?!\d)')
+_PARTS = re.compile(r'[,\n]+')
+
+_ONLINE = words(r'e-?sewa', r'khalti', r'online', r'bank', r'qr', r'fone\s*pay', r'ime\s*pay', r'transfer')
+_COD = words(r'cod', r'cash\s*on\s*delivery', r'cash', r'नगद')
+# A confirmation is a short reply made only of these phrases (and polite fillers),
+# so questions such as "total kati huncha?" never place an order
+_CONFIRM_PHRASES = (r'confirm\w*(?:\s*gar\w*)?', r'pakka', r'hun+c?h+a', r'thik\s*c?h+a', r'thikai\s*c?h+a',
+                    r'yes', r'ok', r'okay', r'order\s*(?:garnus|gardinus|garnuhos|gardinuhos)', r'pathaidinus',
+                    r'हुन्छ', r'ठि?ीक\s*छ', r'पक्का')
+_CONFIRM_FILLERS = (r'hajur', r'ji', r'la', r'ho', r'please', r'dai', r'didi', r'sir', r'हजुर', r'ल')
+_CONFIRM = re.compile(r'^[\s,.!।]*(?:(?:' + '|'.join(_CONFIRM_PHRASES + _CONFIRM_FILLERS) + ')' + EDGE_AFTER + r'[\s,.!।]*)+$',
+                      re.IGNORECASE)
+_CONFIRM_WORDS = words(*_CONFIRM_PHRASES)
+_QUESTION = words(r'kati', r'kahile', r'ke', r'kasari', r'कति', r'कहिले', r'के', r'कसरी')
+_NEGATION = words(r'c?hain+a', r'hoina', r'hudaina', r'pardaina', r'not', r'cancel\w*', r'pachhi',
+                  r'छैन', r'होइन', r'हुँदैन')
+
+def _key(name: str) -> str:
+    return re.sub(r'[^\w' + DEVANAGARI + ']+', ' ', name.casefold()).strip()
+
+class Gazetteer:
+    """District and municipality lookup with fuzzy matching for misspellings"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.provinces: Dict[str, str] = {}
+        self._districts: Dict[str, str] = {}
+        self._municipalities: Dict[str, List[Tuple[str, str]]] = {}
+        for district, info in data["districts"].items():
+            self.provinces[district] = info["province"]
+            for name in [district, *info.get("aliases", [])]:
+                self._districts[_key(name)] = district
+            for municipality in info["municipalities"]:
+                self._municipalities.setdefault(_key(municipality), []).append((municipality, district))
+        for alias, (municipality, district) in data.get("municipality_aliases", {}).items():
+            self._municipalities.setdefault(_key(alias), []).append((municipality, district))
+
+    @classmethod
+    def load(cls, path: Path = GAZETTEER_PATH) -> "Gazetteer":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _lookup(key: str, index: Dict[str, Any], cutoff: float) -> Optional[str]:
+        if key in index:
+            return key
+        if len(key) < 4:
+            return None
+        close = difflib.get_close_matches(key, index.keys(), n=1, cutoff=cutoff)
+        return close[0] if close else None
+
+    def district(self, name: str, cutoff: float = 0.8) -> Optional[str]:
+        """Canonical district for a (possibly misspelled) name"""
+        key = self._lookup(_key(name), self._districts, cutoff)
+        return self._districts[key] if key else None
+
+    def municipality(self, name: str, district: Optional[str] = None,
+                     cutoff: float = 0.8) -> Optional[Tuple[str, str]]:
+        """(municipality, district) for a name, preferring the given district"""
+        key = self._lookup(_key(name), self._municipalities, cutoff)
+        if not key:
+            return None
+        matches = self._municipalities[key]
+        for match in matches:
+            if match[1] == district:
+                return match
+        return matches[0] if district is None or len(matches) == 1 else None
+
+    def scan(self, text: str) -> Dict[str, str]:
+        """District and municipality named anywhere in free text (1-3 word spans)"""
+        words = _key(text).split()
+        found: Dict[str, str] = {}
+        for size in (3, 2, 1):
+            for i in range(len(words) - size + 1):
+                span = " ".join(words[i:i + size])
+                if "district" not in found:
+                    district = self.district(span, cutoff=0.85)
+                    if district:
+                        found["district"] = district
+                        continue
+                if "municipality" not in found:
+                    match = self.municipality(span, found.get("district"), cutoff=0.85)
+                    if match:
+                        found["municipality"], municipality_district = match
+                        found.setdefault("district", municipality_district)
+        return found
+
+# Draft fields the system prompt tells the agent to collect, in asking order
+CUSTOMER_FIELDS = {
+    "customer_name": "full name",
+    "phone_primary": "phone number (10 digits)",
+    "district": "district",
+    "municipality": "municipality/VDC",
+    "ward_number": "ward number",
+    "tole_area": "tole/area",
+}
+_ADDRESS_FIELDS = ("district", "municipality", "ward_number", "tole_area")
+# Facts that describe the ordered item; cleared once the order is placed
+ITEM_FACTS = ("product", "product_id", "color", "size", "quantity", "negotiated_price")
+
+class OrderExtractor:
+    """Keeps an order draft (conversations.context["order_draft"]) up to date
+
+    update() is called for every customer message with the conversation
+    facts from before and after that message. Labelled values from the
+    facts ("District: Kaski") win over the free-text parse.
+    """
+
+    def __init__(self, gazetteer: Gazetteer):
+        self.gazetteer = gazetteer
+
+    def update(self, draft: Dict[str, Any], text: str, facts_before: Dict[str, Any],
+               facts_after: Dict[str, Any]) -> Dict[str, Any]:
+        """The draft with what one customer message adds (returns a new dict)"""
+        draft = dict(draft)
+        draft.setdefault("draft_id", str(uuid.uuid4()))
+        text = text.translate(DEVANAGARI_DIGITS)
+        if any(facts_after.get(key) not in (None, facts_before.get(key)) for key in ITEM_FACTS):
+            # Talking about an item again starts the next order
+            draft.pop("placed_order_id", None)
+
+        for phone in _PHONE.findall(text):
+            phone = re.sub(r'\D', '', phone)
+            if not draft.get("phone_primary"):
+                draft["phone_primary"] = phone
+            elif phone != draft["phone_primary"]:
+                draft["phone_alternative"] = phone
+
+        if _ONLINE.search(text):
+            draft["payment_method"] = "Online"
+        elif _COD.search(text):
+            draft["payment_method"] = "COD"
+
+        # Values the facts extractor picked up from this message
+        stated = {key: value for key, value in facts_after.items()
+                  if key in CUSTOMER_FIELDS and facts_before.get(key) != value}
+        ward = self._ward(text)
+        if ward and not any(field in stated for field in _ADDRESS_FIELDS):
+            # Unlabelled address such as "Lakeside, Pokhara-8, Kaski"
+            stated.update(self._free_address(text, skip=(stated.get("customer_name"), draft.get("customer_name"))))
+            stated["ward_number"] = ward
+
+        if stated.get("customer_name"):
+            draft["customer_name"] = stated["customer_name"]
+        if stated.get("district"):
+            draft["district"] = self.gazetteer.district(stated["district"]) or stated["district"].strip().title()
+        if stated.get("municipality"):
+            match = self.gazetteer.municipality(stated["municipality"], draft.get("district"))
+            if match:
+                draft["municipality"] = match[0]
+                draft.setdefault("district", match[1])
+            else:
+                draft["municipality"] = stated["municipality"].strip().title()
+        for field in ("ward_number", "tole_area"):
+            if stated.get(field):
+                draft[field] = stated[field].strip()
+        return draft
+
+    def _ward(self, text: str) -> Optional[str]:
+        """Ward number after a ward keyword or a place name ("Pokhara-8")"""
+        match = _WARD.search(text)
+        if match:
+            return match.group(1)
+        for match in _PLACE_WARD.finditer(text):
+            place = match.group(1)
+            if self.gazetteer.district(place, cutoff=0.85) or self.gazetteer.municipality(place, cutoff=0.85):
+                return match.group(2)
+        return None
+
+    def _free_address(self, text: str, skip: Sequence[Optional[str]] = ()) -> Dict[str, str]:
+        found = self.gazetteer.scan(text)
+        skip = {_key(name) for name in skip if name}
+        # The tole is the first part that is neither a place name, a number nor the name
+        for part in _PARTS.split(text):
+            part = part.strip(" .")
+            if not part or re.search(r'\d', part) or _CONFIRM.match(part) or _key(part) in skip:
+                continue
+            if self.gazetteer.scan(part):
+                continue
+            found["tole_area"] = part
+            break
+        return found
+
+    def missing(self, draft: Dict[str, Any], facts: Dict[str, Any], products_by_id: Dict[str, Any]) -> List[str]:
+        """Descriptions of what the order still needs, empty when it can be placed"""
+        needed = [label for field, label in CUSTOMER_FIELDS.items() if not draft.get(field)]
+        product = products_by_id.get(facts.get("product_id"))
+        if product is None:
+            needed.append("product")
+        else:
+            if len(product.colors) > 1 and not facts.get("color"):
+                needed.append("color")
+            if len(product.sizes) > 1 and not facts.get("size"):
+                needed.append("size")
+        return needed
+
+    @staticmethod
+    def is_confirmation(text: str) -> bool:
+        """Whether a message is nothing but a confirmation ("hunchha", "thik chha, confirm")"""
+        text = text.strip()
+        if text.endswith(("?", "？")) or _QUESTION.search(text) or _NEGATION.search(text):
+            return False
+        # Fillers alone ("hajur") don't confirm anything
+        return bool(_CONFIRM.match(text)) and bool(_CONFIRM_WORDS.search(text))
+
+    def order_fields(self, draft: Dict[str, Any], facts: Dict[str, Any],
+                     products_by_id: Dict[str, Any]) -> Dict[str, Any]:
+        """Order model fields (without ids) for a complete draft"""
+        product = products_by_id[facts["product_id"]]
+        quantity = int(facts.get("quantity") or 1)
+        price = float(facts.get("negotiated_price") or product.price)
+        subtotal = price * quantity
+        if facts.get("delivery_charge") is not None:
+            delivery_charge = float(facts["delivery_charge"])
+        elif draft.get("district") in VALLEY_DISTRICTS:
+            delivery_charge = float(DELIVERY_CHARGE_VALLEY)
+        else:
+            delivery_charge = float(DELIVERY_CHARGE_OUTSIDE)
+        return {
+            **{field: draft[field] for field in CUSTOMER_FIELDS},
+            "phone_alternative": draft.get("phone_alternative", ""),
+            "items": [{
+                "product_id": product.product_id,
+                "product_name": product.name,
+                "color": facts.get("color") or (product.colors[0] if product.colors else ""),
+                "size": facts.get("size") or (product.sizes[0] if product.sizes else ""),
+                "quantity": quantity,
+                "price": price
+            }],
+            "subtotal": subtotal,
+            "delivery_charge": delivery_charge,
+            "total_amount": subtotal + delivery_charge,
+            "payment_method": draft.get("payment_method", "COD")
+        }
+
+    def render(self, draft: Dict[str, Any], missing: Sequence[str]) -> str:
+        """Order status line for the prompt ("" before any order details are given)"""
+        if draft.get("placed_order_id"):
+            return (f"ORDER PLACED: #{draft['placed_order_id'][:8]} is saved. "
+                    "Thank the customer and confirm the order; don't collect the details again.")
+        if not any(draft.get(field) for field in CUSTOMER_FIELDS):
+            return ""
+        if missing:
+            return "ORDER DETAILS STILL NEEDED: " + ", ".join(missing)
+        return "ORDER DETAILS COMPLETE: ask the customer to confirm the order."
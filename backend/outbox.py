@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import database as db
+
+# Graph API error codes worth retrying: temporary failures and rate limits
+# (1 unknown, 2 service unavailable, 4/17/32/613 throttling, 1200 temporary send failure)
+RETRYABLE_GRAPH_CODES = {1, 2, 4, 17, 32, 613, 1200}
+
+class DeliveryError(Exception):
+    """Failed send; retryable errors are retried with backoff, others dead-lettered"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+def graph_error(status_code: int, body: Dict[str, Any]) -> DeliveryError:
+    """Classify a non-200 Graph API response"""
+    error = body.get("error", {}) if isinstance(body, dict) else {}
+    code = error.get("code")
+    retryable = status_code >= 500 or status_code == 429 or code in RETRYABLE_GRAPH_CODES
+    return DeliveryError(f"Graph API error {status_code} (code {code}): {error.get('message', body)}", retryable)
+
+class TokenBucket:
+    """Global send rate limiter: rate tokens per second, bursts up to capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class OutboxSender:
+    """Delivers queued outbound messages from the outbox table
+
+    Only the oldest pending message of each recipient is eligible, so a
+    customer's messages go out in order even across retries; messages
+    enqueued together with parallel=True (e.g. product images) are sent
+    concurrently, up to max_batch_fanout at a time. Different recipients
+    are sent concurrently, all through one token bucket. Failed
+    sends back off exponentially with jitter and are dead-lettered after
+    max_attempts (or at once for non-retryable errors). Rows survive
+    restarts, so delivery is at-least-once.
+    """
+
+    def __init__(self, send: Callable[[str, Dict[str, Any]], Awaitable[None]], concurrency: int = 8,
+                 rate_per_second: float = 20, burst: float = 20, max_attempts: int = 8,
+                 base_delay: float = 1.0, max_delay: float = 300.0, poll_interval: float = 5.0,
+                 retention_seconds: float = 86400, max_batch_fanout: int = 3):
+        self.send = send
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self.max_batch_fanout = max(1, max_batch_fanout)
+        self._in_flight: Dict[int, Dict[str, Any]] = {}  # outbox_id -> row
+        self._recipient_batch: Dict[str, Optional[str]] = {}  # batch_id of each recipient's in-flight sends
+        self._finished: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def enqueue(self, recipient_id: str, *payloads: Dict[str, Any], parallel: bool = False) -> List[int]:
+        """Persist messages for a recipient and wake the sender
+
+        The messages go out after everything already queued for the
+        recipient; with parallel=True they may go out concurrently with
+        each other (in any order), otherwise one after the other.
+        """
+        batch_id = uuid.uuid4().hex if parallel and len(payloads) > 1 else None
+        ids = await db.enqueue_outbox(recipient_id, list(payloads), time.time(), batch_id)
+        self._wake.set()
+        return ids
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "retried": self.retried, "dead": self.dead, "in_flight": len(self._in_flight)}
+
+    def backoff(self, attempts: int) -> float:
+        """Delay before the next attempt: exponential, capped, with jitter"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    async def start(self):
+        if self._loop_task is None:
+            self._loop_task = asyncio.create_task(self._run(), name="outbox-sender")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Give due messages drain_timeout to go out, then stop; the rest stay queued"""
+        if self._loop_task is None:
+            return
+        deadline = time.monotonic() + drain_timeout
+        while time.monotonic() < deadline:
+            due = await db.due_outbox_messages(time.time(), limit=1)
+            if not due and not self._in_flight:
+                break
+            await asyncio.sleep(0.05)
+        self._loop_task.cancel()
+        await asyncio.gather(self._loop_task, *self._tasks, return_exceptions=True)
+        self._loop_task = None
+        if self._in_flight:
+            logging.warning(f"Outbox stopped with {len(self._in_flight)} sends in flight")
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                dispatched = await self._dispatch_due()
+                if time.time() - self._last_purge > 3600:
+                    await self._purge_sent()
+            except Exception as e:
+                logging.exception(f"Outbox sender error: {e}")
+                dispatched = 0
+            if dispatched:
+                continue
+            # Sleep until the next retry is due. A head that is already due is
+            # either blocked behind an in-flight send (which wakes the loop when
+            # done) or became due after the query above, so go round again.
+            timeout = self.poll_interval
+            next_at = await db.next_outbox_attempt_at()
+            if next_at is not None:
+                wait_for_due = next_at - time.time()
+                if wait_for_due > 0:
+                    timeout = min(timeout, wait_for_due)
+                elif not self._in_flight:
+                    continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch_due(self) -> int:
+        # Rows read here are stale for recipients whose send finishes meanwhile;
+        # those are skipped and picked up again on the next pass
+        self._finished.clear()
+        dispatched = 0
+        for row in await db.due_outbox_messages(time.time(), limit=self.concurrency * 4):
+            await self._slots.acquire()
+            if not self._can_dispatch(row):
+                self._slots.release()
+                continue
+            self._in_flight[row["outbox_id"]] = row
+            self._recipient_batch[row["recipient_id"]] = row["batch_id"]
+            task = asyncio.create_task(self._deliver(row))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            dispatched += 1
+        return dispatched
+
+    def _can_dispatch(self, row: Dict[str, Any]) -> bool:
+        recipient_id = row["recipient_id"]
+        if row["outbox_id"] in self._in_flight or recipient_id in self._finished:
+            return False
+        if recipient_id not in self._recipient_batch:
+            return True
+        # Only more of the same parallel batch may join a recipient's in-flight sends
+        if row["batch_id"] is None or self._recipient_batch[recipient_id] != row["batch_id"]:
+            return False
+        in_flight = sum(1 for sending in self._in_flight.values() if sending["recipient_id"] == recipient_id)
+        return in_flight < self.max_batch_fanout
+
+    async def _deliver(self, row: Dict[str, Any]):
+        attempts = row["attempts"] + 1
+        try:
+            await self.bucket.acquire()
+            try:
+                await self.send(row["recipient_id"], row["payload"])
+            except DeliveryError as e:
+                await self._failed(row, attempts, str(e), e.retryable)
+            except Exception as e:
+                # Timeouts and connection errors
+                await self._failed(row, attempts, f"{type(e).__name__}: {e}", True)
+            else:
+                await db.update_one("outbox", {"outbox_id": row["outbox_id"]},
+                                    {"status": "sent", "attempts": attempts, "sent_at": time.time()})
+                self.sent += 1
+        finally:
+            del self._in_flight[row["outbox_id"]]
+            if not any(sending["recipient_id"] == row["recipient_id"] for sending in self._in_flight.values()):
+                del self._recipient_batch[row["recipient_id"]]
+            self._finished.add(row["recipient_id"])
+            self._slots.release()
+            # The recipient's next message may be waiting behind this one
+            self._wake.set()
+
+    async def _failed(self, row: Dict[str, Any], attempts: int, error: str, retryable: bool):
+        if retryable and attempts < self.max_attempts:
+            self.retried += 1
+            await db.update_one("outbox", {"outbox_id": row["outbox_id"]}, {
+                "attempts": attempts,
+                "next_attempt_at": time.time() + self.backoff(attempts),
+                "last_error": error
+            })
+            logging.warning(f"Outbox send {row['outbox_id']} failed (attempt {attempts}), retrying: {error}")
+            return
+        self.dead += 1
+        await db.update_one("outbox", {"outbox_id": row["outbox_id"]},
+                            {"status": "dead", "attempts": attempts, "last_error": error})
+        logging.error(f"Outbox send {row['outbox_id']} to {row['recipient_id']} dead-lettered after {attempts} attempts: {error}")
+
+    async def _purge_sent(self):
+        self._last_purge = time.time()
+        deleted = await db.delete_older_than("outbox", "created_at", self._last_purge - self.retention_seconds,
+                                             {"status": "sent"})
+        if deleted:
+            logging.info(f"Purged {deleted} delivered outbox messages")
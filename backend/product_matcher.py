@@ -0,0 +1,129 @@
+import re
+import unicodedata
+from collections import deque
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+class Mention(NamedTuple):
+    product_id: str
+    start: int  # character offsets into the original text
+    end: int
+    term: str
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or 'ऀ' <= ch <= 'ॿ'
+
+# What may follow a term inside the same word: a plural, then a Nepali
+# postposition ("kurtako", "kurtaharuma", "कुर्ताको"). Anything else means the
+# term is only the start of a longer word ("top" in "topi").
+_SUFFIX = re.compile(r'(?:s|es|haru|हरू)?'
+                     r'(?:ko|ka|ki|ma|maa|le|lai|laai|bata|baata|sanga|samma|'
+                     r'को|का|की|मा|ले|लाई|बाट|सँग|सम्म)?(?: |$)')
+
+def normalize(text: str) -> Tuple[str, List[int]]:
+    """Casefold, NFKC-normalize and collapse punctuation/whitespace
+
+    Returns the normalized string and, for each of its characters, the
+    offset of the original character it came from.
+    """
+    out: List[str] = []
+    offsets: List[int] = []
+    for i, ch in enumerate(text):
+        for norm_ch in unicodedata.normalize('NFKC', ch).casefold():
+            if not _is_word_char(norm_ch):
+                if not out or out[-1] == ' ':
+                    continue
+                norm_ch = ' '
+            out.append(norm_ch)
+            offsets.append(i)
+    return ''.join(out), offsets
+
+class ProductMatcher:
+    """Aho-Corasick automaton over normalized product names and aliases
+
+    Finds every mention in one pass over the text. A term only matches as
+    whole words, except that a plural or a Nepali postposition may be
+    attached ("kurtako", "कुर्ताको").
+    """
+
+    def __init__(self, products: Sequence[Any]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, str]]] = [[]]  # (term, product_id) per state
+        for product in products:
+            terms = {product.name, *getattr(product, 'aliases', [])}
+            for term in terms:
+                norm_term = normalize(term)[0].strip()
+                if norm_term:
+                    self._add(norm_term, product.product_id)
+        self._build()
+
+    def _add(self, term: str, product_id: str):
+        state = 0
+        for ch in term:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][ch] = nxt
+            state = nxt
+        if (term, product_id) not in self._out[state]:
+            self._out[state].append((term, product_id))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[Mention]:
+        """Every (possibly overlapping) mention, in order of end position"""
+        norm, offsets = normalize(text)
+        mentions: List[Mention] = []
+        state = 0
+        for i, ch in enumerate(norm):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for term, product_id in self._out[state]:
+                start = i - len(term) + 1
+                if start > 0 and norm[start - 1] != ' ' or not _SUFFIX.match(norm, i + 1):
+                    continue
+                mentions.append(Mention(product_id, offsets[start], offsets[i] + 1, term))
+        return mentions
+
+    def find(self, text: str) -> List[Mention]:
+        """Leftmost-longest, non-overlapping mentions"""
+        chosen: List[Mention] = []
+        for mention in sorted(self.find_all(text), key=lambda m: (m.start, -(m.end - m.start))):
+            if chosen and mention.start < chosen[-1].end:
+                # Same span naming several products: keep them all
+                if (mention.start, mention.end) != (chosen[-1].start, chosen[-1].end):
+                    continue
+            chosen.append(mention)
+        return chosen
+
+    def product_ids(self, text: str) -> List[str]:
+        """Mentioned product ids, deduplicated in order of first mention"""
+        seen: Dict[str, None] = {}
+        for mention in self.find(text):
+            seen.setdefault(mention.product_id, None)
+        return list(seen)
+
+_compiled: Optional[Tuple[Any, ProductMatcher]] = None
+
+def matcher_for(products: Sequence[Any], catalog_version: int) -> ProductMatcher:
+    """Matcher for the given products, compiled once per catalog version and product list"""
+    global _compiled
+    key = (catalog_version, tuple(product.product_id for product in products))
+    if _compiled is None or _compiled[0] != key:
+        _compiled = (key, ProductMatcher(products))
+    return _compiled[1]
@@ -0,0 +1,177 @@
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Business constants shared by the prompt and the fast-path responder
+DELIVERY_CHARGE_VALLEY = 100
+DELIVERY_CHARGE_OUTSIDE = 200
+DELIVERY_TIME_VALLEY = "same day/tomorrow"
+DELIVERY_TIME_OUTSIDE = "2-3 days"
+RETURN_POLICY_REPLY = "Sorry hajur, return policy chhaina"
+
+# Static sales rules. Everything that varies per customer or per turn is kept
+# out of this text so the rendered prefix stays byte-identical between calls
+# and the provider's prompt caching can reuse it.
+SYSTEM_PROMPT_TEMPLATE = """You are {agent_name}, a respectful sales agent for {business_name} in Nepal.
+
+CRITICAL LANGUAGE RULES - ALWAYS USE HIGH RESPECT:
+- NEVER use "timi", "timro" - ALWAYS use "hajur", "tapai"
+- NEVER use "jannu chha" - ALWAYS use "jannu huncha" or "janna chahanu huncha"
+- NEVER use "garnu chha" - ALWAYS use "garnuhuncha"
+- NEVER use "xa" - ALWAYS use "chha"
+- Examples: "Hajur kasto hununcha?", "Hajur lai k chaahiyo?", "Garnuhuncha?"
+
+BUSINESS CONTEXT:
+- You are manufacturer, factory at {business_location}
+- Rarely sell online, this is special offer
+- First 100 customers get offer price
+- After 100, regular price applies
+
+PRICING STRATEGY (CRITICAL):
+- Show: "Regular Rs. 1499, Offer Rs. 999"
+- When calculating: Rs. 999 = Rs. 1000 (manipulative trick)
+- Multiple items: Calculate at Rs. 1000 each (Rs. 999 shown)
+- ONLY give Rs. 900 discount if customer ASKS for discount on multiple items
+- If customer asks "2 ota ma discount xa?", then offer Rs. 900 each
+- If customer doesn't ask, keep Rs. 1000 per item
+- NEVER give discount below Rs. 900 per item
+- NEVER give discount below Rs. 800 total
+
+DELIVERY CHARGES:
+- Kathmandu Valley: Rs. {delivery_valley} (NON-NEGOTIABLE)
+- Outside Valley: Rs. {delivery_outside} (can reduce to Rs. 150 if customer insists)
+- Delivery time: KTM {delivery_time_valley}, Outside {delivery_time_outside}
+
+DELIVERY NEGOTIATION (2 attempts):
+1st attempt: "Delivery ekdum fast ra safe chha, Rs. 200 worth it chha"
+2nd attempt: If customer still insists, give Rs. 150
+
+RETURN POLICY:
+- NEVER mention unless customer asks
+- If asked: "{return_policy}"
+
+ORDER COLLECTION (EXACT FORMAT):
+When customer confirms order, collect:
+1. Full Name
+2. Primary Phone (10 digits)
+3. Alternative Phone (ask reason if not provided, accept if valid reason)
+4. Full Address in ONE message:
+   - District:
+   - Municipality/VDC:
+   - Ward Number:
+   - Tole/Area:
+
+VALIDATION:
+- Phone must be 10 digits
+- Address must have all 4 parts
+- If incomplete, ask again politely
+
+OTHER PRODUCTS:
+If customer asks about other items: "Hamro manufacturer ho, online ma aile yo matra available chha. Direct factory {business_location} ma aayera hernu huncha!"
+
+CANCELLATION:
+If customer cancels, convince ONCE: "Yo opportunity miss hunu bhayo bhane regular Rs. 1499 ma kinna parchha. Only X slots left!"
+If still cancels: "Thik chha hajur, pachhi chaahiyo bhane message garnuhuncha"
+
+AVAILABLE PRODUCTS:
+{products_info}
+
+RESPOND in 2-4 sentences with HIGH RESPECT tone. Use hajur, garnuhuncha, hununcha, dinus."""
+
+CUSTOMER_CONTEXT_TEMPLATE = """CUSTOMER CONTEXT:
+- Customer is #{customer_number} (between 90-98)"""
+
+SUMMARY_PROMPT = """You keep notes on a Messenger sales chat for a clothing shop in Nepal.
+Update the summary with the new messages. Keep every concrete fact: the customer's
+name, products, colors, sizes, quantities, prices and discounts agreed, delivery
+charge, phone numbers, address parts, payment method, and open questions or
+objections. Drop greetings and small talk. Write at most 8 short lines in English."""
+
+def summary_messages(previous_summary: str, messages: Sequence[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Chat messages asking for the rolling summary to be extended with messages"""
+    transcript = "\n".join(
+        f"{'Agent' if msg['sender'] == 'agent' else 'Customer'}: {msg['text']}" for msg in messages
+    )
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"}
+    ]
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token plus message overhead)"""
+    return len(text) // 4 + 4
+
+def customer_number(customer_id: str) -> int:
+    """Stable 90-98 customer number so it doesn't change between turns"""
+    return 90 + zlib.crc32(customer_id.encode('utf-8')) % 9
+
+class PromptBuilder:
+    """Builds chat messages for the sales agent
+
+    The rules + catalog system prompt is rendered once per catalog version;
+    history is sent as real chat turns, trimmed oldest-first to fit
+    history_token_budget.
+    """
+
+    def __init__(self, agent_name: str, business_name: str, business_location: str,
+                 history_token_budget: int = 1500):
+        self.agent_name = agent_name
+        self.business_name = business_name
+        self.business_location = business_location
+        self.history_token_budget = history_token_budget
+        self._prefix: Optional[Tuple[int, str]] = None
+
+    def render_products(self, products: Sequence[Any]) -> str:
+        return "\n".join([
+            f"{p.name} - Offer: Rs.{p.price}, Regular: Rs.{p.regular_price or p.price}, Colors: {', '.join(p.colors)}, Sizes: {', '.join(p.sizes)}, Stock: {p.stock}"
+            for p in products if p.active
+        ])
+
+    def system_prompt(self, products: Sequence[Any], catalog_version: int) -> str:
+        """Static rules + catalog section, cached per catalog version"""
+        cached = self._prefix
+        if cached and cached[0] == catalog_version:
+            return cached[1]
+        prompt = SYSTEM_PROMPT_TEMPLATE.format(
+            agent_name=self.agent_name,
+            business_name=self.business_name,
+            business_location=self.business_location,
+            products_info=self.render_products(products),
+            delivery_valley=DELIVERY_CHARGE_VALLEY,
+            delivery_outside=DELIVERY_CHARGE_OUTSIDE,
+            delivery_time_valley=DELIVERY_TIME_VALLEY,
+            delivery_time_outside=DELIVERY_TIME_OUTSIDE,
+            return_policy=RETURN_POLICY_REPLY
+        )
+        self._prefix = (catalog_version, prompt)
+        return prompt
+
+    def history_turns(self, history: Sequence[Any]) -> List[Dict[str, str]]:
+        """Most recent history that fits the token budget, as chat turns"""
+        turns: List[Dict[str, str]] = []
+        used = 0
+        for msg in reversed(history):
+            cost = estimate_tokens(msg.text)
+            if used + cost > self.history_token_budget:
+                break
+            role = "assistant" if msg.sender == "agent" else "user"
+            turns.append({"role": role, "content": msg.text})
+            used += cost
+        turns.reverse()
+        return turns
+
+    def build(self, customer_id: str, customer_message: str, history: Sequence[Any],
+              products: Sequence[Any], catalog_version: int, conversation_notes: str = "") -> List[Dict[str, str]]:
+        """Chat messages for one turn: cached prefix, customer context, history, new message
+
+        conversation_notes (the rolling summary and known details) follow the
+        customer context, after the cacheable prefix.
+        """
+        customer_context = CUSTOMER_CONTEXT_TEMPLATE.format(customer_number=customer_number(customer_id))
+        if conversation_notes:
+            customer_context = f"{customer_context}\n\n{conversation_notes}"
+        return [
+            {"role": "system", "content": self.system_prompt(products, catalog_version)},
+            {"role": "system", "content": customer_context},
+            *self.history_turns(history),
+            {"role": "user", "content": customer_message}
+        ]
@@ -1,21 +1,44 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Request, UploadFile, File, Depends, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
+import json
+import secrets
+import time
 from datetime import datetime, timezone, timedelta
 import hmac
 import hashlib
 import jwt
 import base64
-import aiohttp
-import httpx
+from contextlib import aclosing
 import database as db
+import http_clients
+import llm
+from llm_client import ResilientLLM
+import product_matcher
+import outbox
+import metrics
+from workers import WorkerPool, QueueFullError
+from dedup import MessageDeduplicator
+from coalescer import MessageCoalescer
+from catalog import CatalogCache
+from attachments import AttachmentCache
+from images import ImagePipeline, UploadTooLarge, InvalidImage, local_storage, thumbnails_for
+from prompts import PromptBuilder, summary_messages
+from fastpath import FastPathResponder
+from compaction import ConversationCompactor, extract_facts, render_context
+from order_extractor import Gazetteer, OrderExtractor, ITEM_FACTS
+from stages import STAGES, StageTracker
+from events import EventBus
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -43,6 +66,54 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production'
 BUSINESS_NAME = os.environ.get('BUSINESS_NAME', 'Urban Fashion')
 AGENT_NAME = os.environ.get('AGENT_NAME', 'Aashis')
 BUSINESS_LOCATION = os.environ.get('BUSINESS_LOCATION', 'Gausala area')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '4'))
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '8'))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', '1000'))
+WEBHOOK_DRAIN_TIMEOUT = float(os.environ.get('WEBHOOK_DRAIN_TIMEOUT', '10'))
+DEDUP_CACHE_SIZE = int(os.environ.get('DEDUP_CACHE_SIZE', '10000'))
+DEDUP_TTL_SECONDS = float(os.environ.get('DEDUP_TTL_SECONDS', '86400'))
+COALESCE_WINDOW_SECONDS = float(os.environ.get('COALESCE_WINDOW_SECONDS', '1.5'))
+COALESCE_MAX_WAIT_SECONDS = float(os.environ.get('COALESCE_MAX_WAIT_SECONDS', '5'))
+MAX_CONCURRENT_TURNS = int(os.environ.get('MAX_CONCURRENT_TURNS', '8'))
+HISTORY_MESSAGE_LIMIT = int(os.environ.get('HISTORY_MESSAGE_LIMIT', '10'))
+CATALOG_TTL_SECONDS = float(os.environ.get('CATALOG_TTL_SECONDS', '300'))
+MAX_CATALOG_SIZE = 10000
+MAX_PROMPT_PRODUCTS = 100
+ORDERS_PAGE_MAX = 200
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.environ.get('PROMPT_HISTORY_TOKEN_BUDGET', '1500'))
+COMPACTION_ENABLED = os.environ.get('COMPACTION_ENABLED', 'true').lower() == 'true'
+COMPACTION_MODEL = os.environ.get('COMPACTION_MODEL', 'llama-3.1-8b-instant')
+COMPACTION_MESSAGE_THRESHOLD = int(os.environ.get('COMPACTION_MESSAGE_THRESHOLD', '20'))
+COMPACTION_KEEP_RECENT = int(os.environ.get('COMPACTION_KEEP_RECENT', '6'))
+LLM_MODEL = os.environ.get('LLM_MODEL', 'llama-3.3-70b-versatile')
+LLM_FALLBACK_MODEL = os.environ.get('LLM_FALLBACK_MODEL', 'llama-3.1-8b-instant')  # empty disables the fallback
+LLM_HEDGE_DELAY_SECONDS = float(os.environ.get('LLM_HEDGE_DELAY_SECONDS', '2'))
+LLM_SLO_SECONDS = float(os.environ.get('LLM_SLO_SECONDS', '10'))  # Longest wait (to the first token) before the busy reply
+LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS', '30'))
+LLM_STREAMING = os.environ.get('LLM_STREAMING', 'true').lower() == 'true'
+STREAM_FIRST_SEGMENT_CHARS = int(os.environ.get('STREAM_FIRST_SEGMENT_CHARS', '40'))
+FASTPATH_ENABLED = os.environ.get('FASTPATH_ENABLED', 'true').lower() == 'true'
+FASTPATH_MIN_CONFIDENCE = float(os.environ.get('FASTPATH_MIN_CONFIDENCE', '0.8'))
+OUTBOX_CONCURRENCY = int(os.environ.get('OUTBOX_CONCURRENCY', '8'))
+OUTBOX_RATE_PER_SECOND = float(os.environ.get('OUTBOX_RATE_PER_SECOND', '20'))
+OUTBOX_BURST = float(os.environ.get('OUTBOX_BURST', '20'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BASE_DELAY = float(os.environ.get('OUTBOX_BASE_DELAY', '1'))
+OUTBOX_MAX_DELAY = float(os.environ.get('OUTBOX_MAX_DELAY', '300'))
+ATTACHMENT_REUSE_ENABLED = os.environ.get('ATTACHMENT_REUSE_ENABLED', 'true').lower() == 'true'
+IMAGE_STORAGE = os.environ.get('IMAGE_STORAGE', 'imgbb' if IMGBB_API_KEY else 'local').lower()  # imgbb | local
+IMAGE_DIR = Path(os.environ.get('IMAGE_DIR', str(ROOT_DIR / 'uploads')))
+# Public origin of this backend, which Messenger and the admin panel load local images from (Render sets RENDER_EXTERNAL_URL)
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', os.environ.get('RENDER_EXTERNAL_URL', '')).rstrip('/')
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+REPLY_IMAGE_MODE = os.environ.get('REPLY_IMAGE_MODE', 'images').lower()  # images | carousel
+MAX_REPLY_IMAGES = 3
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token required on /metrics when set
+ADMIN_EVENTS_HEARTBEAT_SECONDS = 15
+ADMIN_EVENTS_STREAM_SECONDS = 300  # Streams end after this; EventSource reconnects and resumes
+ADMIN_EVENTS_TICKET_SECONDS = 60  # Lifetime of a single-use /admin/events ticket
+AI_BUSY_REPLY = "Sorry hajur, ma ali busy chhu. Pachhi message garnuhuncha!"
 
 # Models
 class Product(BaseModel):
@@ -56,9 +127,13 @@ class Product(BaseModel):
     sizes: List[str] = []
     stock: int = 0
     images: List[str] = []
+    aliases: List[str] = []  # Alternate names customers use (e.g. "kurta", "कुर्ता")
     active: bool = True
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class ProductListItem(Product):
+    thumbnail_url: Optional[str] = None  # Small variant of images[0] for the admin product list
+
 class PaymentQR(BaseModel):
     model_config = ConfigDict(extra="ignore")
     qr_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -76,6 +151,7 @@ class ProductCreate(BaseModel):
     sizes: List[str] = []
     stock: int = 0
     images: List[str] = []
+    aliases: List[str] = []
     active: bool = True
 
 class Message(BaseModel):
@@ -158,214 +234,294 @@ def verify_jwt_token(token: str) -> dict:
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     return verify_jwt_token(token)
 
-async def send_facebook_message(recipient_id: str, text: str):
-    if not FACEBOOK_PAGE_ACCESS_TOKEN:
-        logging.warning("Facebook token not configured")
-        return
+# Admin dashboard deltas (new orders, status changes, customer media)
+admin_events = EventBus()
+# Single-use tickets for opening the event stream: EventSource can't send the
+# Authorization header, and the long-lived JWT must not end up in URLs and logs
+admin_event_tickets: Dict[str, float] = {}
+
+def issue_events_ticket() -> str:
+    now = time.monotonic()
+    for ticket, expires in list(admin_event_tickets.items()):
+        if expires <= now:
+            del admin_event_tickets[ticket]
+    ticket = secrets.token_urlsafe(32)
+    admin_event_tickets[ticket] = now + ADMIN_EVENTS_TICKET_SECONDS
+    return ticket
+
+def redeem_events_ticket(ticket: str) -> bool:
+    expires = admin_event_tickets.pop(ticket, None)
+    return expires is not None and expires > time.monotonic()
+
+def publish_order(event_type: str, order: Dict[str, Any], **extra):
+    order = dict(order)
+    if isinstance(order.get("items"), str):
+        order["items"] = db.deserialize_list(order["items"])
+    admin_events.publish(event_type, {"order": order, **extra})
+
+async def upload_attachment(image_url: str) -> str:
+    """Upload an image once as a reusable Messenger attachment, returns its attachment_id"""
+    params = {"access_token": FACEBOOK_PAGE_ACCESS_TOKEN}
+    data = {
+        "message": {
+            "attachment": {
+                "type": "image",
+                "payload": {"url": image_url, "is_reusable": True}
+            }
+        }
+    }
+    
+    response = await http_clients.graph().post("/me/message_attachments", json=data, params=params)
+    if response.status_code != 200:
+        raise RuntimeError(f"Attachment upload error {response.status_code}: {response.text}")
+    return response.json()["attachment_id"]
+
+attachment_cache = AttachmentCache(upload_attachment)
+
+async def deliver_message(recipient_id: str, message: Dict[str, Any]):
+    """Post one queued message to the Send API (called by the outbox sender)"""
+    # Product images go out by reusable attachment id instead of URL
+    image_url = None
+    attachment = message.get("attachment") or {}
+    if ATTACHMENT_REUSE_ENABLED and attachment.get("type") == "image" and attachment.get("payload", {}).get("url"):
+        attachment_id = await attachment_cache.attachment_id(attachment["payload"]["url"])
+        if attachment_id:
+            image_url = attachment["payload"]["url"]
+            message = {"attachment": {"type": "image", "payload": {"attachment_id": attachment_id}}}
     
-    url = "https://graph.facebook.com/v18.0/me/messages"
-    headers = {"Content-Type": "application/json"}
     params = {"access_token": FACEBOOK_PAGE_ACCESS_TOKEN}
     data = {
         "recipient": {"id": recipient_id},
-        "message": {"text": text}
+        "message": message
     }
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data, headers=headers, params=params) as response:
-            if response.status != 200:
-                logging.error(f"Facebook API error: {await response.text()}")
+    kind = "text" if "text" in message else attachment.get("type", "other")
+    start = time.perf_counter()
+    try:
+        response = await http_clients.graph().post("/me/messages", json=data, params=params)
+    except Exception:
+        metrics.GRAPH_SEND_SECONDS.observe(time.perf_counter() - start, kind=kind, outcome="error")
+        raise
+    metrics.GRAPH_SEND_SECONDS.observe(time.perf_counter() - start, kind=kind,
+                                       outcome="ok" if response.status_code == 200 else str(response.status_code))
+    if response.status_code != 200:
+        try:
+            body = response.json()
+        except ValueError:
+            body = {"error": {"message": response.text}}
+        error = outbox.graph_error(response.status_code, body)
+        if image_url and not error.retryable:
+            # The stored id may no longer be valid; upload again on the next attempt
+            await attachment_cache.invalidate([image_url])
+            error.retryable = True
+        raise error
+
+message_outbox = outbox.OutboxSender(deliver_message, concurrency=OUTBOX_CONCURRENCY,
+                                     rate_per_second=OUTBOX_RATE_PER_SECOND, burst=OUTBOX_BURST,
+                                     max_attempts=OUTBOX_MAX_ATTEMPTS, base_delay=OUTBOX_BASE_DELAY,
+                                     max_delay=OUTBOX_MAX_DELAY, max_batch_fanout=MAX_REPLY_IMAGES)
+
+async def send_facebook_message(recipient_id: str, text: str):
+    """Queue a text message; the outbox sender delivers it with retries"""
+    if not FACEBOOK_PAGE_ACCESS_TOKEN:
+        logging.warning("Facebook token not configured")
+        return
+    
+    await message_outbox.enqueue(recipient_id, {"text": text})
 
-async def send_facebook_image(recipient_id: str, image_url: str):
+async def send_sender_action(recipient_id: str, action: str):
+    """Best-effort sender action such as typing_on / typing_off"""
     if not FACEBOOK_PAGE_ACCESS_TOKEN:
         return
     
-    url = "https://graph.facebook.com/v18.0/me/messages"
-    headers = {"Content-Type": "application/json"}
     params = {"access_token": FACEBOOK_PAGE_ACCESS_TOKEN}
     data = {
         "recipient": {"id": recipient_id},
-        "message": {
+        "sender_action": action
+    }
+    
+    try:
+        await http_clients.graph().post("/me/messages", json=data, params=params)
+    except Exception as e:
+        logging.warning(f"Sender action {action} failed: {e}")
+
+# Fire-and-forget sender actions, referenced until done so they aren't garbage collected
+sender_action_tasks: Set[asyncio.Task] = set()
+
+def start_sender_action(recipient_id: str, action: str):
+    """Send a sender action in the background, off the reply's critical path"""
+    task = asyncio.create_task(send_sender_action(recipient_id, action))
+    sender_action_tasks.add(task)
+    task.add_done_callback(sender_action_tasks.discard)
+
+def product_image_messages(products: List[Product]) -> List[Dict[str, Any]]:
+    """Send API messages showing each product's first image
+
+    In carousel mode all products go into one generic template (a single
+    request); otherwise each image is its own message.
+    """
+    products = [p for p in products if p.images]
+    if not products:
+        return []
+    if REPLY_IMAGE_MODE == "carousel":
+        elements = [
+            {"title": p.name, "subtitle": f"Rs. {p.price:g}", "image_url": p.images[0]}
+            for p in products
+        ]
+        return [{
             "attachment": {
-                "type": "image",
-                "payload": {"url": image_url}
+                "type": "template",
+                "payload": {"template_type": "generic", "elements": elements}
             }
-        }
-    }
+        }]
+    return [
+        {"attachment": {"type": "image", "payload": {"url": p.images[0]}}}
+        for p in products
+    ]
+
+async def send_product_images(recipient_id: str, products: List[Product]):
+    """Queue product images behind the reply text; the images go out concurrently"""
+    if not FACEBOOK_PAGE_ACCESS_TOKEN:
+        return
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=data, headers=headers, params=params) as response:
-            if response.status != 200:
-                logging.error(f"Facebook API error: {await response.text()}")
+    messages = product_image_messages(products)
+    if messages:
+        await message_outbox.enqueue(recipient_id, *messages, parallel=True)
 
-async def upload_to_imgbb(image_data: bytes) -> str:
+async def upload_to_imgbb(name: str, image_data: bytes) -> str:
     if not IMGBB_API_KEY:
         return "https://via.placeholder.com/400"
     
-    url = f"https://api.imgbb.com/1/upload"
-    data = aiohttp.FormData()
-    data.add_field('key', IMGBB_API_KEY)
-    data.add_field('image', base64.b64encode(image_data).decode('utf-8'))
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, data=data) as response:
-            if response.status == 200:
-                result = await response.json()
-                return result['data']['url']
-    return "https://via.placeholder.com/400"
-
-async def get_ai_response(customer_id: str, customer_message: str, conversation: Conversation, products: List[Product]) -> str:
-    import random
-    customer_number = random.randint(90, 98)
-    
-    products_info = "\n".join([
-        f"{p.name} - Offer: Rs.{p.price}, Regular: Rs.{p.regular_price or p.price}, Colors: {', '.join(p.colors)}, Sizes: {', '.join(p.sizes)}, Stock: {p.stock}"
-        for p in products if p.active
-    ])
-    
-    conversation_history = "\n".join([
-        f"{msg.sender}: {msg.text}"
-        for msg in conversation.messages[-10:]
-    ])
-    
-    system_prompt = f"""You are {AGENT_NAME}, a respectful sales agent for {BUSINESS_NAME} in Nepal.
-
-CRITICAL LANGUAGE RULES - ALWAYS USE HIGH RESPECT:
-- NEVER use "timi", "timro" - ALWAYS use "hajur", "tapai"
-- NEVER use "jannu chha" - ALWAYS use "jannu huncha" or "janna chahanu huncha"
-- NEVER use "garnu chha" - ALWAYS use "garnuhuncha"
-- NEVER use "xa" - ALWAYS use "chha"
-- Examples: "Hajur kasto hununcha?", "Hajur lai k chaahiyo?", "Garnuhuncha?"
-
-BUSINESS CONTEXT:
-- You are manufacturer, factory at {BUSINESS_LOCATION}
-- Rarely sell online, this is special offer
-- Customer is #{customer_number} (between 90-98)
-- First 100 customers get offer price
-- After 100, regular price applies
-
-PRICING STRATEGY (CRITICAL):
-- Show: "Regular Rs. 1499, Offer Rs. 999"
-- When calculating: Rs. 999 = Rs. 1000 (manipulative trick)
-- Multiple items: Calculate at Rs. 1000 each (Rs. 999 shown)
-- ONLY give Rs. 900 discount if customer ASKS for discount on multiple items
-- If customer asks "2 ota ma discount xa?", then offer Rs. 900 each
-- If customer doesn't ask, keep Rs. 1000 per item
-- NEVER give discount below Rs. 900 per item
-- NEVER give discount below Rs. 800 total
-
-DELIVERY CHARGES:
-- Kathmandu Valley: Rs. 100 (NON-NEGOTIABLE)
-- Outside Valley: Rs. 200 (can reduce to Rs. 150 if customer insists)
-- Delivery time: KTM same day/tomorrow, Outside 2-3 days
-
-DELIVERY NEGOTIATION (2 attempts):
-1st attempt: "Delivery ekdum fast ra safe chha, Rs. 200 worth it chha"
-2nd attempt: If customer still insists, give Rs. 150
-
-RETURN POLICY:
-- NEVER mention unless customer asks
-- If asked: "Sorry hajur, return policy chhaina"
-
-ORDER COLLECTION (EXACT FORMAT):
-When customer confirms order, collect:
-1. Full Name
-2. Primary Phone (10 digits)
-3. Alternative Phone (ask reason if not provided, accept if valid reason)
-4. Full Address in ONE message:
-   - District:
-   - Municipality/VDC:
-   - Ward Number:
-   - Tole/Area:
-
-VALIDATION:
-- Phone must be 10 digits
-- Address must have all 4 parts
-- If incomplete, ask again politely
-
-OTHER PRODUCTS:
-If customer asks about other items: "Hamro manufacturer ho, online ma aile yo matra available chha. Direct factory {BUSINESS_LOCATION} ma aayera hernu huncha!"
-
-CANCELLATION:
-If customer cancels, convince ONCE: "Yo opportunity miss hunu bhayo bhane regular Rs. 1499 ma kinna parchha. Only X slots left!"
-If still cancels: "Thik chha hajur, pachhi chaahiyo bhane message garnuhuncha"
-
-AVAILABLE PRODUCTS:
-{products_info}
-
-CONVERSATION HISTORY:
-{conversation_history}
-
-Customer said: "{customer_message}"
-
-RESPOND in 2-4 sentences with HIGH RESPECT tone. Use hajur, garnuhuncha, hununcha, dinus."""
+    # Multipart upload of the raw bytes (base64 would add a third)
+    response = await http_clients.imgbb().post("/upload", data={"key": IMGBB_API_KEY, "name": name},
+                                               files={"image": (name, image_data)})
+    if response.status_code != 200:
+        logging.error(f"imgbb upload error {response.status_code}: {response.text}")
+        raise HTTPException(status_code=502, detail="Image upload failed")
+    return response.json()['data']['url']
+
+image_pipeline = ImagePipeline(
+    upload_to_imgbb if IMAGE_STORAGE == "imgbb" else local_storage(IMAGE_DIR, f"{PUBLIC_BASE_URL}/api/uploads"),
+    max_bytes=MAX_UPLOAD_BYTES
+)
+
+async def ingest_image(file: UploadFile, lossless: bool = False) -> Dict[str, Any]:
+    try:
+        return await image_pipeline.ingest(file, lossless=lossless)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+prompt_builder = PromptBuilder(AGENT_NAME, BUSINESS_NAME, BUSINESS_LOCATION,
+                               history_token_budget=PROMPT_HISTORY_TOKEN_BUDGET)
+
+fast_path = FastPathResponder(min_confidence=FASTPATH_MIN_CONFIDENCE)
+
+llm_client = ResilientLLM(GROQ_API_KEY, LLM_MODEL, LLM_FALLBACK_MODEL, hedge_delay=LLM_HEDGE_DELAY_SECONDS,
+                          slo_seconds=LLM_SLO_SECONDS, failure_threshold=LLM_BREAKER_FAILURES,
+                          cooldown=LLM_BREAKER_COOLDOWN_SECONDS)
+
+async def summarize_messages(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    return await llm.chat_completion(GROQ_API_KEY, COMPACTION_MODEL, summary_messages(previous_summary, messages),
+                                     temperature=0.2, max_tokens=300)
+
+compactor = ConversationCompactor(summarize_messages, message_threshold=COMPACTION_MESSAGE_THRESHOLD,
+                                  token_threshold=PROMPT_HISTORY_TOKEN_BUDGET, keep_recent=COMPACTION_KEEP_RECENT)
+
+order_extractor = OrderExtractor(Gazetteer.load())
+
+def conversation_notes(conversation: Conversation, products_by_id: Dict[str, Product]) -> str:
+    facts = conversation.context.get("facts", {})
+    draft = conversation.context.get("order_draft", {})
+    notes = render_context(conversation.context.get("summary", ""), facts)
+    order_note = order_extractor.render(draft, order_extractor.missing(draft, facts, products_by_id))
+    return f"{notes}\n\n{order_note}".strip()
+
+async def place_order(customer_id: str, draft: Dict[str, Any], facts: Dict[str, Any],
+                      products_by_id: Dict[str, Product]) -> Order:
+    """Save the order collected in the chat (idempotent per draft)"""
+    order = Order(order_id=draft["draft_id"], customer_id=customer_id,
+                  **order_extractor.order_fields(draft, facts, products_by_id))
+    order_data = order.model_dump()
+    order_data["items"] = db.serialize_list(order_data["items"])
+    if await db.insert_if_absent("orders", order_data):
+        logging.info(f"Order {order.order_id} placed from chat with {customer_id}")
+        publish_order("order.created", order_data)
+    return order
+
+async def get_ai_response(customer_id: str, customer_message: str, conversation: Conversation, products: List[Product], catalog_version: int = 0) -> str:
+    # conversation.messages holds the history before this turn
+    messages = prompt_builder.build(customer_id, customer_message, conversation.messages,
+                                    products[:MAX_PROMPT_PRODUCTS], catalog_version,
+                                    conversation_notes(conversation, {p.product_id: p for p in products}))
     
     try:
-        # Use direct API call instead of Groq client to avoid proxy issues
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "llama-3.3-70b-versatile",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": customer_message}
-            ],
-            "temperature": 0.7,
-            "max_tokens": 500
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.groq.com/openai/v1/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30.0
-            )
-            
-            if response.status_code != 200:
-                error_detail = response.text
-                logging.error(f"Groq API error {response.status_code}: {error_detail}")
-                return "Sorry hajur, ma ali busy chhu. Pachhi message garnuhuncha!"
-            
-            result = response.json()
-            return result["choices"][0]["message"]["content"]
-            
+        reply = await llm_client.complete(messages, temperature=0.7, max_tokens=500)
+        return reply.text
     except Exception as e:
         logging.error(f"AI error: {e}")
-        return "Sorry hajur, ma ali busy chhu. Pachhi message garnuhuncha!"
+        return AI_BUSY_REPLY
 
-def detect_stage(messages: List[Message]) -> str:
-    if len(messages) <= 2:
-        return "greeting"
+async def stream_ai_response(customer_id: str, customer_message: str, conversation: Conversation, products: List[Product], catalog_version: int = 0):
+    """Stream the reply, yielding the first complete sentences early and then the rest"""
+    messages = prompt_builder.build(customer_id, customer_message, conversation.messages,
+                                    products[:MAX_PROMPT_PRODUCTS], catalog_version,
+                                    conversation_notes(conversation, {p.product_id: p for p in products}))
+    chunker = llm.SentenceChunker(min_chars=STREAM_FIRST_SEGMENT_CHARS)
+    sent_any = False
     
-    last_messages = " ".join([m.text.lower() for m in messages[-5:]])
+    try:
+        async for delta in llm_client.stream(messages, temperature=0.7, max_tokens=500):
+            segment = chunker.feed(delta)
+            if segment:
+                sent_any = True
+                yield segment
+    except Exception as e:
+        logging.error(f"AI stream error: {e}")
+        if not sent_any:
+            # Nothing reached the customer yet, so don't send a half reply
+            yield AI_BUSY_REPLY
+            return
+        # The first segment is out: finish with the complete sentences only,
+        # never a reply cut off mid-sentence or mid-price
+        rest = chunker.flush_sentences()
+        if rest:
+            yield rest
+        return
     
-    if any(word in last_messages for word in ['order', 'kinchu', 'garchu', 'linu', 'buy']):
-        return "ordering"
-    elif any(word in last_messages for word in ['price', 'kati', 'discount', 'mehenga']):
-        return "negotiation"
-    elif any(word in last_messages for word in ['completed', 'ordered', 'confirmed']):
-        return "completed"
-    else:
-        return "browsing"
+    rest = chunker.flush()
+    if rest:
+        yield rest
+    elif not sent_any:
+        yield AI_BUSY_REPLY
+
+def product_from_doc(p: Dict[str, Any]) -> Product:
+    p["colors"] = db.deserialize_list(p.get("colors", "[]"))
+    p["sizes"] = db.deserialize_list(p.get("sizes", "[]"))
+    p["images"] = db.deserialize_list(p.get("images", "[]"))
+    p["aliases"] = db.deserialize_list(p.get("aliases", "[]"))
+    p["active"] = bool(p.get("active", 1))
+    return Product(**p)
+
+async def load_products() -> List[Product]:
+    products_docs = await db.find_many("products", limit=MAX_CATALOG_SIZE)
+    return [product_from_doc(p) for p in products_docs]
+
+catalog = CatalogCache(load_products, ttl_seconds=CATALOG_TTL_SECONDS)
+
+stage_tracker = StageTracker()
 
-def detect_product_mentions(text: str, products: List[Product]) -> List[str]:
-    mentioned_products = []
-    text_lower = text.lower()
-    for product in products:
-        if product.name.lower() in text_lower:
-            mentioned_products.append(product.product_id)
-    return mentioned_products
+def detect_product_mentions(text: str, products: List[Product], catalog_version: int = 0) -> List[str]:
+    # Single pass over the text with the matcher compiled for this catalog version
+    return product_matcher.matcher_for(products, catalog_version).product_ids(text)
 
 # Routes
 @api_router.get("/")
@@ -384,6 +540,236 @@ async def verify_webhook(request: Request):
     else:
         raise HTTPException(status_code=403, detail="Verification failed")
 
+async def process_messaging_event(messaging_event: Dict[str, Any]):
+    """Run one customer turn for a queued messaging event"""
+    if not messaging_event.get('message'):
+        return
+    sender_id = messaging_event['sender']['id']
+    message = messaging_event['message']
+    
+    # Drop Facebook redeliveries before doing any work
+    mid = message.get('mid')
+    if mid and not await message_dedup.claim(mid):
+        logging.info(f"Dropping duplicate webhook message {mid}")
+        metrics.WEBHOOK_EVENTS.inc(outcome="duplicate")
+        return
+    
+    message_text = message.get('text', '')
+    
+    # Check for media (images, videos, voice, files)
+    has_media = any([
+        message.get('attachments'),
+        message.get('sticker_id')
+    ])
+    
+    if has_media:
+        # Customer sent media - create notification for admin
+        media_type = "unknown"
+        media_url = ""
+        
+        if message.get('attachments'):
+            attachment = message['attachments'][0]
+            media_type = attachment.get('type', 'file')
+            media_url = attachment.get('payload', {}).get('url', '')
+        
+        # Create media notification in database
+        media_notification = {
+            "notification_id": str(uuid.uuid4()),
+            "customer_id": sender_id,
+            "media_type": media_type,
+            "media_url": media_url,
+            "status": "pending",  # pending, reviewed
+            "admin_response": "",
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        await db.insert_one("media_notifications", media_notification)
+        admin_events.publish("media.created", {"notification": media_notification})
+        
+        # Mark conversation as having pending media
+        await db.update_one("conversations", {"customer_id": sender_id}, 
+                            {"has_media_pending": 1})
+        
+        # Bot stays silent - no response
+        metrics.WEBHOOK_EVENTS.inc(outcome="media")
+        return
+    
+    if not message_text:
+        metrics.WEBHOOK_EVENTS.inc(outcome="empty")
+        return
+    
+    # Bursts of short messages are coalesced into one turn per customer
+    metrics.WEBHOOK_EVENTS.inc(outcome="text")
+    message_coalescer.submit(sender_id, message_text, messaging_event.get('timestamp', 0))
+
+async def process_customer_turn(sender_id: str, message_texts: List[str]):
+    """Answer a coalesced batch of customer messages with one LLM call"""
+    message_text = "\n".join(message_texts)
+    turn_started = time.perf_counter()
+    
+    last_seq = 0
+    stage_changes = []  # (from, to, at) for stage_transitions
+    # Check if there's pending media review
+    with metrics.TURN_STAGE_SECONDS.time(stage="db_read"):
+        conversation_doc = await db.find_one("conversations", {"customer_id": sender_id})
+        if conversation_doc and conversation_doc.get('has_media_pending'):
+            # Don't respond until admin reviews media
+            return
+        
+        # Get or create conversation
+        if not conversation_doc:
+            conversation = Conversation(
+                conversation_id=str(uuid.uuid4()),
+                customer_id=sender_id,
+                messages=[],
+                stage="greeting",
+                context={}
+            )
+            conv_data = conversation.model_dump()
+            conv_data["messages"] = db.serialize_list([])
+            conv_data["context"] = db.serialize_dict(conv_data["context"])
+            # customer_id is unique, so a concurrent first message can't create a second row
+            if await db.insert_if_absent("conversations", conv_data):
+                stage_changes.append((None, conversation.stage, conversation.last_updated))
+            else:
+                conversation_doc = await db.find_one("conversations", {"customer_id": sender_id})
+        if conversation_doc:
+            # Only the recent window is loaded; the full history stays in the messages table.
+            # Messages already folded into the summary are left out of it.
+            recent = await db.recent_messages(conversation_doc["conversation_id"], HISTORY_MESSAGE_LIMIT)
+            conversation_doc["context"] = db.deserialize_dict(conversation_doc.get("context", "{}"))
+            summarized_through = conversation_doc["context"].get("summarized_through", 0)
+            conversation_doc["messages"] = [msg for msg in recent if msg["seq"] > summarized_through]
+            last_seq = recent[-1]["seq"] if recent else 0
+            conversation = Conversation(**conversation_doc)
+    
+    # Get products from the in-memory catalog
+    with metrics.TURN_STAGE_SECONDS.time(stage="catalog"):
+        catalog_snapshot = await catalog.snapshot()
+    # Matching uses the whole catalog; only the prompt is capped at MAX_PROMPT_PRODUCTS
+    products = catalog_snapshot.active
+    products_by_id = {p.product_id: p for p in products}
+    
+    # Facts and the order draft are updated from the customer's messages before
+    # replying, so the prompt already knows what was given (or that the order was placed)
+    facts = conversation.context.get("facts", {})
+    draft = conversation.context.get("order_draft", {})
+    updated_facts, updated_draft = facts, draft
+    stage_before_turn = conversation.stage
+    for text in message_texts:
+        facts_before = updated_facts
+        text_product_ids = detect_product_mentions(text, products, catalog_snapshot.version)
+        updated_facts = extract_facts(updated_facts, text, "customer", products_by_id, text_product_ids)
+        updated_draft = order_extractor.update(updated_draft, text, facts_before, updated_facts)
+        order_placed = False
+        if order_extractor.is_confirmation(text) and not order_extractor.missing(updated_draft, updated_facts, products_by_id):
+            order = await place_order(sender_id, updated_draft, updated_facts, products_by_id)
+            updated_facts = {key: value for key, value in updated_facts.items() if key not in ITEM_FACTS}
+            updated_draft = {key: value for key, value in updated_draft.items() if key != "draft_id"}
+            updated_draft["placed_order_id"] = order.order_id
+            order_placed = True
+        # The stage only moves on what this message says
+        stage = stage_tracker.next_stage(conversation.stage, text, text_product_ids, order_placed,
+                                         first_turn=last_seq == 0)
+        if stage != conversation.stage:
+            stage_changes.append((conversation.stage, stage, datetime.now(timezone.utc).isoformat()))
+            conversation.stage = stage
+    conversation.context["facts"] = updated_facts
+    conversation.context["order_draft"] = updated_draft
+    
+    # Answer common questions from templates before paying for an LLM call
+    recent_product_ids = [pid for msg in conversation.messages if msg.sender == "agent" for pid in msg.product_ids]
+    fast_reply = None
+    if FASTPATH_ENABLED:
+        named_product_ids = detect_product_mentions(message_text, products, catalog_snapshot.version)
+        fast_reply = fast_path.respond(message_text, products, recent_product_ids, named_product_ids,
+                                       stage=stage_before_turn, facts=updated_facts)
+    
+    # Get AI response (Graph API latency is measured by the outbox sender)
+    if fast_reply:
+        path = "fastpath"
+        ai_response = fast_reply.text
+        await send_facebook_message(sender_id, ai_response)
+    elif LLM_STREAMING:
+        path = "stream"
+        # Show the typing bubble (without waiting for it) and send the first
+        # sentences while the rest streams in
+        start_sender_action(sender_id, "typing_on")
+        segments = []
+        with metrics.TURN_STAGE_SECONDS.time(stage="llm"):
+            async for segment in stream_ai_response(sender_id, message_text, conversation, products, catalog_snapshot.version):
+                await send_facebook_message(sender_id, segment)
+                segments.append(segment)
+        ai_response = " ".join(segments)
+    else:
+        path = "complete"
+        with metrics.TURN_STAGE_SECONDS.time(stage="llm"):
+            ai_response = await get_ai_response(sender_id, message_text, conversation, products, catalog_snapshot.version)
+        await send_facebook_message(sender_id, ai_response)
+    
+    # Add customer messages
+    new_messages = [Message(sender="customer", text=text) for text in message_texts]
+    conversation.messages.extend(new_messages)
+    
+    # Detect products mentioned
+    mentioned_product_ids = detect_product_mentions(ai_response, products, catalog_snapshot.version)
+    
+    # Send product images if mentioned
+    mentioned_products = [products_by_id[pid] for pid in mentioned_product_ids if pid in products_by_id]
+    await send_product_images(sender_id, mentioned_products[:MAX_REPLY_IMAGES])
+    
+    # Add agent message
+    agent_msg = Message(sender="agent", text=ai_response, product_ids=mentioned_product_ids)
+    conversation.messages.append(agent_msg)
+    new_messages.append(agent_msg)
+    
+    # Update the facts the agent's reply settled (price, delivery charge)
+    conversation.last_updated = datetime.now(timezone.utc).isoformat()
+    updated_facts = extract_facts(updated_facts, ai_response, "agent", products_by_id, mentioned_product_ids)
+    conversation.context["facts"] = updated_facts
+    
+    # Save conversation: append the new messages, update only the row metadata
+    with metrics.TURN_STAGE_SECONDS.time(stage="db_write"):
+        await db.append_messages(conversation.conversation_id, [m.model_dump() for m in new_messages])
+        await db.update_one("conversations", {"conversation_id": conversation.conversation_id}, {
+            "stage": conversation.stage,
+            "last_updated": conversation.last_updated
+        })
+        # Merged rather than overwritten: compaction writes the summary keys concurrently
+        context_patch = db.merge_patch({"facts": facts, "order_draft": draft},
+                                       {"facts": updated_facts, "order_draft": updated_draft})
+        if context_patch:
+            await db.merge_context(conversation.conversation_id, context_patch)
+        for from_stage, to_stage, at in stage_changes:
+            await db.insert_one("stage_transitions", {
+                "conversation_id": conversation.conversation_id,
+                "customer_id": sender_id,
+                "from_stage": from_stage,
+                "to_stage": to_stage,
+                "at": at
+            })
+    metrics.TURN_SECONDS.observe(time.perf_counter() - turn_started, path=path)
+    
+    # Fold older messages into the rolling summary off the reply path
+    last_seq += len(new_messages)
+    if COMPACTION_ENABLED and compactor.needs_compaction(conversation.context, last_seq, conversation.messages):
+        compactor.schedule(conversation.conversation_id, conversation.context, last_seq)
+    
+
+message_coalescer = MessageCoalescer(process_customer_turn, window_seconds=COALESCE_WINDOW_SECONDS,
+                                     max_wait_seconds=COALESCE_MAX_WAIT_SECONDS,
+                                     max_concurrent_turns=MAX_CONCURRENT_TURNS)
+
+message_dedup = MessageDeduplicator(max_size=DEDUP_CACHE_SIZE, ttl_seconds=DEDUP_TTL_SECONDS)
+
+webhook_workers = WorkerPool(process_messaging_event, concurrency=WEBHOOK_WORKERS,
+                             max_queue_size=WEBHOOK_QUEUE_SIZE, name="webhook")
+
+# Queue depths, read when /metrics is scraped
+metrics.Gauge("salesbot_webhook_queue_depth", "Webhook events waiting for a worker", callback=lambda: webhook_workers.depth)
+metrics.Gauge("salesbot_active_customers", "Customers with a buffered or running turn", callback=lambda: message_coalescer.active_customers)
+metrics.Gauge("salesbot_outbox_in_flight", "Send API requests in flight", callback=lambda: message_outbox.stats()["in_flight"])
+metrics.Gauge("salesbot_db_idle_connections", "Idle pooled SQLite connections", callback=db.idle_connections)
+
 @api_router.post("/webhook")
 async def handle_webhook(request: Request, x_hub_signature_256: Optional[str] = Header(None)):
     body = await request.body()
@@ -393,120 +779,20 @@ async def handle_webhook(request: Request, x_hub_signature_256: Optional[str] =
         if not verify_facebook_signature(body, x_hub_signature_256):
             raise HTTPException(status_code=403, detail="Invalid signature")
     
-    data = await request.json()
+    data = json.loads(body)
     
+    # Acknowledge immediately; the turns run on the background worker pool
     if data.get('object') == 'page':
         for entry in data.get('entry', []):
             for messaging_event in entry.get('messaging', []):
                 if messaging_event.get('message'):
-                    sender_id = messaging_event['sender']['id']
-                    message = messaging_event['message']
-                    message_text = message.get('text', '')
-                    
-                    # Check for media (images, videos, voice, files)
-                    has_media = any([
-                        message.get('attachments'),
-                        message.get('sticker_id')
-                    ])
-                    
-                    if has_media:
-                        # Customer sent media - create notification for admin
-                        media_type = "unknown"
-                        media_url = ""
-                        
-                        if message.get('attachments'):
-                            attachment = message['attachments'][0]
-                            media_type = attachment.get('type', 'file')
-                            media_url = attachment.get('payload', {}).get('url', '')
-                        
-                        # Create media notification in database
-                        media_notification = {
-                            "notification_id": str(uuid.uuid4()),
-                            "customer_id": sender_id,
-                            "media_type": media_type,
-                            "media_url": media_url,
-                            "status": "pending",  # pending, reviewed
-                            "admin_response": "",
-                            "created_at": datetime.now(timezone.utc).isoformat()
-                        }
-                        await db.insert_one("media_notifications", media_notification)
-                        
-                        # Mark conversation as having pending media
-                        await db.update_one("conversations", {"customer_id": sender_id}, 
-                                          {"has_media_pending": 1})
-                        
-                        # Bot stays silent - no response
-                        continue
-                    
-                    if not message_text:
-                        continue
-                    
-                    # Check if there's pending media review
-                    conversation_doc = await db.find_one("conversations", {"customer_id": sender_id})
-                    if conversation_doc and conversation_doc.get('has_media_pending'):
-                        # Don't respond until admin reviews media
-                        continue
-                    
-                    # Get or create conversation
-                    if not conversation_doc:
-                        conversation = Conversation(
-                            conversation_id=str(uuid.uuid4()),
-                            customer_id=sender_id,
-                            messages=[],
-                            stage="greeting",
-                            context={}
-                        )
-                        conv_data = conversation.model_dump()
-                        conv_data["messages"] = db.serialize_list(conv_data["messages"])
-                        conv_data["context"] = db.serialize_dict(conv_data["context"])
-                        await db.insert_one("conversations", conv_data)
-                    else:
-                        conversation_doc["messages"] = db.deserialize_list(conversation_doc.get("messages", "[]"))
-                        conversation_doc["context"] = db.deserialize_dict(conversation_doc.get("context", "{}"))
-                        conversation = Conversation(**conversation_doc)
-                    
-                    # Get products
-                    products_docs = await db.find_many("products", {"active": 1}, limit=100)
-                    products = []
-                    for p in products_docs:
-                        p["colors"] = db.deserialize_list(p.get("colors", "[]"))
-                        p["sizes"] = db.deserialize_list(p.get("sizes", "[]"))
-                        p["images"] = db.deserialize_list(p.get("images", "[]"))
-                        p["active"] = bool(p.get("active", 1))
-                        products.append(Product(**p))
-                    
-                    # Add customer message
-                    customer_msg = Message(sender="customer", text=message_text)
-                    conversation.messages.append(customer_msg)
-                    
-                    # Get AI response
-                    ai_response = await get_ai_response(sender_id, message_text, conversation, products)
-                    
-                    # Detect products mentioned
-                    mentioned_product_ids = detect_product_mentions(ai_response, products)
-                    
-                    # Send response
-                    await send_facebook_message(sender_id, ai_response)
-                    
-                    # Send product images if mentioned
-                    for product_id in mentioned_product_ids[:3]:  # Max 3 images
-                        product = next((p for p in products if p.product_id == product_id), None)
-                        if product and product.images:
-                            await send_facebook_image(sender_id, product.images[0])
-                    
-                    # Add agent message
-                    agent_msg = Message(sender="agent", text=ai_response, product_ids=mentioned_product_ids)
-                    conversation.messages.append(agent_msg)
-                    
-                    # Update stage
-                    conversation.stage = detect_stage(conversation.messages)
-                    conversation.last_updated = datetime.now(timezone.utc).isoformat()
-                    
-                    # Save conversation
-                    conv_data = conversation.model_dump()
-                    conv_data["messages"] = db.serialize_list(conv_data["messages"])
-                    conv_data["context"] = db.serialize_dict(conv_data["context"])
-                    await db.update_one("conversations", {"customer_id": sender_id}, conv_data)
+                    try:
+                        webhook_workers.submit(messaging_event)
+                    except QueueFullError as e:
+                        metrics.WEBHOOK_EVENTS.inc(outcome="rejected")
+                        # Facebook redelivers on non-200, so shed load instead of timing out
+                        logging.warning(f"Webhook backpressure: {e}")
+                        raise HTTPException(status_code=503, detail="Webhook queue is full")
                     
     return {"status": "ok"}
 
@@ -519,17 +805,14 @@ async def login(request: LoginRequest):
     raise HTTPException(status_code=401, detail="Invalid password")
 
 # Products
-@api_router.get("/admin/products", response_model=List[Product])
+@api_router.get("/admin/products", response_model=List[ProductListItem])
 async def get_products(current_user: dict = Depends(get_current_user)):
-    products_docs = await db.find_many("products")
-    products = []
-    for p in products_docs:
-        p["colors"] = db.deserialize_list(p.get("colors", "[]"))
-        p["sizes"] = db.deserialize_list(p.get("sizes", "[]"))
-        p["images"] = db.deserialize_list(p.get("images", "[]"))
-        p["active"] = bool(p.get("active", 1))
-        products.append(Product(**p))
-    return products
+    products = await catalog.products()
+    thumbnails = await thumbnails_for(p.images[0] for p in products if p.images)
+    return [
+        {**p.model_dump(), "thumbnail_url": thumbnails.get(p.images[0]) if p.images else None}
+        for p in products
+    ]
 
 @api_router.post("/admin/products", response_model=Product)
 async def create_product(product: ProductCreate, current_user: dict = Depends(get_current_user)):
@@ -538,8 +821,10 @@ async def create_product(product: ProductCreate, current_user: dict = Depends(ge
     product_data["colors"] = db.serialize_list(product_data["colors"])
     product_data["sizes"] = db.serialize_list(product_data["sizes"])
     product_data["images"] = db.serialize_list(product_data["images"])
+    product_data["aliases"] = db.serialize_list(product_data["aliases"])
     product_data["active"] = 1 if product_data["active"] else 0
     await db.insert_one("products", product_data)
+    await catalog.refresh()
     return new_product
 
 @api_router.put("/admin/products/{product_id}", response_model=Product)
@@ -549,35 +834,82 @@ async def update_product(product_id: str, product: ProductCreate, current_user:
         raise HTTPException(status_code=404, detail="Product not found")
     
     updated_product = Product(**{**product.model_dump(), "product_id": product_id, "created_at": existing['created_at']})
+    old_images = db.deserialize_list(existing.get("images", "[]"))
     product_data = updated_product.model_dump()
     product_data["colors"] = db.serialize_list(product_data["colors"])
     product_data["sizes"] = db.serialize_list(product_data["sizes"])
     product_data["images"] = db.serialize_list(product_data["images"])
+    product_data["aliases"] = db.serialize_list(product_data["aliases"])
     product_data["active"] = 1 if product_data["active"] else 0
     await db.update_one("products", {"product_id": product_id}, product_data)
+    if old_images != updated_product.images:
+        await attachment_cache.invalidate(old_images)
+    await catalog.refresh()
     return updated_product
 
 @api_router.delete("/admin/products/{product_id}")
 async def delete_product(product_id: str, current_user: dict = Depends(get_current_user)):
-    deleted_count = await db.delete_one("products", {"product_id": product_id})
-    if deleted_count == 0:
+    existing = await db.find_one("products", {"product_id": product_id})
+    if not existing:
         raise HTTPException(status_code=404, detail="Product not found")
+    await db.delete_one("products", {"product_id": product_id})
+    await attachment_cache.invalidate(db.deserialize_list(existing.get("images", "[]")))
+    await catalog.refresh()
     return {"success": True}
 
 @api_router.post("/admin/upload-image")
 async def upload_image(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    contents = await file.read()
-    image_url = await upload_to_imgbb(contents)
-    return {"url": image_url}
+    return await ingest_image(file)
 
 # Orders
+ORDERS_SORT = [("created_at", -1), ("order_id", -1)]
+
+def encode_cursor(order: Dict[str, Any]) -> str:
+    raw = json.dumps([order.get("created_at"), order["order_id"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return (created_at, order_id)
+
 @api_router.get("/admin/orders")
-async def get_orders(current_user: dict = Depends(get_current_user)):
-    orders_docs = await db.find_many("orders", limit=1000)
+async def get_orders(limit: int = 50, cursor: Optional[str] = None, status: Optional[str] = None,
+                     district: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                     current_user: dict = Depends(get_current_user)):
+    # Newest first, paged by (created_at, order_id) so every page is one index range scan
+    limit = max(1, min(limit, ORDERS_PAGE_MAX))
+    filters: Dict[str, Any] = {}
+    if status:
+        filters["status"] = status
+    if district:
+        filters["district"] = district
+    created_at: Dict[str, str] = {}
+    try:
+        if date_from:
+            created_at["$gte"] = datetime.fromisoformat(date_from).date().isoformat()
+        if date_to:
+            # date_to is inclusive: everything before the start of the next day
+            created_at["$lt"] = (datetime.fromisoformat(date_to).date() + timedelta(days=1)).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if created_at:
+        filters["created_at"] = created_at
+    
+    after = decode_cursor(cursor) if cursor else None
+    orders_docs = await db.find_many("orders", filters, limit=limit + 1, sort=ORDERS_SORT, after=after)
+    has_more = len(orders_docs) > limit
+    orders_docs = orders_docs[:limit]
     for order in orders_docs:
         if order.get("items"):
             order["items"] = db.deserialize_list(order["items"])
-    return sorted(orders_docs, key=lambda x: x.get("created_at", ""), reverse=True)
+    
+    return {
+        "orders": orders_docs,
+        "next_cursor": encode_cursor(orders_docs[-1]) if has_more else None
+    }
 
 @api_router.get("/admin/orders/{order_id}")
 async def get_order(order_id: str, current_user: dict = Depends(get_current_user)):
@@ -594,43 +926,130 @@ async def update_order_status(order_id: str, request: UpdateStatusRequest, curre
     if not existing:
         raise HTTPException(status_code=404, detail="Order not found")
     await db.update_one("orders", {"order_id": order_id}, {"status": request.status})
+    publish_order("order.updated", {**existing, "status": request.status}, previous_status=existing.get("status"))
     return {"success": True}
 
 # Analytics
 @api_router.get("/admin/analytics")
 async def get_analytics(current_user: dict = Depends(get_current_user)):
+    # Totals come from the daily_order_stats rollup (whole UTC days), so the
+    # cost doesn't grow with order history
     now = datetime.now(timezone.utc)
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
-    week_start = (now - timedelta(days=7)).isoformat()
-    month_start = (now - timedelta(days=30)).isoformat()
+    today_start = now.date().isoformat()
+    week_start = (now - timedelta(days=7)).date().isoformat()
+    month_start = (now - timedelta(days=30)).date().isoformat()
     
-    # Get orders
-    all_orders = await db.find_many("orders", limit=1000)
+    today = await db.order_stats_since(today_start)
+    week = await db.order_stats_since(week_start)
+    month = await db.order_stats_since(month_start)
     
-    today_orders = [o for o in all_orders if o.get('created_at', '') >= today_start]
-    week_orders = [o for o in all_orders if o.get('created_at', '') >= week_start]
-    month_orders = [o for o in all_orders if o.get('created_at', '') >= month_start]
+    recent_orders = await db.find_many("orders", limit=10, sort=[("created_at", -1)])
+    for order in recent_orders:
+        if order.get("items"):
+            order["items"] = db.deserialize_list(order["items"])
     
     # Get pending media notifications
     pending_media = await db.count_documents("media_notifications", {"status": "pending"})
     
     return {
-        "today": {
-            "orders": len(today_orders),
-            "revenue": sum(o.get('total_amount', 0) for o in today_orders)
-        },
-        "week": {
-            "orders": len(week_orders),
-            "revenue": sum(o.get('total_amount', 0) for o in week_orders)
-        },
-        "month": {
-            "orders": len(month_orders),
-            "revenue": sum(o.get('total_amount', 0) for o in month_orders)
-        },
-        "recent_orders": all_orders[:10],
+        "today": today,
+        "week": week,
+        "month": month,
+        "recent_orders": recent_orders,
         "pending_media": pending_media
     }
 
+# Fast-path responder
+@api_router.get("/admin/fastpath/stats")
+async def get_fastpath_stats(current_user: dict = Depends(get_current_user)):
+    return fast_path.stats()
+
+@api_router.post("/admin/events/ticket")
+async def create_admin_events_ticket(current_user: dict = Depends(get_current_user)):
+    """Single-use ticket for opening /admin/events from an EventSource"""
+    return {"ticket": issue_events_ticket(), "expires_in": ADMIN_EVENTS_TICKET_SECONDS}
+
+@api_router.get("/admin/events")
+async def stream_admin_events(ticket: Optional[str] = None, last_event_id: Optional[str] = None,
+                              authorization: Optional[str] = Header(None),
+                              last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """Server-sent events stream of admin dashboard deltas
+
+    EventSource can't set headers, so browsers pass a ticket from
+    POST /admin/events/ticket as ?ticket= (other clients may send the JWT as
+    a Bearer header). A reconnecting client sends Last-Event-ID (or
+    ?last_event_id=) and gets the events it missed, or a "reset" event
+    telling it to re-fetch.
+    """
+    if authorization and authorization.startswith("Bearer "):
+        verify_jwt_token(authorization[len("Bearer "):])
+    elif not ticket or not redeem_events_ticket(ticket):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    async def stream():
+        deadline = time.monotonic() + ADMIN_EVENTS_STREAM_SECONDS
+        yield "retry: 3000\n\n"
+        events = admin_events.subscribe(last_event_id_header or last_event_id,
+                                        heartbeat=ADMIN_EVENTS_HEARTBEAT_SECONDS)
+        async with aclosing(events):
+            async for event in events:
+                yield ": keepalive\n\n" if event is None else event.encode()
+                if time.monotonic() >= deadline:
+                    break
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.get("/admin/events/stats")
+async def get_admin_events_stats(current_user: dict = Depends(get_current_user)):
+    return admin_events.stats()
+
+@api_router.get("/admin/funnel")
+async def get_funnel(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                     current_user: dict = Depends(get_current_user)):
+    """Conversations reaching each stage, from the recorded stage transitions"""
+    now = datetime.now(timezone.utc)
+    try:
+        since = datetime.fromisoformat(date_from).date() if date_from else (now - timedelta(days=30)).date()
+        # date_to is inclusive: everything before the start of the next day
+        until = (datetime.fromisoformat(date_to).date() if date_to else now.date()) + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    
+    reached = await db.stage_funnel(list(STAGES), since.isoformat(), until.isoformat())
+    funnel = []
+    previous = None
+    for stage in STAGES:
+        durations = sorted(await db.stage_durations(STAGES[0], stage, since.isoformat(), until.isoformat()))
+        funnel.append({
+            "stage": stage,
+            "conversations": reached[stage],
+            "conversion": round(reached[stage] / previous, 3) if previous else None,
+            "median_seconds_from_greeting": durations[len(durations) // 2] if durations else None
+        })
+        previous = reached[stage]
+    return {"date_from": since.isoformat(), "date_to": (until - timedelta(days=1)).isoformat(), "funnel": funnel}
+
+@api_router.get("/admin/llm/stats")
+async def get_llm_stats(current_user: dict = Depends(get_current_user)):
+    return llm_client.stats()
+
+@api_router.get("/admin/compaction/stats")
+async def get_compaction_stats(current_user: dict = Depends(get_current_user)):
+    return compactor.stats()
+
+@api_router.get("/admin/outbox/stats")
+async def get_outbox_stats(current_user: dict = Depends(get_current_user)):
+    dead_letters = await db.find_many("outbox", {"status": "dead"}, limit=20, sort=[("outbox_id", -1)])
+    for message in dead_letters:
+        message["payload"] = json.loads(message["payload"])
+    return {
+        "counts": await db.outbox_counts(),
+        **message_outbox.stats(),
+        "attachments": attachment_cache.stats(),
+        "dead_letters": dead_letters
+    }
+
 # Media Notifications
 @api_router.get("/admin/media-notifications")
 async def get_media_notifications(current_user: dict = Depends(get_current_user)):
@@ -652,6 +1071,7 @@ async def respond_to_media(notification_id: str, response_text: str, current_use
     
     await db.update_one("conversations", {"customer_id": notification['customer_id']}, 
                        {"has_media_pending": 0})
+    admin_events.publish("media.reviewed", {"notification_id": notification_id})
     
     return {"success": True}
 
@@ -665,8 +1085,8 @@ async def get_payment_qr(current_user: dict = Depends(get_current_user)):
 
 @api_router.post("/admin/payment-qr")
 async def create_payment_qr(file: UploadFile = File(...), payment_method: str = "esewa", account_name: str = "", current_user: dict = Depends(get_current_user)):
-    contents = await file.read()
-    qr_url = await upload_to_imgbb(contents)
+    # Lossless so the QR code stays scannable
+    qr_url = (await ingest_image(file, lossless=True))["url"]
     
     qr = PaymentQR(
         payment_method=payment_method,
@@ -700,6 +1120,18 @@ app.add_middleware(
 # Include router AFTER middleware
 app.include_router(api_router)
 
+@app.get("/metrics")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    for status, count in (await db.outbox_counts()).items():
+        metrics.OUTBOX_MESSAGES.set(count, status=status)
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+if IMAGE_STORAGE == "local":
+    # Under /api so the same ingress rule routes it to the backend
+    app.mount("/api/uploads", StaticFiles(directory=IMAGE_DIR), name="uploads")
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -708,8 +1140,29 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
+    await db.open_pool(DB_POOL_SIZE)
+    http_clients.open_clients()
     await db.init_db()
     logging.info("SQLite database initialized")
+    if IMAGE_STORAGE == "local" and not PUBLIC_BASE_URL:
+        logging.error("IMAGE_STORAGE is local but PUBLIC_BASE_URL is not set: uploaded images get relative "
+                      "/api/uploads URLs that Messenger can't fetch and the admin panel can't show. Set "
+                      "PUBLIC_BASE_URL to this backend's public origin, or set IMGBB_API_KEY.")
+    await catalog.refresh()
+    await message_outbox.start()
+    await webhook_workers.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await webhook_workers.stop(WEBHOOK_DRAIN_TIMEOUT)
+    await message_coalescer.drain(WEBHOOK_DRAIN_TIMEOUT)
+    await compactor.drain(WEBHOOK_DRAIN_TIMEOUT)
+    if sender_action_tasks:
+        await asyncio.wait(list(sender_action_tasks), timeout=WEBHOOK_DRAIN_TIMEOUT)
+    await message_outbox.stop(WEBHOOK_DRAIN_TIMEOUT)
+    await http_clients.close_clients()
+    await db.close_pool()
+    logging.info("SQLite connection pool closed")
 
 if __name__ == "__main__":
     import uvicorn
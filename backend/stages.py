@@ -0,0 +1,69 @@
+import re
+from typing import Dict, FrozenSet, Sequence
+from text_patterns import words
+
+# Conversation stages in funnel order
+STAGES = ("greeting", "browsing", "negotiation", "ordering", "completed")
+STAGE_RANK = {stage: rank for rank, stage in enumerate(STAGES)}
+
+# Moves customer messages may cause. Everything else is ignored, so a price
+# question while ordering no longer drops the conversation back to
+# negotiation. ordering -> browsing only happens on an explicit cancel;
+# completed conversations start over when the customer shops again. Saving
+# an order moves any stage to completed.
+TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    "greeting": frozenset({"browsing", "negotiation", "ordering"}),
+    "browsing": frozenset({"negotiation", "ordering"}),
+    "negotiation": frozenset({"ordering"}),
+    "ordering": frozenset({"browsing"}),
+    "completed": frozenset({"browsing", "negotiation", "ordering"}),
+}
+
+# Customer-message signals (English, Romanized Nepali and Devanagari)
+SIGNALS = {
+    "ordering": words(r'order\w*', r'kin(?:chu|chhu|nu|na)', r'lin(?:chu|chhu)', r'linu', r'garchu', r'buy',
+                      r'confirm\w*', r'pathaidinus', r'pathau(?:nus|nu)',
+                      r'अर्डर', r'किन्छु', r'लिन्छु', r'पठाइदिनुस'),
+    "negotiation": words(r'price', r'kat+i', r'discount', r'mehe?nga', r'sasto', r'kam\s*gar\w*', r'ghata\w*',
+                         r'last\s*price', r'rate', r'offer', r'कति', r'छुट', r'महँगो', r'सस्तो'),
+    "cancel": words(r'cancel\w*', r'pardaina', r'chaindaina', r'chahindaina', r'na\s*pathaunus', r'रद्द',
+                    r'चाहिँदैन', r'पर्दैन'),
+    "greeting": words(r'hi+', r'hello', r'hey', r'namaste', r'namaskar', r'नमस्ते', r'नमस्कार'),
+}
+
+class StageTracker:
+    """Advances conversation.stage from the newest customer message only
+
+    Each signal names a target stage; the furthest allowed target wins.
+    Placing an order moves the conversation to completed. A message without
+    signals leaves the stage unchanged, except that anything past a first
+    hello moves a greeting on to browsing.
+    """
+
+    def __init__(self, transitions: Dict[str, FrozenSet[str]] = TRANSITIONS):
+        self.transitions = transitions
+
+    def next_stage(self, stage: str, text: str, product_ids: Sequence[str] = (),
+                   order_placed: bool = False, first_turn: bool = False) -> str:
+        stage = stage if stage in self.transitions else "greeting"
+        if order_placed:
+            # A saved order completes the conversation whatever stage it was in
+            return "completed"
+        allowed = self.transitions[stage]
+        cancelled = SIGNALS["cancel"].search(text)
+        if stage == "ordering":
+            # The only way out of ordering other than an order is an explicit cancel
+            return "browsing" if cancelled and "browsing" in allowed else stage
+        if cancelled:
+            return stage
+
+        targets = []
+        if SIGNALS["ordering"].search(text):
+            targets.append("ordering")
+        if SIGNALS["negotiation"].search(text):
+            targets.append("negotiation")
+        # A first message that is only a hello stays a greeting
+        if product_ids or (stage == "greeting" and not (first_turn and SIGNALS["greeting"].search(text))):
+            targets.append("browsing")
+        reachable = [target for target in targets if target in allowed]
+        return max(reachable, key=STAGE_RANK.__getitem__) if reachable else stage
@@ -0,0 +1,17 @@
+import re
+
+# Regex building blocks shared by the rule-based parsers of customer messages
+# (English, Romanized Nepali and Devanagari)
+
+# The Devanagari block, for use inside character classes
+DEVANAGARI = 'ऀ-ॿ'
+
+# \b is unreliable next to Devanagari vowel signs, so spell the word edges out
+EDGE_BEFORE = r'(?<![\w' + DEVANAGARI + '])'
+EDGE_AFTER = r'(?![\w' + DEVANAGARI + '])'
+
+DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+
+def words(*patterns: str) -> re.Pattern:
+    """Case-insensitive pattern matching any of patterns as a whole word"""
+    return re.compile(EDGE_BEFORE + '(?:' + '|'.join(patterns) + ')' + EDGE_AFTER, re.IGNORECASE)
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+class QueueFullError(Exception):
+    """Raised when the worker queue has reached its depth limit"""
+
+class WorkerPool:
+    """Bounded asyncio worker pool draining a queue of jobs"""
+
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], concurrency: int = 8,
+                 max_queue_size: int = 1000, name: str = "worker"):
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """Spawn the worker tasks"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._accepting = True
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"{self.name}-{i}")
+            for i in range(self.concurrency)
+        ]
+        logging.info(f"Started {self.concurrency} {self.name} workers (queue limit {self.max_queue_size})")
+
+    def submit(self, job: Any):
+        """Enqueue a job without waiting, raising QueueFullError on overflow"""
+        if not self._accepting:
+            raise QueueFullError(f"{self.name} pool is not accepting jobs")
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(f"{self.name} queue is full ({self.max_queue_size} jobs)")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Stop accepting jobs, drain the queue and cancel the workers"""
+        if not self._tasks:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{self.name} pool drain timed out with {self.depth} jobs left")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.handler(job)
+            except Exception as e:
+                logging.exception(f"{self.name} job failed: {e}")
+            finally:
+                self._queue.task_done()
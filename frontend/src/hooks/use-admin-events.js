@@ -0,0 +1,65 @@
+import { useEffect, useRef } from 'react';
+import axios from 'axios';
+import { API } from '../App';
+
+const RECONNECT_DELAY_MS = 3000;
+
+// Subscribes to the backend's admin event stream while the component is mounted.
+// handlers maps event types ("order.created", "order.updated", "media.created",
+// "media.reviewed", and "reset" when missed events can't be replayed and the page
+// should re-fetch) to callbacks receiving the parsed event data. EventSource can't
+// send the Authorization header, so every connection opens with a single-use ticket
+// from POST /admin/events/ticket; a used ticket can't be retried, so reconnects are
+// done here, passing the last event id so the server replays what was missed.
+export function useAdminEvents(handlers) {
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+  const eventTypes = Object.keys(handlers).sort().join(',');
+
+  useEffect(() => {
+    if (!localStorage.getItem('admin_token') || typeof EventSource === 'undefined') return undefined;
+
+    let source = null;
+    let timer = null;
+    let closed = false;
+    let lastEventId = '';
+
+    const reconnect = () => {
+      if (!closed) timer = setTimeout(connect, RECONNECT_DELAY_MS);
+    };
+
+    async function connect() {
+      let ticket;
+      try {
+        ({ ticket } = (await axios.post(`${API}/admin/events/ticket`)).data);
+      } catch (error) {
+        // Logged out or token expired: stop instead of retrying forever
+        if (error.response?.status !== 401) reconnect();
+        return;
+      }
+      if (closed) return;
+
+      const params = new URLSearchParams({ ticket });
+      if (lastEventId) params.set('last_event_id', lastEventId);
+      source = new EventSource(`${API}/admin/events?${params}`);
+      eventTypes.split(',').forEach((type) => {
+        source.addEventListener(type, (event) => {
+          if (event.lastEventId) lastEventId = event.lastEventId;
+          const handler = handlersRef.current[type];
+          if (handler) handler(event.data ? JSON.parse(event.data) : {});
+        });
+      });
+      source.onerror = () => {
+        source.close();
+        reconnect();
+      };
+    }
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      if (source) source.close();
+    };
+  }, [eventTypes]);
+}
@@ -3,6 +3,7 @@ import axios from 'axios';
 import { API } from '../App';
 import { useNavigate } from 'react-router-dom';
 import { toast } from 'sonner';
+import { useAdminEvents } from '../hooks/use-admin-events';
 import { LayoutDashboard, Package, ShoppingBag, LogOut, TrendingUp, Calendar, DollarSign } from 'lucide-react';
 
 const Dashboard = ({ onLogout }) => {
@@ -14,6 +15,36 @@ const Dashboard = ({ onLogout }) => {
     loadAnalytics();
   }, []);
 
+  // New orders are created now, so they count towards every period
+  const addToTotals = (totals, order) => ({
+    orders: (totals?.orders || 0) + 1,
+    revenue: (totals?.revenue || 0) + (order.total_amount || 0)
+  });
+
+  useAdminEvents({
+    'order.created': ({ order }) => setAnalytics((current) => current && {
+      ...current,
+      today: addToTotals(current.today, order),
+      week: addToTotals(current.week, order),
+      month: addToTotals(current.month, order),
+      recent_orders: [order, ...(current.recent_orders || [])
+        .filter((recent) => recent.order_id !== order.order_id)].slice(0, 10)
+    }),
+    'order.updated': ({ order }) => setAnalytics((current) => current && {
+      ...current,
+      recent_orders: (current.recent_orders || [])
+        .map((recent) => recent.order_id === order.order_id ? order : recent)
+    }),
+    'media.created': () => {
+      setAnalytics((current) => current && { ...current, pending_media: (current.pending_media || 0) + 1 });
+      toast.info('A customer sent a photo');
+    },
+    'media.reviewed': () => setAnalytics((current) => current && {
+      ...current, pending_media: Math.max((current.pending_media || 0) - 1, 0)
+    }),
+    reset: () => loadAnalytics()
+  });
+
   const loadAnalytics = async () => {
     try {
       const response = await axios.get(`${API}/admin/analytics`);
@@ -148,7 +179,7 @@ const Dashboard = ({ onLogout }) => {
                 <div key={order.order_id} className="flex items-center justify-between p-4 bg-white rounded-lg hover:shadow-md transition-shadow" data-testid="recent-order">
                   <div>
                     <p className="font-semibold text-gray-900">{order.customer_name}</p>
-                    <p className="text-sm text-gray-600">{order.phone}</p>
+                    <p className="text-sm text-gray-600">{order.phone_primary}</p>
                   </div>
                   <div className="text-right">
                     <p className="font-bold text-purple-600">Rs. {order.total_amount}</p>
@@ -1,31 +1,102 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef, useCallback } from 'react';
 import axios from 'axios';
 import { API } from '../App';
 import { useNavigate } from 'react-router-dom';
 import { toast } from 'sonner';
+import { useAdminEvents } from '../hooks/use-admin-events';
 import { LayoutDashboard, Package, ShoppingBag, LogOut, Search } from 'lucide-react';
 
+const PAGE_SIZE = 50;
+
 const Orders = ({ onLogout }) => {
   const navigate = useNavigate();
   const [orders, setOrders] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
   const [filterStatus, setFilterStatus] = useState('all');
+  const [filterDistrict, setFilterDistrict] = useState('');
+  const [dateFrom, setDateFrom] = useState('');
+  const [dateTo, setDateTo] = useState('');
+  const [reloadKey, setReloadKey] = useState(0);
+  const sentinelRef = useRef(null);
+
+  // Status, district and dates are filtered on the server; search only narrows the loaded pages
+  const fetchPage = useCallback(async (cursor) => {
+    const params = { limit: PAGE_SIZE };
+    if (cursor) params.cursor = cursor;
+    if (filterStatus !== 'all') params.status = filterStatus;
+    if (filterDistrict.trim()) params.district = filterDistrict.trim();
+    if (dateFrom) params.date_from = dateFrom;
+    if (dateTo) params.date_to = dateTo;
+    const response = await axios.get(`${API}/admin/orders`, { params });
+    return response.data;
+  }, [filterStatus, filterDistrict, dateFrom, dateTo]);
 
   useEffect(() => {
+    let cancelled = false;
+    const loadOrders = async () => {
+      try {
+        const page = await fetchPage(null);
+        if (cancelled) return;
+        setOrders(page.orders);
+        setNextCursor(page.next_cursor);
+      } catch (error) {
+        if (!cancelled) toast.error('Failed to load orders');
+      } finally {
+        if (!cancelled) setLoading(false);
+      }
+    };
     loadOrders();
-  }, []);
+    return () => { cancelled = true; };
+  }, [fetchPage, reloadKey]);
 
-  const loadOrders = async () => {
+  // Mirrors the server-side filters so streamed orders land in the right list
+  const matchesFilters = useCallback((order) => {
+    const day = (order.created_at || '').slice(0, 10);
+    return (filterStatus === 'all' || order.status === filterStatus) &&
+      (!filterDistrict.trim() || order.district === filterDistrict.trim()) &&
+      (!dateFrom || day >= dateFrom) &&
+      (!dateTo || day <= dateTo);
+  }, [filterStatus, filterDistrict, dateFrom, dateTo]);
+
+  useAdminEvents({
+    'order.created': ({ order }) => {
+      if (!matchesFilters(order)) return;
+      setOrders((current) => current.some((existing) => existing.order_id === order.order_id)
+        ? current
+        : [order, ...current]);
+    },
+    'order.updated': ({ order }) => setOrders((current) => current
+      .map((existing) => existing.order_id === order.order_id ? order : existing)
+      .filter(matchesFilters)),
+    reset: () => setReloadKey((key) => key + 1)
+  });
+
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
     try {
-      const response = await axios.get(`${API}/admin/orders`);
-      setOrders(response.data);
+      const page = await fetchPage(nextCursor);
+      setOrders((current) => [...current, ...page.orders]);
+      setNextCursor(page.next_cursor);
     } catch (error) {
-      toast.error('Failed to load orders');
+      toast.error('Failed to load more orders');
     } finally {
-      setLoading(false);
+      setLoadingMore(false);
     }
-  };
+  }, [fetchPage, nextCursor, loadingMore]);
+
+  useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || !nextCursor) return;
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) loadMore();
+    }, { rootMargin: '200px' });
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [loadMore, nextCursor]);
 
   const handleLogout = () => {
     onLogout();
@@ -36,21 +107,19 @@ const Orders = ({ onLogout }) => {
     try {
       await axios.put(`${API}/admin/orders/${orderId}/status`, { status: newStatus });
       toast.success('Order status updated');
-      loadOrders();
+      setOrders((current) => current
+        .map((order) => order.order_id === orderId ? { ...order, status: newStatus } : order)
+        .filter(matchesFilters));
     } catch (error) {
       toast.error('Failed to update order status');
     }
   };
 
   const filteredOrders = orders.filter(order => {
-    const matchesSearch = 
-      order.customer_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-      order.phone.includes(searchTerm) ||
-      order.order_id.toLowerCase().includes(searchTerm.toLowerCase());
-    
-    const matchesStatus = filterStatus === 'all' || order.status === filterStatus;
-    
-    return matchesSearch && matchesStatus;
+    const term = searchTerm.toLowerCase();
+    return (order.customer_name || '').toLowerCase().includes(term) ||
+      (order.phone_primary || '').includes(searchTerm) ||
+      order.order_id.toLowerCase().includes(term);
   });
 
   if (loading) {
@@ -118,8 +187,8 @@ const Orders = ({ onLogout }) => {
 
         {/* Filters */}
         <div className="glass-effect rounded-2xl p-6 mb-6">
-          <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
-            <div className="relative">
+          <div className="grid grid-cols-1 md:grid-cols-5 gap-4">
+            <div className="relative md:col-span-2">
               <Search className="absolute left-3 top-3 w-5 h-5 text-gray-400" />
               <input
                 type="text"
@@ -143,6 +212,30 @@ const Orders = ({ onLogout }) => {
               <option value="delivered">Delivered</option>
               <option value="cancelled">Cancelled</option>
             </select>
+            <input
+              type="text"
+              placeholder="District"
+              value={filterDistrict}
+              onChange={(e) => setFilterDistrict(e.target.value)}
+              className="input-field"
+              data-testid="filter-district-input"
+            />
+            <div className="flex gap-2">
+              <input
+                type="date"
+                value={dateFrom}
+                onChange={(e) => setDateFrom(e.target.value)}
+                className="input-field"
+                data-testid="filter-date-from"
+              />
+              <input
+                type="date"
+                value={dateTo}
+                onChange={(e) => setDateTo(e.target.value)}
+                className="input-field"
+                data-testid="filter-date-to"
+              />
+            </div>
           </div>
         </div>
 
@@ -173,7 +266,7 @@ const Orders = ({ onLogout }) => {
                   <tr key={order.order_id} data-testid="order-row">
                     <td className="font-mono text-sm">{order.order_id.substring(0, 8)}...</td>
                     <td className="font-semibold">{order.customer_name}</td>
-                    <td>{order.phone}</td>
+                    <td>{order.phone_primary}</td>
                     <td>{order.items?.length || 0} item(s)</td>
                     <td className="font-bold text-purple-600">Rs. {order.total_amount}</td>
                     <td>
@@ -219,6 +312,10 @@ const Orders = ({ onLogout }) => {
                 ))}
               </tbody>
             </table>
+            <div ref={sentinelRef} data-testid="orders-sentinel" />
+            {loadingMore && (
+              <div className="py-4 text-center text-sm text-purple-600">Loading more...</div>
+            )}
           </div>
         )}
       </main>
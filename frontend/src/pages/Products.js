@@ -19,6 +19,7 @@ const Products = ({ onLogout }) => {
     description: '',
     colors: '',
     sizes: '',
+    aliases: '',
     stock: '',
     active: true
   });
@@ -54,6 +55,7 @@ const Products = ({ onLogout }) => {
       description: '',
       colors: '',
       sizes: '',
+      aliases: '',
       stock: '',
       active: true
     });
@@ -70,6 +72,7 @@ const Products = ({ onLogout }) => {
       description: product.description || '',
       colors: product.colors.join(', '),
       sizes: product.sizes.join(', '),
+      aliases: (product.aliases || []).join(', '),
       stock: product.stock,
       active: product.active
     });
@@ -141,6 +144,7 @@ const Products = ({ onLogout }) => {
         description: formData.description,
         colors: formData.colors.split(',').map(c => c.trim()).filter(c => c),
         sizes: formData.sizes.split(',').map(s => s.trim()).filter(s => s),
+        aliases: formData.aliases.split(',').map(a => a.trim()).filter(a => a),
         stock: parseInt(formData.stock),
         images: allImages,
         active: formData.active
@@ -248,7 +252,7 @@ const Products = ({ onLogout }) => {
               <div key={product.product_id} className="product-card" data-testid="product-card">
                 {product.images && product.images.length > 0 ? (
                   <img
-                    src={product.images[0]}
+                    src={product.thumbnail_url || product.images[0]}
                     alt={product.name}
                     className="w-full h-48 object-cover"
                   />
@@ -383,6 +387,18 @@ const Products = ({ onLogout }) => {
               </div>
             </div>
 
+            <div>
+              <label className="block text-sm font-semibold text-gray-700 mb-2">Aliases (comma-separated)</label>
+              <input
+                type="text"
+                value={formData.aliases}
+                onChange={(e) => setFormData({ ...formData, aliases: e.target.value })}
+                className="input-field"
+                placeholder="kurta, कुर्ता, jacket wala"
+                data-testid="product-aliases-input"
+              />
+            </div>
+
             <div className="flex items-center gap-3">
               <input
                 type="checkbox"
@@ -0,0 +1,34 @@
+import asyncio
+import sys
+from pathlib import Path
+import pytest
+
+# Backend modules import each other as top-level modules (import database as db)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import database as db
+
+@pytest.fixture
+def run_db(tmp_path, monkeypatch):
+    """Runs a coroutine function against a fresh, migrated database"""
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "test.db")
+
+    def run(test):
+        async def main():
+            await db.open_pool(2)
+            try:
+                await db.init_db()
+                return await test()
+            finally:
+                await db.close_pool()
+        return asyncio.run(main())
+    return run
+
+@pytest.fixture
+def server(monkeypatch):
+    """The server module, with its in-memory caches reset for the test"""
+    import server
+    from attachments import AttachmentCache
+    monkeypatch.setattr(server, "attachment_cache", AttachmentCache(server.upload_attachment))
+    monkeypatch.setattr(server, "admin_event_tickets", {})
+    return server
@@ -0,0 +1,45 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+
+def request(server, method, path, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://admin.test") as client:
+            return await client.request(method, path, **kwargs)
+    return asyncio.run(send())
+
+def open_stream(server, ticket=None, authorization=None):
+    """Calls the endpoint directly (the stream itself is never iterated)"""
+    return asyncio.run(server.stream_admin_events(ticket=ticket, authorization=authorization,
+                                                  last_event_id_header=None))
+
+def test_ticket_requires_the_admin_jwt(server):
+    assert request(server, "POST", "/api/admin/events/ticket").status_code in (401, 403)
+    response = request(server, "POST", "/api/admin/events/ticket",
+                       headers={"Authorization": f"Bearer {server.create_jwt_token({'admin': True})}"})
+    assert response.status_code == 200
+    assert response.json()["ticket"] in server.admin_event_tickets
+
+def test_ticket_opens_one_stream_only(server):
+    ticket = server.issue_events_ticket()
+    response = open_stream(server, ticket)
+    assert response.media_type == "text/event-stream"
+    with pytest.raises(HTTPException) as error:
+        open_stream(server, ticket)
+    assert error.value.status_code == 401
+
+def test_expired_ticket_and_jwt_in_query_are_rejected(server, monkeypatch):
+    monkeypatch.setattr(server, "ADMIN_EVENTS_TICKET_SECONDS", 0)
+    expired = server.issue_events_ticket()
+    jwt_token = server.create_jwt_token({"admin": True})
+    for ticket in (expired, jwt_token, None):
+        with pytest.raises(HTTPException) as error:
+            open_stream(server, ticket)
+        assert error.value.status_code == 401
+
+def test_bearer_header_still_accepted(server):
+    token = server.create_jwt_token({"admin": True})
+    response = open_stream(server, authorization=f"Bearer {token}")
+    assert response.media_type == "text/event-stream"
@@ -0,0 +1,69 @@
+import asyncio
+import httpx
+import pytest
+import database as db
+import http_clients
+from attachments import AttachmentCache
+from bench.stubs import graph_app
+
+IMAGE = "https://i.ibb.co/abc/kurta.jpg"
+
+@pytest.fixture
+def graph(monkeypatch):
+    """Requests to the Graph API go to the local stub; returns the sends it accepted"""
+    sent = []
+    app = graph_app(latency=0.01, jitter=0.0, on_message=lambda recipient_id, body: sent.append(body))
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://graph.test")
+    monkeypatch.setitem(http_clients._clients, "graph", client)
+    return sent
+
+def test_concurrent_first_sends_share_one_upload(run_db, graph, server):
+    async def scenario():
+        ids = await asyncio.gather(*(server.attachment_cache.attachment_id(IMAGE) for _ in range(5)))
+        stored = await db.find_one("attachment_cache", {"image_url": IMAGE})
+        return ids, stored
+
+    ids, stored = run_db(scenario)
+    assert len(set(ids)) == 1 and ids[0]
+    assert stored["attachment_id"] == ids[0]
+    assert server.attachment_cache.uploads == 1
+
+def test_sends_use_the_cached_id_across_restarts(run_db, graph, server):
+    async def scenario():
+        await server.deliver_message("customer-1", {"attachment": {"type": "image", "payload": {"url": IMAGE}}})
+        # A new process starts with an empty memory cache and reads the table
+        fresh = AttachmentCache(server.upload_attachment)
+        attachment_id = await fresh.attachment_id(IMAGE)
+        return attachment_id, fresh
+
+    attachment_id, fresh = run_db(scenario)
+    assert graph[0]["message"] == {"attachment": {"type": "image", "payload": {"attachment_id": attachment_id}}}
+    assert fresh.uploads == 0 and fresh.hits == 1
+
+def test_invalidate_forces_a_new_upload(run_db, graph, server):
+    async def scenario():
+        cache = server.attachment_cache
+        first = await cache.attachment_id(IMAGE)
+        await cache.invalidate([IMAGE])
+        assert await db.find_one("attachment_cache", {"image_url": IMAGE}) is None
+        second = await cache.attachment_id(IMAGE)
+        return first, second, cache.uploads
+
+    first, second, uploads = run_db(scenario)
+    assert first != second and uploads == 2
+
+def test_failed_upload_is_not_cached(run_db, monkeypatch):
+    calls = []
+
+    async def upload(image_url):
+        calls.append(image_url)
+        raise RuntimeError("Attachment upload error 500")
+
+    async def scenario():
+        cache = AttachmentCache(upload)
+        assert await cache.attachment_id(IMAGE) is None
+        assert await cache.attachment_id(IMAGE) is None
+        return await db.find_one("attachment_cache", {"image_url": IMAGE})
+
+    assert run_db(scenario) is None
+    assert len(calls) == 2
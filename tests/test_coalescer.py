@@ -0,0 +1,93 @@
+import asyncio
+import time
+from coalescer import MessageCoalescer
+
+class Recorder:
+    """Turn handler that records batches and how many turns overlap"""
+
+    def __init__(self, turn_seconds=0.0):
+        self.turn_seconds = turn_seconds
+        self.batches = []
+        self.started = []
+        self.running = {}
+        self.max_running = {}
+        self.max_total = 0
+
+    async def __call__(self, customer_id, batch):
+        self.batches.append((customer_id, batch))
+        self.started.append(time.monotonic())
+        self.running[customer_id] = self.running.get(customer_id, 0) + 1
+        self.max_running[customer_id] = max(self.max_running.get(customer_id, 0), self.running[customer_id])
+        self.max_total = max(self.max_total, sum(self.running.values()))
+        await asyncio.sleep(self.turn_seconds)
+        self.running[customer_id] -= 1
+
+def test_burst_is_one_turn_in_timestamp_order():
+    recorder = Recorder()
+
+    async def scenario():
+        coalescer = MessageCoalescer(recorder, window_seconds=0.05, max_wait_seconds=1.0)
+        for timestamp, text in [(2, "kati ho?"), (1, "yo kurta"), (3, "M size")]:
+            coalescer.submit("a", text, timestamp)
+            await asyncio.sleep(0.01)
+        await coalescer.drain()
+        return coalescer
+
+    coalescer = asyncio.run(scenario())
+    assert recorder.batches == [("a", ["yo kurta", "kati ho?", "M size"])]
+    assert (coalescer.messages_in, coalescer.turns, coalescer.active_customers) == (3, 1, 0)
+
+def test_steady_stream_is_cut_by_max_wait():
+    recorder = Recorder()
+
+    async def scenario():
+        coalescer = MessageCoalescer(recorder, window_seconds=0.1, max_wait_seconds=0.2)
+        first = time.monotonic()
+        for i in range(12):
+            coalescer.submit("a", f"message {i}", i)
+            await asyncio.sleep(0.04)
+        await coalescer.drain()
+        return first
+
+    first = asyncio.run(scenario())
+    assert len(recorder.batches) >= 2
+    # The first turn doesn't wait for the stream to go quiet
+    assert recorder.started[0] - first < 0.35
+    assert [text for _, batch in recorder.batches for text in batch] == [f"message {i}" for i in range(12)]
+
+def test_turns_never_overlap_for_one_sender():
+    recorder = Recorder(turn_seconds=0.05)
+
+    async def scenario():
+        coalescer = MessageCoalescer(recorder, window_seconds=0, max_concurrent_turns=4)
+        coalescer.submit("a", "one", 1)
+        coalescer.submit("b", "hello", 1)
+        await asyncio.sleep(0.01)
+        # Arrives while a's first turn runs: queued behind it, not run beside it
+        coalescer.submit("a", "two", 2)
+        coalescer.submit("a", "three", 3)
+        await coalescer.drain()
+
+    asyncio.run(scenario())
+    assert recorder.max_running == {"a": 1, "b": 1}
+    # Different senders did run at the same time
+    assert recorder.max_total == 2
+    assert [batch for customer_id, batch in recorder.batches if customer_id == "a"] == [["one"], ["two", "three"]]
+
+def test_failed_turn_does_not_stop_the_sender():
+    batches = []
+
+    async def handler(customer_id, batch):
+        batches.append(batch)
+        if len(batches) == 1:
+            raise RuntimeError("LLM down")
+
+    async def scenario():
+        coalescer = MessageCoalescer(handler, window_seconds=0)
+        coalescer.submit("a", "one", 1)
+        await asyncio.sleep(0)
+        coalescer.submit("a", "two", 2)
+        await coalescer.drain()
+
+    asyncio.run(scenario())
+    assert batches == [["one"], ["two"]]
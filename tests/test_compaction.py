@@ -0,0 +1,140 @@
+from types import SimpleNamespace
+import pytest
+import database as db
+from compaction import ConversationCompactor, extract_facts
+
+KURTA = SimpleNamespace(product_id="p1", name="Silk Kurta", colors=["Red", "Blue"], sizes=["S", "M", "L"])
+PRODUCTS = {KURTA.product_id: KURTA}
+
+def window(count, chars=20):
+    return [SimpleNamespace(text="x" * chars) for _ in range(count)]
+
+@pytest.mark.parametrize("context, last_seq, tokens_each, expected", [
+    ({}, 6, 2000, False),                           # nothing beyond keep_recent, however long
+    ({}, 19, 5, False),
+    ({}, 20, 5, True),                              # message threshold
+    ({"summarized_through": 15}, 30, 5, False),     # only 15 unsummarized
+    ({"summarized_through": 15}, 35, 5, True),
+    ({}, 7, 1000, True),                            # token threshold
+])
+def test_needs_compaction_thresholds(context, last_seq, tokens_each, expected):
+    compactor = ConversationCompactor(None, message_threshold=20, token_threshold=1500, keep_recent=6)
+    unsummarized = last_seq - context.get("summarized_through", 0)
+    assert compactor.needs_compaction(context, last_seq, window(unsummarized, tokens_each * 4)) is expected
+
+async def add_conversation(count, context=None):
+    await db.insert_one("conversations", {"conversation_id": "conv-1", "customer_id": "customer-1",
+                                          "context": db.serialize_dict(context or {})})
+    await db.append_messages("conv-1", [{"sender": "customer" if i % 2 else "agent", "text": f"message {i + 1}"}
+                                        for i in range(count)])
+
+async def context():
+    return db.deserialize_dict((await db.find_one("conversations", {"conversation_id": "conv-1"}))["context"])
+
+def test_summary_is_merged_without_overwriting_the_turn(run_db):
+    calls = []
+
+    async def summarize(summary, messages):
+        calls.append((summary, [msg["seq"] for msg in messages]))
+        # The turn updates its own keys while the summary is being written
+        await db.merge_context("conv-1", {"facts": {"size": "M"}, "stage_note": "turn"})
+        return " New summary. "
+
+    async def scenario():
+        await add_conversation(12, {"summary": "Old summary.", "summarized_through": 2, "order_draft": {"phone": "98"}})
+        compactor = ConversationCompactor(summarize, keep_recent=4)
+        compactor.schedule("conv-1", await context(), last_seq=12)
+        await compactor.drain()
+        return compactor.stats(), await context()
+
+    stats, ctx = run_db(scenario)
+    assert calls == [("Old summary.", [3, 4, 5, 6, 7, 8])]
+    assert ctx == {"summary": "New summary.", "summarized_through": 8, "order_draft": {"phone": "98"},
+                   "facts": {"size": "M"}, "stage_note": "turn"}
+    assert stats == {"running": 0, "compactions": 1, "failures": 0}
+
+def test_long_backlog_is_folded_max_messages_at_a_time(run_db):
+    folded = []
+
+    async def summarize(summary, messages):
+        folded.append([msg["seq"] for msg in messages])
+        return f"summary through {messages[-1]['seq']}"
+
+    async def scenario():
+        await add_conversation(30)
+        compactor = ConversationCompactor(summarize, keep_recent=6, max_messages=10)
+        for _ in range(3):
+            compactor.schedule("conv-1", await context(), last_seq=30)
+            await compactor.drain()
+        return await context()
+
+    ctx = run_db(scenario)
+    assert folded == [list(range(1, 11)), list(range(11, 21)), list(range(21, 25))]
+    assert ctx == {"summary": "summary through 24", "summarized_through": 24}
+
+@pytest.mark.parametrize("reply", ["   ", RuntimeError("Groq down")])
+def test_failed_or_empty_summary_leaves_the_state_alone(run_db, reply):
+    async def summarize(summary, messages):
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    before = {"summary": "Old summary.", "summarized_through": 2}
+
+    async def scenario():
+        await add_conversation(20, before)
+        compactor = ConversationCompactor(summarize, keep_recent=4)
+        compactor.schedule("conv-1", await context(), last_seq=20)
+        await compactor.drain()
+        return compactor.stats(), await context()
+
+    stats, ctx = run_db(scenario)
+    assert ctx == before
+    assert stats == {"running": 0, "compactions": 0, "failures": 1}
+
+@pytest.mark.parametrize("text, quantity", [
+    ("2", None),
+    ("mero number 9812345678 ho", None),
+    ("size 40 chahiyo", None),
+    ("2 ota dinus", 2),
+    ("duita", 2),
+    ("३ वटा", 3),
+    ("50 pcs", None),  # over the sane limit
+])
+def test_bare_numbers_are_not_quantities(text, quantity):
+    assert extract_facts({}, text, "customer", PRODUCTS).get("quantity") == quantity
+
+@pytest.mark.parametrize("text, size", [
+    ("M", "M"),
+    ("size M", "M"),
+    ("L size dinus", "L"),
+    ("M wala", "M"),
+    ("malai S ra M dubai man paryo", None),
+    ("I am from Pokhara", None),
+])
+def test_single_letter_sizes_need_a_size_word(text, size):
+    assert extract_facts({"product_id": "p1"}, text, "customer", PRODUCTS).get("size") == size
+
+def test_customer_facts_accumulate():
+    facts = extract_facts({}, "Silk kurta Red color ma", "customer", PRODUCTS, product_ids=["p1"])
+    facts = extract_facts(facts, "Mero naam sita sharma. District: Kaski", "customer", PRODUCTS)
+    assert facts == {"product": "Silk Kurta", "product_id": "p1", "color": "Red",
+                     "customer_name": "Sita Sharma", "district": "Kaski"}
+
+@pytest.mark.parametrize("text, expected", [
+    ("Hajur, final price Rs. 1199 ma dinchhu.", {"negotiated_price": 1199}),
+    ("Discount pachi Rs. 1199 or Rs. 1099 ma dina milcha.", {}),
+    ("Delivery charge Rs. 150 lagchha.", {"delivery_charge": 150}),
+    ("Final price Rs. 1199. Delivery Rs. 100 thap.", {"negotiated_price": 1199, "delivery_charge": 100}),
+    ("Yo kurta Rs. 1299 ko ho.", {}),
+])
+def test_agent_amounts_need_exactly_one_quote(text, expected):
+    assert extract_facts({}, text, "agent", PRODUCTS) == expected
+
+@pytest.mark.parametrize("text, name", [
+    ("Mero naam Ram ho", "Ram"),
+    ("my name is R.K. Thapa", "R.K. Thapa"),
+    ("Mero naam sita sharma. Pokhara baata", "Sita Sharma"),
+])
+def test_name_stops_at_the_sentence_end(text, name):
+    assert extract_facts({}, text, "customer", PRODUCTS).get("customer_name") == name
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+import pytest
+import database as db
+import dedup
+from dedup import MessageDeduplicator
+
+@pytest.fixture
+def clock(monkeypatch):
+    """dedup's wall clock, settable through clock.now"""
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(dedup, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+async def stored_mids():
+    return {row["mid"] for row in await db.find_many("processed_messages")}
+
+def test_redelivery_is_rejected_from_memory(run_db, clock):
+    async def scenario():
+        deduplicator = MessageDeduplicator()
+        first = await deduplicator.claim("m1")
+        # Gone from the table, still caught by the LRU
+        await db.delete_older_than("processed_messages", "created_at", clock.now + 1)
+        return first, await deduplicator.claim("m1"), deduplicator.duplicates
+
+    assert run_db(scenario) == (True, False, 1)
+
+def test_redelivery_is_rejected_from_the_table_after_eviction(run_db, clock):
+    async def scenario():
+        deduplicator = MessageDeduplicator(max_size=2)
+        claims = [await deduplicator.claim(mid) for mid in ("m1", "m2", "m3")]
+        evicted = "m1" not in deduplicator._seen
+        again = await deduplicator.claim("m1")
+        # A restarted process has an empty LRU
+        restarted = await MessageDeduplicator().claim("m2")
+        return claims, evicted, again, restarted
+
+    claims, evicted, again, restarted = run_db(scenario)
+    assert claims == [True, True, True]
+    assert evicted
+    assert again is False and restarted is False
+
+def test_expired_ids_are_purged_and_claimable_again(run_db, clock):
+    async def scenario():
+        deduplicator = MessageDeduplicator(ttl_seconds=100, purge_interval=50)
+        await deduplicator.claim("old")
+        clock.now += 60
+        await deduplicator.claim("recent")
+        clock.now += 60
+        # "old" is past the TTL: the claim purges it and lets it through
+        reclaimed = await deduplicator.claim("old")
+        mids = await stored_mids()
+        clock.now += 200
+        purged = await deduplicator.purge_expired()
+        return reclaimed, mids, purged, await stored_mids()
+
+    reclaimed, mids, purged, left = run_db(scenario)
+    assert reclaimed is True
+    assert mids == {"old", "recent"}
+    assert purged == 2 and left == set()
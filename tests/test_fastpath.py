@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+import pytest
+from fastpath import FastPathResponder
+
+KURTA = SimpleNamespace(product_id="p1", name="Kurta Set", price=1499.0, regular_price=1999.0,
+                        colors=["Red", "Blue"], sizes=["M", "L"])
+
+@pytest.fixture
+def responder():
+    return FastPathResponder(min_confidence=0.8)
+
+def respond(responder, text, **kwargs):
+    return responder.respond(text, [KURTA], recent_product_ids=["p1"], named_product_ids=[], **kwargs)
+
+@pytest.mark.parametrize("text, intent", [
+    ("kati ho?", "price"),
+    ("price kati?", "price"),
+    ("size kun kun chha?", "sizes"),
+    ("delivery charge kati?", "delivery_charge"),
+    ("kati din ma aauchha?", "delivery_time"),
+    ("when will it arrive?", "delivery_time"),
+    ("return huncha?", "return_policy"),
+])
+def test_templates(responder, text, intent):
+    reply = respond(responder, text)
+    assert reply is not None and reply.intent == intent
+
+@pytest.mark.parametrize("text", [
+    "total kati ho?",
+    "total kati bhayo?",
+    "delivery sahit kati?",
+    "kati tirnu parcha?",
+    "advance kati tirnu parchha?",
+    "jamma kati bhayo?",
+    "discount kati?",
+    "when will you call?",
+])
+def test_totals_and_other_questions_go_to_the_llm(responder, text):
+    assert respond(responder, text) is None
+
+@pytest.mark.parametrize("stage", ["negotiation", "ordering"])
+def test_negotiating_or_ordering_conversations_go_to_the_llm(responder, stage):
+    assert respond(responder, "kati ho?", stage=stage) is None
+    assert responder.stats()["skipped"] == 1
+
+@pytest.mark.parametrize("facts", [{"negotiated_price": 1300}, {"quantity": 2}])
+def test_agreed_deals_go_to_the_llm(responder, facts):
+    assert respond(responder, "kati ho?", stage="browsing", facts=facts) is None
+
+def test_price_template_quotes_offer(responder):
+    reply = respond(responder, "kati ho?", stage="browsing", facts={"product_id": "p1"})
+    assert "Rs. 1499" in reply.text and "Rs. 1999" in reply.text
@@ -0,0 +1,89 @@
+import hashlib
+import io
+import pytest
+from fastapi import UploadFile
+from PIL import Image
+from images import ImagePipeline, InvalidImage, UploadTooLarge, local_storage, thumbnails_for
+
+def png(width=2000, height=1000, color=(200, 30, 30)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(out, "PNG")
+    return out.getvalue()
+
+def upload(data: bytes, filename="photo.png") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename)
+
+@pytest.fixture
+def stored(tmp_path):
+    """Stub uploader: local storage that also records every stored file"""
+    save = local_storage(tmp_path / "uploads", "https://cdn.test/uploads")
+    names = []
+
+    async def store(name, data):
+        names.append(name)
+        return await save(name, data)
+    store.names = names
+    store.directory = tmp_path / "uploads"
+    return store
+
+def test_stores_resized_webp_variants(run_db, stored):
+    data = png()
+
+    async def scenario():
+        return await ImagePipeline(stored).ingest(upload(data))
+
+    result = run_db(scenario)
+    digest = hashlib.sha256(data).hexdigest()
+    assert result == {"url": f"https://cdn.test/uploads/{digest}.webp",
+                      "thumbnail_url": f"https://cdn.test/uploads/{digest}-thumb.webp",
+                      "sha256": digest, "deduplicated": False}
+    large = Image.open(stored.directory / f"{digest}.webp")
+    thumb = Image.open(stored.directory / f"{digest}-thumb.webp")
+    assert large.format == "WEBP" and max(large.size) == 1280
+    assert max(thumb.size) == 320
+
+def test_identical_upload_is_deduplicated_by_sha256(run_db, stored):
+    data = png()
+
+    async def scenario():
+        pipeline = ImagePipeline(stored)
+        first = await pipeline.ingest(upload(data))
+        second = await pipeline.ingest(upload(data, filename="renamed.png"))
+        thumbnails = await thumbnails_for([first["url"]])
+        return pipeline, first, second, thumbnails
+
+    pipeline, first, second, thumbnails = run_db(scenario)
+    assert second["deduplicated"] and second["url"] == first["url"]
+    assert len(stored.names) == 2  # large + thumbnail, once
+    assert pipeline.deduplicated == 1
+    assert thumbnails == {first["url"]: first["thumbnail_url"]}
+
+def test_lossless_copy_is_a_separate_image(run_db, stored):
+    data = png(200, 200)
+
+    async def scenario():
+        pipeline = ImagePipeline(stored)
+        photo = await pipeline.ingest(upload(data))
+        qr = await pipeline.ingest(upload(data), lossless=True)
+        return photo, qr
+
+    photo, qr = run_db(scenario)
+    assert photo["sha256"] == qr["sha256"]
+    assert qr["url"].endswith("-lossless.webp") and not qr["deduplicated"]
+
+def test_size_limit(run_db, stored):
+    async def scenario():
+        with pytest.raises(UploadTooLarge):
+            await ImagePipeline(stored, max_bytes=1000).ingest(upload(png()))
+
+    run_db(scenario)
+    assert stored.names == []
+
+@pytest.mark.parametrize("data", [b"", b"not an image at all"])
+def test_invalid_uploads_are_rejected(run_db, stored, data):
+    async def scenario():
+        with pytest.raises(InvalidImage):
+            await ImagePipeline(stored).ingest(upload(data))
+
+    run_db(scenario)
+    assert stored.names == []
@@ -0,0 +1,141 @@
+import asyncio
+import time
+import pytest
+import llm
+from llm_client import CircuitBreaker, LLMUnavailable, ResilientLLM
+
+@pytest.fixture
+def models(monkeypatch):
+    """Per-model (outcome, delay) used by fake chat completion calls"""
+    behaviour = {"big": ("ok", 0.0), "small": ("ok", 0.0)}
+
+    async def chat_completion(api_key, model, messages, **params):
+        outcome, delay = behaviour[model]
+        await asyncio.sleep(delay)
+        if outcome == "429":
+            raise llm.LLMError("rate limited", 429, retry_after=5)
+        if outcome == "503":
+            raise llm.LLMError("unavailable", 503)
+        if outcome == "400":
+            raise llm.LLMError("bad request", 400)
+        return f"reply from {model}"
+
+    async def stream_chat_completion(api_key, model, messages, **params):
+        outcome, delay = behaviour[model]
+        await asyncio.sleep(delay)
+        if outcome != "ok":
+            raise llm.LLMError("unavailable", 503)
+        for word in ("hello ", "from ", model):
+            yield word
+
+    monkeypatch.setattr(llm, "chat_completion", chat_completion)
+    monkeypatch.setattr(llm, "stream_chat_completion", stream_chat_completion)
+    return behaviour
+
+def client(**kwargs):
+    options = {"hedge_delay": 0.05, "slo_seconds": 0.5, "failure_threshold": 3, "cooldown": 0.2}
+    return ResilientLLM("key", "big", "small", **{**options, **kwargs})
+
+def test_breaker_opens_after_consecutive_failures_and_probes():
+    breaker = CircuitBreaker("m", failure_threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+def test_single_429_opens_for_retry_after_only():
+    breaker = CircuitBreaker("m", failure_threshold=5, cooldown=10)
+    breaker.record_failure(retry_after=0.05)
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+
+def test_threshold_uses_longer_of_cooldown_and_retry_after():
+    breaker = CircuitBreaker("m", failure_threshold=1, cooldown=0.01)
+    breaker.record_failure(retry_after=10)
+    time.sleep(0.02)
+    assert breaker.state == "open"
+
+def test_primary_serves_when_healthy(models):
+    reply = asyncio.run(client().complete([]))
+    assert (reply.text, reply.path) == ("reply from big", "primary")
+
+def test_hedge_wins_without_tripping_a_slow_primary(models):
+    models["big"] = ("ok", 0.4)
+    models["small"] = ("ok", 0.05)
+    llm_client = client(hedge_delay=0.2, slo_seconds=1.0, failure_threshold=5)
+
+    async def turns():
+        return [await llm_client.complete([]) for _ in range(8)]
+
+    replies = asyncio.run(turns())
+    assert all(reply.path == "hedge" for reply in replies)
+    assert llm_client.breakers["big"].state == "closed"
+    assert llm_client.breakers["big"].failures == 0
+
+def test_fast_failure_falls_back_and_opens_circuit(models):
+    models["big"] = ("503", 0.0)
+    llm_client = client()
+
+    async def turns():
+        return [await llm_client.complete([]) for _ in range(4)]
+
+    replies = asyncio.run(turns())
+    assert [reply.path for reply in replies] == ["fallback"] * 4
+    assert llm_client.breakers["big"].state == "open"
+    assert llm_client.stats()["served"]["fallback"] == 4
+
+def test_client_errors_do_not_trip_the_circuit(models):
+    models["big"] = ("400", 0.0)
+    llm_client = client()
+    asyncio.run(llm_client.complete([]))
+    assert llm_client.breakers["big"].failures == 0
+
+def test_429_with_retry_after_opens_immediately(models):
+    models["big"] = ("429", 0.0)
+    llm_client = client(failure_threshold=10)
+    assert asyncio.run(llm_client.complete([])).path == "fallback"
+    assert llm_client.breakers["big"].state == "open"
+
+def test_slo_timeout_counts_as_failure(models):
+    models["big"] = ("ok", 1.0)
+    models["small"] = ("ok", 1.0)
+    llm_client = client(slo_seconds=0.1)
+    with pytest.raises(LLMUnavailable):
+        asyncio.run(llm_client.complete([]))
+    assert llm_client.breakers["big"].failures == 1
+    assert llm_client.breakers["small"].failures == 1
+    assert llm_client.stats()["served"]["none"] == 1
+
+def test_stream_hedges_on_first_token(models):
+    models["big"] = ("ok", 0.3)
+    llm_client = client(hedge_delay=0.05)
+
+    async def read():
+        stream = llm_client.stream([])
+        text = "".join([delta async for delta in stream])
+        return text, stream.path
+
+    assert asyncio.run(read()) == ("hello from small", "hedge")
+    assert llm_client.breakers["big"].failures == 0
+
+def test_caller_cancellation_propagates(models):
+    models["big"] = ("ok", 1.0)
+    models["small"] = ("ok", 1.0)
+    llm_client = client(slo_seconds=5)
+
+    async def cancel_midway():
+        task = asyncio.create_task(llm_client.complete([]))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return task.cancelled()
+
+    assert asyncio.run(cancel_midway())
+    assert llm_client.breakers["big"].failures == 0
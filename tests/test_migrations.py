@@ -0,0 +1,67 @@
+import json
+import pytest
+import database as db
+
+def test_duplicate_conversations_are_merged_not_deleted(run_db, monkeypatch):
+    # Build the schema as it was before migration 5 and seed duplicates
+    all_migrations = db.MIGRATIONS
+    monkeypatch.setattr(db, "MIGRATIONS", all_migrations[:4])
+
+    async def seed():
+        async with db.connection() as conn:
+            rows = [
+                ("c-old", "cust-1", {"facts": {"size": "M", "color": "red"}, "lang": "ne"}, "2024-01-01T00:00:00", 1),
+                ("c-new", "cust-1", {"facts": {"color": "blue"}}, "2024-01-02T00:00:00", 0),
+                ("c-other", "cust-2", {}, "2024-01-01T00:00:00", 0),
+            ]
+            for conversation_id, customer_id, context, last_updated, media in rows:
+                await conn.execute(
+                    "INSERT INTO conversations (conversation_id, customer_id, stage, context, last_updated, has_media_pending) "
+                    "VALUES (?, ?, 'greeting', ?, ?, ?)",
+                    [conversation_id, customer_id, json.dumps(context), last_updated, media]
+                )
+            messages = [
+                ("c-old", 1, "customer", "namaste", "2024-01-01T00:00:01"),
+                ("c-old", 2, "bot", "namaste hajur", "2024-01-01T00:00:02"),
+                ("c-new", 1, "customer", "kurta chha?", "2024-01-02T00:00:01"),
+                ("c-other", 1, "customer", "hello", "2024-01-01T00:00:01"),
+            ]
+            await conn.executemany(
+                "INSERT INTO messages (conversation_id, seq, sender, text, timestamp, product_ids) VALUES (?, ?, ?, ?, ?, '[]')",
+                messages
+            )
+            await conn.commit()
+
+    run_db(seed)
+    monkeypatch.setattr(db, "MIGRATIONS", all_migrations)
+
+    async def check():
+        async with db.connection() as conn:
+            async with conn.execute("SELECT conversation_id, context, has_media_pending FROM conversations "
+                                    "WHERE customer_id = 'cust-1'") as cursor:
+                conversations = [dict(row) for row in await cursor.fetchall()]
+            async with conn.execute("SELECT conversation_id, seq, text FROM messages ORDER BY conversation_id, seq") as cursor:
+                messages = [tuple(row) for row in await cursor.fetchall()]
+        return conversations, messages
+
+    conversations, messages = run_db(check)
+    assert len(conversations) == 1
+    survivor = conversations[0]
+    assert survivor["conversation_id"] == "c-new"
+    assert json.loads(survivor["context"]) == {"facts": {"size": "M", "color": "blue"}, "lang": "ne"}
+    assert survivor["has_media_pending"] == 1
+    assert messages == [
+        ("c-new", 1, "namaste"),
+        ("c-new", 2, "namaste hajur"),
+        ("c-new", 3, "kurta chha?"),
+        ("c-other", 1, "hello"),
+    ]
+
+def test_unique_customer_index_exists(run_db):
+    async def check():
+        async with db.connection() as conn:
+            await conn.execute("INSERT INTO conversations (conversation_id, customer_id) VALUES ('a', 'cust')")
+            await conn.execute("INSERT INTO conversations (conversation_id, customer_id) VALUES ('b', 'cust')")
+
+    with pytest.raises(Exception, match="UNIQUE"):
+        run_db(check)
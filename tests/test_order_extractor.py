@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+import pytest
+from order_extractor import Gazetteer, OrderExtractor
+
+@pytest.fixture(scope="module")
+def extractor():
+    return OrderExtractor(Gazetteer.load())
+
+@pytest.mark.parametrize("text", [
+    "hunchha", "huncha", "hunchha.", "thik chha", "Thik cha", "thikai chha", "ok", "ok hajur", "yes",
+    "confirm", "Thik chha, confirm gardinus", "la confirm garnus", "order gardinus", "pakka",
+    "हुन्छ", "ठीक छ", "पक्का",
+])
+def test_confirmations(extractor, text):
+    assert extractor.is_confirmation(text)
+
+@pytest.mark.parametrize("text", [
+    "total kati huncha?", "delivery kahile huncha?", "size M huncha?", "hunchha?", "ok?",
+    "kasari pay garne, hunchha", "ke ho yo", "kati ho", "pachhi confirm garchu", "hunna", "confirm chaina",
+    "hajur", "ho", "M size, black color hunchha", "कति हुन्छ",
+])
+def test_questions_and_other_messages_are_not_confirmations(extractor, text):
+    assert not extractor.is_confirmation(text)
+
+@pytest.mark.parametrize("text, ward", [
+    ("ward 5", "5"), ("Ward no. 12", "12"), ("वडा नं 3", "3"),
+    ("Pokhara-8", "8"), ("Lakeside, Pokhara-8, Kaski", "8"), ("Lalitpur - 3", "3"),
+    ("Size-2", None), ("XXL-2 ota", None), ("Color-1 wala", None),
+])
+def test_ward(extractor, text, ward):
+    assert extractor._ward(text) == ward
+
+def test_update_parses_free_address_and_phone(extractor):
+    draft = extractor.update({}, "Ram Thapa, 9812345678, Lakeside, Pokhara-8, Kaski", {}, {})
+    assert draft["phone_primary"] == "9812345678"
+    assert draft["district"] == "Kaski"
+    assert draft["municipality"] == "Pokhara"
+    assert draft["ward_number"] == "8"
+    assert draft["draft_id"]
+
+def test_update_ignores_size_dash_number(extractor):
+    draft = extractor.update({}, "XXL-2 ota chahiyo", {}, {})
+    assert "ward_number" not in draft
+
+def test_labelled_facts_win(extractor):
+    facts = {"district": "kaaski", "municipality": "pokhra", "ward_number": "6", "tole_area": "Lakeside"}
+    draft = extractor.update({}, "District: kaaski", {}, facts)
+    assert (draft["district"], draft["municipality"], draft["ward_number"]) == ("Kaski", "Pokhara", "6")
+
+def test_missing_and_order_fields(extractor):
+    product = SimpleNamespace(product_id="p1", name="Kurta Set", price=1500.0, colors=["Red", "Blue"], sizes=["M"])
+    products = {"p1": product}
+    draft = {"customer_name": "Ram Thapa", "phone_primary": "9812345678", "district": "Kathmandu",
+             "municipality": "Kathmandu", "ward_number": "4", "tole_area": "Baneshwor", "draft_id": "d1"}
+    facts = {"product_id": "p1", "quantity": 2}
+    assert extractor.missing(draft, facts, products) == ["color"]
+    facts["color"] = "Red"
+    assert extractor.missing(draft, facts, products) == []
+    fields = extractor.order_fields(draft, facts, products)
+    assert fields["subtotal"] == 3000.0
+    assert fields["items"][0]["size"] == "M"
+    assert fields["payment_method"] == "COD"
+    assert fields["total_amount"] == fields["subtotal"] + fields["delivery_charge"]
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+import database as db
+
+async def add_order(order_id, created_at, total_amount=1000, status="pending"):
+    await db.insert_one("orders", {"order_id": order_id, "customer_id": order_id, "total_amount": total_amount,
+                                   "status": status, "created_at": created_at})
+
+async def rollup():
+    """Non-empty rollup rows as {(day, status): (orders, revenue)}"""
+    async with db.connection() as conn:
+        async with conn.execute("SELECT day, status, orders, revenue FROM daily_order_stats WHERE orders != 0") as cursor:
+            return {(day, status): (orders, revenue) for day, status, orders, revenue in await cursor.fetchall()}
+
+def test_insert_adds_to_the_day_and_status(run_db):
+    async def scenario():
+        await add_order("a", "2026-03-01T09:00:00+00:00", 1000)
+        await add_order("b", "2026-03-01T18:30:00+00:00", 500)
+        await add_order("c", "2026-03-02T00:10:00+00:00", 250, status="delivered")
+        return await rollup()
+
+    assert run_db(scenario) == {
+        ("2026-03-01", "pending"): (2, 1500),
+        ("2026-03-02", "delivered"): (1, 250),
+    }
+
+def test_status_and_amount_changes_move_the_order(run_db):
+    async def scenario():
+        await add_order("a", "2026-03-01T09:00:00+00:00", 1000)
+        await add_order("b", "2026-03-01T10:00:00+00:00", 500)
+        await db.update_one("orders", {"order_id": "a"}, {"status": "confirmed"})
+        await db.update_one("orders", {"order_id": "b"}, {"total_amount": 800})
+        return await rollup()
+
+    assert run_db(scenario) == {
+        ("2026-03-01", "confirmed"): (1, 1000),
+        ("2026-03-01", "pending"): (1, 800),
+    }
+
+def test_delete_removes_the_order(run_db):
+    async def scenario():
+        await add_order("a", "2026-03-01T09:00:00+00:00", 1000)
+        await add_order("b", "2026-03-01T10:00:00+00:00", 500)
+        await db.delete_one("orders", {"order_id": "a"})
+        return await rollup()
+
+    assert run_db(scenario) == {("2026-03-01", "pending"): (1, 500)}
+
+def test_undated_order_is_saved_but_left_out(run_db):
+    async def scenario():
+        await add_order("undated", None, 700)
+        await db.update_one("orders", {"order_id": "undated"}, {"status": "confirmed", "total_amount": 900})
+        saved = await db.find_one("orders", {"order_id": "undated"})
+        before = await rollup()
+        # Dating it later brings it into the rollup
+        await db.update_one("orders", {"order_id": "undated"}, {"created_at": "2026-03-05T08:00:00+00:00"})
+        return saved, before, await rollup()
+
+    saved, before, after = run_db(scenario)
+    assert saved["total_amount"] == 900
+    assert before == {}
+    assert after == {("2026-03-05", "confirmed"): (1, 900)}
+
+def test_rebuild_and_backfill_match_the_triggers(run_db):
+    async def scenario():
+        await add_order("a", "2026-03-01T09:00:00+00:00", 1000)
+        await add_order("b", "2026-03-02T09:00:00+00:00", 500, status="delivered")
+        await add_order("c", None, 300)
+        live = await rollup()
+        await db.rebuild_daily_order_stats()
+        rebuilt = await rollup()
+        # Backfill only fills days that have no rows at all
+        async with db.connection() as conn:
+            await conn.execute("DELETE FROM daily_order_stats WHERE day = '2026-03-02'")
+            await conn.execute("UPDATE daily_order_stats SET orders = 5 WHERE day = '2026-03-01'")
+            await conn.commit()
+        await db.rebuild_daily_order_stats(missing_days_only=True)
+        return live, rebuilt, await rollup()
+
+    live, rebuilt, backfilled = run_db(scenario)
+    assert rebuilt == live == {
+        ("2026-03-01", "pending"): (1, 1000),
+        ("2026-03-02", "delivered"): (1, 500),
+    }
+    assert backfilled == {
+        ("2026-03-01", "pending"): (5, 1000),
+        ("2026-03-02", "delivered"): (1, 500),
+    }
+
+def test_analytics_windows_cover_whole_days(run_db, server):
+    now = datetime.now(timezone.utc)
+    midnight = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+
+    async def scenario():
+        await add_order("today", midnight.isoformat(), 100)
+        await add_order("week", (midnight - timedelta(days=7)).isoformat(), 200)
+        await add_order("month", (midnight - timedelta(days=30)).isoformat(), 400)
+        await add_order("older", (midnight - timedelta(days=31)).isoformat(), 800)
+        return await server.get_analytics(current_user={})
+
+    analytics = run_db(scenario)
+    assert analytics["today"] == {"orders": 1, "revenue": 100}
+    assert analytics["week"] == {"orders": 2, "revenue": 300}
+    assert analytics["month"] == {"orders": 3, "revenue": 700}
+    assert len(analytics["recent_orders"]) == 4
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+import database as db
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+async def add_orders(server, count=25):
+    """Orders every 6 hours; every third shares its timestamp with the previous one"""
+    for i in range(count):
+        created_at = (START + timedelta(hours=6 * (i - i % 3 // 2))).isoformat()
+        order = server.Order(
+            order_id=f"order-{i:03d}", customer_id=f"c{i}", customer_name="Ram", phone_primary="9812345678",
+            district="Kaski" if i % 2 else "Kathmandu", municipality="Pokhara", ward_number="8",
+            tole_area="Lakeside", items=[], subtotal=1000, delivery_charge=150, total_amount=1150,
+            payment_method="COD", status="pending" if i % 4 else "delivered", created_at=created_at
+        ).model_dump()
+        order["items"] = db.serialize_list(order["items"])
+        await db.insert_one("orders", order)
+
+async def all_pages(server, **filters):
+    pages, cursor = [], None
+    while True:
+        page = await server.get_orders(**{"limit": 7, "cursor": cursor, "status": None, "district": None,
+                                          "date_from": None, "date_to": None, **filters}, current_user={})
+        pages.append([order["order_id"] for order in page["orders"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+def test_pages_cover_every_order_once_newest_first(run_db, server):
+    async def scenario():
+        await add_orders(server)
+        expected = await db.find_many("orders", sort=server.ORDERS_SORT)
+        return await all_pages(server), [order["order_id"] for order in expected]
+
+    pages, expected = run_db(scenario)
+    assert [len(page) for page in pages] == [7, 7, 7, 4]
+    assert [order_id for page in pages for order_id in page] == expected
+    assert len(set(expected)) == 25
+
+def test_filters_apply_across_pages(run_db, server):
+    async def scenario():
+        await add_orders(server)
+        pages = await all_pages(server, status="pending", district="Kaski")
+        dated = await all_pages(server, date_from="2026-03-02", date_to="2026-03-03")
+        rows = {row["order_id"]: row for row in await db.find_many("orders")}
+        return pages, dated, rows
+
+    pages, dated, rows = run_db(scenario)
+    ids = [order_id for page in pages for order_id in page]
+    assert ids and all(rows[i]["status"] == "pending" and rows[i]["district"] == "Kaski" for i in ids)
+    dated_ids = [order_id for page in dated for order_id in page]
+    assert dated_ids and all("2026-03-02" <= rows[i]["created_at"][:10] <= "2026-03-03" for i in dated_ids)
+    assert len(dated_ids) == sum(1 for row in rows.values() if "2026-03-02" <= row["created_at"][:10] <= "2026-03-03")
+
+def test_keyset_query_continues_after_cursor(run_db):
+    async def scenario():
+        for i, created_at in enumerate(["2026-01-01", "2026-01-02", "2026-01-02", "2026-01-03"]):
+            await db.insert_one("orders", {"order_id": f"o{i}", "customer_id": "c", "created_at": created_at,
+                                           "items": "[]", "status": "pending"})
+        sort = [("created_at", -1), ("order_id", -1)]
+        return await db.find_many("orders", sort=sort, after=("2026-01-02", "o2"), limit=10)
+
+    assert [row["order_id"] for row in run_db(scenario)] == ["o1", "o0"]
+
+def test_mixed_sort_directions_are_rejected(run_db):
+    async def scenario():
+        with pytest.raises(ValueError):
+            await db.find_many("orders", sort=[("created_at", -1), ("order_id", 1)], after=("x", "y"))
+
+    run_db(scenario)
+
+def test_bad_cursor_is_a_400(server):
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor("not-a-cursor")
+    assert error.value.status_code == 400
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import pytest
+import database as db
+from outbox import DeliveryError, OutboxSender, graph_error
+
+async def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        await asyncio.sleep(0.01)
+
+def sender(send, **kwargs):
+    options = {"rate_per_second": 1000, "burst": 1000, "base_delay": 0.02, "max_delay": 0.05, "poll_interval": 0.05}
+    return OutboxSender(send, **{**options, **kwargs})
+
+def test_per_recipient_order_survives_retries(run_db):
+    delivered = []
+    failures = {"a1": 2}
+
+    async def send(recipient_id, payload):
+        await asyncio.sleep(0.005)
+        if failures.get(payload["text"], 0):
+            failures[payload["text"]] -= 1
+            raise DeliveryError("throttled")
+        delivered.append((recipient_id, payload["text"]))
+
+    async def scenario():
+        outbox = sender(send)
+        await outbox.start()
+        await outbox.enqueue("A", {"text": "a1"}, {"text": "a2"})
+        await outbox.enqueue("B", {"text": "b1"})
+        await outbox.enqueue("A", {"text": "a3"})
+        await wait_until(lambda: outbox.sent == 4)
+        await outbox.stop(1)
+        return outbox
+
+    outbox = run_db(scenario)
+    assert [text for recipient, text in delivered if recipient == "A"] == ["a1", "a2", "a3"]
+    # B isn't held up behind A's retries
+    assert delivered.index(("B", "b1")) < delivered.index(("A", "a1"))
+    assert outbox.retried == 2
+
+def test_dead_letters_after_max_attempts_and_moves_on(run_db):
+    delivered = []
+
+    async def send(recipient_id, payload):
+        if payload["text"] == "bad":
+            raise DeliveryError("still failing")
+        if payload["text"] == "invalid":
+            raise DeliveryError("no such user", retryable=False)
+        delivered.append(payload["text"])
+
+    async def scenario():
+        outbox = sender(send, max_attempts=3)
+        await outbox.start()
+        await outbox.enqueue("A", {"text": "bad"}, {"text": "after bad"})
+        await outbox.enqueue("B", {"text": "invalid"}, {"text": "after invalid"})
+        await wait_until(lambda: outbox.sent == 2)
+        await outbox.stop(1)
+        dead = await db.find_many("outbox", {"status": "dead"}, sort=[("outbox_id", 1)])
+        return outbox, dead
+
+    outbox, dead = run_db(scenario)
+    assert sorted(delivered) == ["after bad", "after invalid"]
+    assert [(row["recipient_id"], row["attempts"]) for row in dead] == [("A", 3), ("B", 1)]
+    assert outbox.dead == 2
+
+def test_parallel_batch_is_sent_concurrently(run_db):
+    active, peak = [0], [0]
+
+    async def send(recipient_id, payload):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.05)
+        active[0] -= 1
+
+    async def scenario():
+        outbox = sender(send, max_batch_fanout=3)
+        await outbox.start()
+        await outbox.enqueue("A", *({"attachment": i} for i in range(3)), parallel=True)
+        await wait_until(lambda: outbox.sent == 3)
+        await outbox.stop(1)
+
+    run_db(scenario)
+    assert peak[0] == 3
+
+def test_backoff_is_exponential_capped_and_jittered():
+    outbox = OutboxSender(None, base_delay=1, max_delay=10)
+    for attempts, ceiling in [(1, 1), (2, 2), (3, 4), (4, 8), (5, 10), (9, 10)]:
+        for _ in range(20):
+            assert ceiling / 2 <= outbox.backoff(attempts) <= ceiling
+
+@pytest.mark.parametrize("status, code, retryable", [
+    (400, 613, True), (400, 4, True), (500, None, True), (429, None, True),
+    (400, 100, False), (403, 10, False),
+])
+def test_graph_error_classification(status, code, retryable):
+    assert graph_error(status, {"error": {"code": code, "message": "x"}}).retryable is retryable
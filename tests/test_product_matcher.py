@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import pytest
+from product_matcher import ProductMatcher, matcher_for, normalize
+
+def product(product_id, name, aliases=()):
+    return SimpleNamespace(product_id=product_id, name=name, aliases=list(aliases))
+
+CATALOG = [
+    product("kurta", "Kurta Set", ["kurta", "कुर्ता"]),
+    product("jacket", "Denim Jacket", ["jacket"]),
+    product("jeans", "Denim Jeans"),
+    product("saree", "Silk Saree"),
+    product("top", "Crop Top", ["top"]),
+]
+
+@pytest.fixture(scope="module")
+def matcher():
+    return ProductMatcher(CATALOG)
+
+@pytest.mark.parametrize("text, product_ids", [
+    ("Kurta Set kati ho?", ["kurta"]),
+    ("kurta ko price?", ["kurta"]),
+    ("kurtako size M chha?", ["kurta"]),  # postposition suffix
+    ("कुर्ताको रंग कति छ?", ["kurta"]),
+    ("jacket wala dekhaunus", ["jacket"]),
+    ("DENIM   JACKET!!", ["jacket"]),
+    ("silk saree ra denim jeans", ["saree", "jeans"]),
+    ("silk saree, kurta, silk saree", ["saree", "kurta"]),
+    ("skurta", []),  # only at the start of a word
+    ("topi kati ho?", []),  # nor as the start of a longer word
+    ("kurtama ra topharu", ["kurta", "top"]),
+    ("tops chha?", ["top"]),
+    ("crop top", ["top"]),
+    ("denim", []),
+])
+def test_product_ids(matcher, text, product_ids):
+    assert matcher.product_ids(text) == product_ids
+
+def test_positions_point_into_the_original_text(matcher):
+    text = "Hajur, DENIM  Jacket ramro chha"
+    [mention] = matcher.find(text)
+    assert text[mention.start:mention.end] == "DENIM  Jacket"
+
+def test_longest_match_wins(matcher):
+    mentions = matcher.find("Kurta Set chahiyo")
+    assert [(m.product_id, m.term) for m in mentions] == [("kurta", "kurta set")]
+
+def test_normalize_collapses_punctuation_and_case():
+    norm, offsets = normalize("Ｋurta--SET")
+    assert norm == "kurta set"
+    assert len(offsets) == len(norm)
+
+def test_matches_beyond_the_prompt_cap():
+    catalog = [product(f"p{i}", f"Design {i:03d} Top") for i in range(500)]
+    matcher = matcher_for(catalog, catalog_version=1)
+    assert matcher.product_ids("design 450 top ko size?") == ["p450"]
+    # Recompiled when the catalog version changes
+    assert matcher_for(catalog[:10], catalog_version=2).product_ids("design 450 top") == []
+
+def test_same_sized_product_lists_get_their_own_matcher():
+    kurtas = [product("k1", "Cotton Kurta"), product("k2", "Silk Kurta")]
+    sarees = [product("s1", "Cotton Saree"), product("s2", "Silk Saree")]
+    assert matcher_for(kurtas, catalog_version=3).product_ids("silk kurta") == ["k2"]
+    assert matcher_for(sarees, catalog_version=3).product_ids("silk kurta") == []
+    assert matcher_for(sarees, catalog_version=3).product_ids("silk saree") == ["s2"]
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+import database as db
+from stages import STAGES, StageTracker
+
+tracker = StageTracker()
+
+@pytest.mark.parametrize("text", ["yo kati ho?", "discount milcha?", "arko color dekhaunus", "hello", "ok"])
+def test_ordering_is_kept_without_cancel_or_order(text):
+    assert tracker.next_stage("ordering", text, product_ids=["p1"]) == "ordering"
+
+def test_ordering_is_left_on_cancel():
+    assert tracker.next_stage("ordering", "order cancel garnus") == "browsing"
+    assert tracker.next_stage("ordering", "malai chaindaina") == "browsing"
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_saved_order_completes_from_any_stage(stage):
+    assert tracker.next_stage(stage, "ok", order_placed=True) == "completed"
+
+@pytest.mark.parametrize("stage, text", [
+    ("negotiation", "yo kurta ramro chha"),
+    ("negotiation", "hello"),
+    ("browsing", "namaste"),
+    ("ordering", "kati ho?"),
+])
+def test_stages_do_not_move_backwards(stage, text):
+    assert tracker.next_stage(stage, text, product_ids=["p1"]) == stage
+
+def test_furthest_signal_wins():
+    assert tracker.next_stage("greeting", "kati ho? order garchu") == "ordering"
+    assert tracker.next_stage("browsing", "last price kati?") == "negotiation"
+
+def test_first_hello_stays_a_greeting():
+    assert tracker.next_stage("greeting", "namaste", first_turn=True) == "greeting"
+    assert tracker.next_stage("greeting", "namaste, kurta chha?", product_ids=["p1"], first_turn=True) == "browsing"
+    assert tracker.next_stage("greeting", "namaste", first_turn=False) == "browsing"
+
+def test_cancel_outside_ordering_keeps_the_stage():
+    assert tracker.next_stage("negotiation", "order cancel, chaindaina") == "negotiation"
+
+def test_completed_conversation_starts_over():
+    assert tracker.next_stage("completed", "arko kurta kati?") == "negotiation"
+
+START = datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+
+# Minutes after the conversation's first message at which it entered each stage
+JOURNEYS = {
+    "a": [("greeting", 0), ("browsing", 1), ("negotiation", 5), ("ordering", 10), ("completed", 20)],
+    "b": [("greeting", 0), ("browsing", 2), ("negotiation", 10)],
+    "c": [("greeting", 0), ("browsing", 4)],
+    "d": [("greeting", 0)],
+    # Straight to ordering: counted as having passed browsing and negotiation
+    "e": [("greeting", 0), ("ordering", 3)],
+}
+
+async def add_transitions(conversation_id, journey, started):
+    previous = None
+    for stage, minutes in journey:
+        await db.insert_one("stage_transitions", {
+            "conversation_id": conversation_id, "customer_id": conversation_id, "from_stage": previous,
+            "to_stage": stage, "at": (started + timedelta(minutes=minutes)).isoformat()
+        })
+        previous = stage
+
+def test_funnel_reach_conversion_and_median(run_db, server):
+    async def scenario():
+        for i, (conversation_id, journey) in enumerate(JOURNEYS.items()):
+            await add_transitions(conversation_id, journey, START + timedelta(hours=i))
+        # Outside the requested day
+        await add_transitions("old", JOURNEYS["a"], START - timedelta(days=10))
+        return await server.get_funnel(date_from="2026-03-01", date_to="2026-03-01", current_user={})
+
+    report = run_db(scenario)
+    assert (report["date_from"], report["date_to"]) == ("2026-03-01", "2026-03-01")
+    funnel = {row["stage"]: row for row in report["funnel"]}
+    assert [row["stage"] for row in report["funnel"]] == list(STAGES)
+    assert {stage: row["conversations"] for stage, row in funnel.items()} == {
+        "greeting": 5, "browsing": 4, "negotiation": 3, "ordering": 2, "completed": 1}
+    assert [row["conversion"] for row in report["funnel"]] == [None, 0.8, 0.75, 0.667, 0.5]
+    medians = {stage: row["median_seconds_from_greeting"] for stage, row in funnel.items()}
+    assert medians == pytest.approx({"greeting": 0, "browsing": 120, "negotiation": 600, "ordering": 600,
+                                     "completed": 1200}, abs=0.01)
+
+def test_funnel_rejects_bad_dates(server):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(server.get_funnel(date_from="March", date_to=None, current_user={}))
+    assert error.value.status_code == 400
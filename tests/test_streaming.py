@@ -0,0 +1,103 @@
+import asyncio
+import httpx
+import pytest
+import http_clients
+import llm
+from bench.stubs import REPLIES, groq_app
+from llm import SentenceChunker
+from llm_client import ResilientLLM
+
+def chunk(deltas, min_chars=40):
+    chunker = SentenceChunker(min_chars=min_chars)
+    segments = [segment for delta in deltas if (segment := chunker.feed(delta))]
+    rest = chunker.flush()
+    return segments + ([rest] if rest else [])
+
+def test_first_sentences_are_released_early():
+    deltas = ["Namaste hajur! ", "Yo kurta ekdum ", "popular chha. ", "Kun size ", "chaahiyo?"]
+    chunker = SentenceChunker(min_chars=20)
+    released = [chunker.feed(delta) for delta in deltas]
+    assert released[:3] == [None, None, "Namaste hajur! Yo kurta ekdum popular chha."]
+    assert released[3:] == [None, None]
+    assert chunker.flush() == "Kun size chaahiyo?"
+
+def test_at_most_two_segments():
+    text = "Ek. Dui. Tin. Char. Panch. " * 10
+    segments = chunk(list(text), min_chars=5)
+    assert len(segments) == 2
+    assert " ".join(segments).split() == text.split()
+
+@pytest.mark.parametrize("text", [
+    "Hajur, yo Rs. 1299 matra ho ra stock ma chha.",
+    "Dr. Sharma le order garnu bhayo ani No. 5 design ramro chha",
+])
+def test_abbreviations_do_not_end_a_sentence(text):
+    assert chunk([text], min_chars=5) == [text]
+
+def test_devanagari_danda_ends_a_sentence():
+    assert chunk(["नमस्ते हजुर। यो कुर्ता एकदम राम्रो छ। ", "साइज कुन चाहियो?"], min_chars=20) == [
+        "नमस्ते हजुर। यो कुर्ता एकदम राम्रो छ।", "साइज कुन चाहियो?"]
+
+def test_short_reply_is_sent_whole():
+    assert chunk(["Hajur!"]) == ["Hajur!"]
+
+@pytest.fixture
+def groq(monkeypatch):
+    """Chat completions go to the local Groq stub"""
+    def use(**options):
+        app = groq_app(**{"latency": 0.01, "jitter": 0.0, "token_delay": 0.0, **options})
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://groq.test")
+        monkeypatch.setitem(http_clients._clients, "groq", client)
+    return use
+
+def test_stream_from_stub_server(groq):
+    groq()
+
+    async def read():
+        deltas = [delta async for delta in llm.stream_chat_completion("key", "model", [{"role": "user", "content": "hi"}])]
+        return deltas, chunk(deltas)
+
+    deltas, segments = asyncio.run(read())
+    assert len(deltas) > 1
+    assert "".join(deltas).strip() in REPLIES
+    assert 1 <= len(segments) <= 2 and " ".join(segments) == "".join(deltas).strip()
+
+def test_stream_errors_carry_status_and_retry_after(groq, monkeypatch):
+    groq(error_rate=1.0)
+    monkeypatch.setattr("random.choice", lambda options: 429 if 429 in options else options[0])
+
+    async def read():
+        return [delta async for delta in llm.stream_chat_completion("key", "model", [])]
+
+    with pytest.raises(llm.LLMError) as error:
+        asyncio.run(read())
+    assert error.value.status_code == 429
+    assert error.value.retry_after == 1.0
+
+def test_failed_stream_keeps_only_complete_sentences():
+    chunker = SentenceChunker(min_chars=5)
+    assert chunker.feed("Namaste hajur! ") == "Namaste hajur!"
+    chunker.feed("M ra L size chha. Price Rs. 12")
+    assert chunker.flush_sentences() == "M ra L size chha."
+    chunker.feed("Kun size chaahiyo?")
+    assert chunker.flush_sentences() == "Kun size chaahiyo?"
+    chunker.feed("Rs. 12")
+    assert chunker.flush_sentences() is None
+
+def test_reply_is_not_cut_off_when_the_stream_fails(groq, server, monkeypatch):
+    # "Hajur, yo Kurta ekdum popular chha, aile offer ma Rs. 1299 matra! Kun size chaahiyo hajur?"
+    reply = REPLIES[1]
+    monkeypatch.setattr("bench.stubs.random.choice", lambda options: reply if options is REPLIES else options[0])
+    monkeypatch.setattr(server, "llm_client", ResilientLLM("key", "model", hedge_delay=5.0, slo_seconds=5.0))
+
+    async def segments(drop_after_words):
+        groq(drop_after_words=drop_after_words)
+        conversation = server.Conversation(conversation_id="conv-1", customer_id="customer-1")
+        return [segment async for segment in server.stream_ai_response("customer-1", "kurta kati?", conversation, [])]
+
+    first = "Hajur, yo Kurta ekdum popular chha, aile offer ma Rs. 1299 matra!"
+    assert asyncio.run(segments(0)) == [first, "Kun size chaahiyo hajur?"]
+    # Failed after "Kun size": the half sentence is not sent
+    assert asyncio.run(segments(14)) == [first]
+    # Failed before anything was sent: the busy reply instead of a fragment
+    assert asyncio.run(segments(3)) == [server.AI_BUSY_REPLY]